@@ -4,6 +4,7 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from db.connection import get_connection  # Custom function to get DB connection
 from passlib.context import CryptContext  # For password hashing
+from monitoring.metrics import span  # Stage timing for the auth lookup
 import jwt  # For creating and verifying JWT tokens
 import datetime  # For managing token expiry
 import os  # To access environment variables
@@ -109,12 +110,13 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
         raise HTTPException(status_code=401, detail="Invalid token")
     
     # Fetch the user from the database
-    conn = get_connection()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-    user = cur.fetchone()
-    cur.close()
-    conn.close()
+    with span("auth"):
+        conn = get_connection()
+        cur = conn.cursor(dictionary=True)
+        cur.execute("SELECT * FROM users WHERE id = %s", (user_id,))
+        user = cur.fetchone()
+        cur.close()
+        conn.close()
     
     # If user not found, raise error
     if not user:
@@ -0,0 +1,35 @@
+# Import FastAPI classes and dependencies
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool  # Catalog reads and vector deletes are blocking calls
+
+# Import authentication dependency and the document catalog
+from api.auth import get_current_user  # Dependency to get the currently authenticated user
+from ingestion.catalog import list_documents, delete_document  # Per-file chunk records kept at ingest
+
+# Initialize a router instance to define endpoints in this module
+router = APIRouter()
+
+# Largest page of documents returned at once
+MAX_PAGE_SIZE = 500
+
+# List the user's uploaded files, newest first, with their ingest status and chunk counts
+@router.get("/documents")
+async def get_documents(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    current_user: dict = Depends(get_current_user)
+):
+    documents = await run_in_threadpool(list_documents, current_user["id"], limit, offset)
+    return {"documents": documents, "limit": limit, "offset": offset}
+
+# Delete one file: its vectors (by the ids recorded at ingest), chunk text, lexical entries and upload records.
+# The path converter lets filenames from archives ("docs/a.txt") through.
+@router.delete("/documents/{filename:path}")
+async def remove_document(
+    filename: str,
+    current_user: dict = Depends(get_current_user)
+):
+    result = await run_in_threadpool(delete_document, current_user["id"], filename)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"message": "Document deleted successfully", **result}
@@ -0,0 +1,12 @@
+# Import FastAPI router and plain-text response class
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from monitoring.metrics import render_metrics  # Prometheus text rendering of all registered metrics
+
+# Create a new APIRouter instance for the metrics endpoint
+router = APIRouter()
+
+# Expose stage and request latency histograms for Prometheus to scrape
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,11 +1,230 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
 from typing import Dict
+from collections import deque
 from .auth import get_current_user
+import asyncio
+import logging
+import os
+import queue
+import time
 
 router = APIRouter()
 
-# In-memory store for user WebSocket connections (user_id -> WebSocket)
-active_connections: Dict[int, WebSocket] = {}
+# Max messages waiting on one socket before the oldest are dropped (slow client backpressure)
+NOTIFICATION_QUEUE_SIZE = int(os.getenv("NOTIFICATION_QUEUE_SIZE", "100"))
+# Max messages coalesced into a single websocket frame
+NOTIFICATION_MAX_BATCH = int(os.getenv("NOTIFICATION_MAX_BATCH", "20"))
+# Seconds a single send may take before the client is treated as stalled and disconnected
+NOTIFICATION_SEND_TIMEOUT = float(os.getenv("NOTIFICATION_SEND_TIMEOUT", "5"))
+# Messages kept per user while they are offline, and how long (seconds) they stay replayable
+NOTIFICATION_OFFLINE_BUFFER = int(os.getenv("NOTIFICATION_OFFLINE_BUFFER", "50"))
+NOTIFICATION_OFFLINE_TTL = int(os.getenv("NOTIFICATION_OFFLINE_TTL", "3600"))
+# How often (seconds) expired offline messages, and users left with none, are dropped
+NOTIFICATION_SWEEP_SECONDS = float(os.getenv("NOTIFICATION_SWEEP_SECONDS", "60"))
+
+
+class _Connection:
+    """
+    One connected websocket with its own bounded outbox and writer task.
+    Only touched from the event loop thread.
+    """
+
+    def __init__(self, dispatcher, user_id: int, websocket: WebSocket):
+        self.dispatcher = dispatcher
+        self.user_id = user_id
+        self.websocket = websocket
+        self.outbox = asyncio.Queue(maxsize=NOTIFICATION_QUEUE_SIZE)
+        self.dropped = 0
+        self.closed = False
+        # True while the writer waits for messages, i.e. nothing is being sent
+        self.idle = True
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, item):
+        if self.outbox.full():
+            # Backpressure: a slow client loses its oldest messages instead of growing memory
+            self.outbox.get_nowait()
+            self.dropped += 1
+            logging.warning(f"[NOTIFY] Outbox full for user {self.user_id}, dropped oldest message ({self.dropped} total)")
+        self.outbox.put_nowait(item)
+
+    def drain(self):
+        items = []
+        while not self.outbox.empty():
+            items.append(self.outbox.get_nowait())
+        return items
+
+    async def _write_loop(self):
+        batch = []
+        try:
+            while True:
+                self.idle = True
+                batch = [await self.outbox.get()]
+                self.idle = False
+                # Coalesce everything already queued into one frame
+                while len(batch) < NOTIFICATION_MAX_BATCH and not self.outbox.empty():
+                    batch.append(self.outbox.get_nowait())
+                text = "\n".join(message for _, message in batch)
+                await asyncio.wait_for(self.websocket.send_text(text), NOTIFICATION_SEND_TIMEOUT)
+                batch = []
+        except asyncio.CancelledError:
+            # Normal disconnect: keep whatever was in flight for replay
+            self.dispatcher._buffer_offline(self.user_id, batch)
+            raise
+        except Exception as e:
+            logging.warning(f"[NOTIFY] Send to user {self.user_id} failed, buffering for reconnect: {e}")
+            self.dispatcher._buffer_offline(self.user_id, batch)
+            await self.dispatcher.disconnect(self.user_id, self)
+            try:
+                await self.websocket.close(code=1011)
+            except Exception:
+                pass
+
+
+class NotificationDispatcher:
+    """
+    Delivers notifications to websocket clients from any thread.
+
+    Producers (background tasks, threadpool workers) push into a thread-safe
+    inbox; a pump task on the event loop routes messages to per-socket
+    outboxes that are flushed in batches. Messages for users without an open
+    socket are held in a bounded offline buffer and replayed when they
+    reconnect; the pump drops them after NOTIFICATION_OFFLINE_TTL.
+    Each worker process has its own dispatcher and there is no relay between
+    them: a user only receives messages sent by the process holding their
+    socket, so notifications need the API to run as a single worker process.
+    """
+
+    def __init__(self):
+        self._inbox = queue.SimpleQueue()
+        self._loop = None
+        self._wakeup = None
+        self._pump_task = None
+        self._connections: Dict[int, _Connection] = {}
+        self._offline: Dict[int, deque] = {}
+
+    def start(self):
+        """Bind to the running event loop. Safe to call more than once."""
+        if self._pump_task is not None and not self._pump_task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._pump_task = self._loop.create_task(self._pump())
+        # Deliver anything queued before the loop was available
+        self._wakeup.set()
+
+    async def stop(self, grace=NOTIFICATION_SEND_TIMEOUT):
+        """Stop the pump, give open sockets up to grace seconds to send what is queued, then close them."""
+        task, self._pump_task = self._pump_task, None
+        if task is not None:
+            task.cancel()
+            # Wait for the cancellation, so the task is not destroyed while still pending
+            await asyncio.gather(task, return_exceptions=True)
+        # Messages sent after the pump's last pass are still in the inbox
+        self._route_inbox()
+        deadline = time.monotonic() + grace
+        while time.monotonic() < deadline and any(
+            not (connection.outbox.empty() and connection.idle) for connection in self._connections.values()
+        ):
+            await asyncio.sleep(0.01)
+        for connection in list(self._connections.values()):
+            await self.disconnect(connection.user_id, connection)
+
+    def send(self, user_id: int, message: str):
+        """Thread-safe: queue a message for a user and wake the pump."""
+        self._inbox.put((user_id, (time.time(), message)))
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def connect(self, user_id: int, websocket: WebSocket) -> _Connection:
+        previous = self._connections.get(user_id)
+        if previous is not None:
+            # One socket per user: the newest connection takes over
+            await self.disconnect(user_id, previous)
+        connection = _Connection(self, user_id, websocket)
+        self._connections[user_id] = connection
+
+        # Replay messages that arrived while the user was offline
+        buffered = self._offline.pop(user_id, None)
+        if buffered:
+            cutoff = time.time() - NOTIFICATION_OFFLINE_TTL
+            for item in buffered:
+                if item[0] >= cutoff:
+                    connection.enqueue(item)
+        return connection
+
+    async def disconnect(self, user_id: int, connection: _Connection):
+        if connection.closed:
+            return
+        connection.closed = True
+        if self._connections.get(user_id) is connection:
+            del self._connections[user_id]
+        if connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+            try:
+                await connection.writer
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._buffer_offline(user_id, connection.drain())
+
+    def stats(self) -> dict:
+        self._evict_offline()
+        return {
+            "connected_users": len(self._connections),
+            "queued": {user_id: c.outbox.qsize() for user_id, c in self._connections.items()},
+            "dropped": {user_id: c.dropped for user_id, c in self._connections.items() if c.dropped},
+            "offline_buffered": {user_id: len(items) for user_id, items in self._offline.items()},
+        }
+
+    def _buffer_offline(self, user_id: int, items):
+        if not items:
+            return
+        buffered = self._offline.setdefault(user_id, deque(maxlen=NOTIFICATION_OFFLINE_BUFFER))
+        buffered.extend(items)
+
+    def _evict_offline(self):
+        """Drop offline messages past NOTIFICATION_OFFLINE_TTL, and the users left with none."""
+        cutoff = time.time() - NOTIFICATION_OFFLINE_TTL
+        for user_id, items in list(self._offline.items()):
+            fresh = [item for item in items if item[0] >= cutoff]
+            if not fresh:
+                del self._offline[user_id]
+            elif len(fresh) < len(items):
+                self._offline[user_id] = deque(fresh, maxlen=NOTIFICATION_OFFLINE_BUFFER)
+
+    def _route(self, user_id: int, item):
+        connection = self._connections.get(user_id)
+        if connection is not None and not connection.closed:
+            connection.enqueue(item)
+        else:
+            self._buffer_offline(user_id, [item])
+
+    def _route_inbox(self):
+        while True:
+            try:
+                user_id, item = self._inbox.get_nowait()
+            except queue.Empty:
+                return
+            self._route(user_id, item)
+
+    async def _pump(self):
+        next_sweep = time.monotonic() + NOTIFICATION_SWEEP_SECONDS
+        while True:
+            try:
+                # Wake up for new messages, or at least once per sweep interval
+                await asyncio.wait_for(self._wakeup.wait(), NOTIFICATION_SWEEP_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._route_inbox()
+            if time.monotonic() >= next_sweep:
+                self._evict_offline()
+                next_sweep = time.monotonic() + NOTIFICATION_SWEEP_SECONDS
+
+
+# Shared dispatcher used by the websocket endpoint and all producers
+dispatcher = NotificationDispatcher()
 
 # WebSocket endpoint for notifications
 def get_user_id_from_query(websocket: WebSocket):
@@ -15,6 +234,8 @@ def get_user_id_from_query(websocket: WebSocket):
         return int(user_id)
     return None
 
+# Notifications are delivered by the worker process that holds the socket and are not relayed
+# between processes: run the API as a single worker (uvicorn without --workers) for them to arrive
 @router.websocket("/ws/notifications")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
@@ -22,20 +243,20 @@ async def websocket_endpoint(websocket: WebSocket):
     if user_id is None:
         await websocket.close(code=1008)
         return
-    active_connections[user_id] = websocket
+    dispatcher.start()
+    connection = await dispatcher.connect(user_id, websocket)
     try:
         while True:
             # Keep the connection alive; receive messages if needed
             await websocket.receive_text()
     except WebSocketDisconnect:
-        # Remove connection on disconnect
-        if user_id in active_connections:
-            del active_connections[user_id]
+        pass
+    finally:
+        # Remove connection on disconnect; undelivered messages stay buffered
+        await dispatcher.disconnect(user_id, connection)
 
 # Function to send notification to a user (call from ingestion pipeline, etc.)
+# Safe to call from any thread, including BackgroundTasks workers with no event loop.
 def send_notification(user_id: int, message: str):
-    websocket = active_connections.get(user_id)
-    if websocket:
-        import asyncio
-        asyncio.create_task(websocket.send_text(message))
-    # In production, consider fallback to email/SMS if user is not connected 
\ No newline at end of file
+    dispatcher.send(user_id, message)
+    # In production, consider fallback to email/SMS if user is not connected
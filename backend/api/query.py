@@ -1,14 +1,34 @@
 # Import necessary modules from FastAPI and Pydantic
-from fastapi import APIRouter, Depends  # For routing and dependency injection
+from fastapi import APIRouter, Depends, HTTPException  # For routing and dependency injection
+from fastapi.concurrency import run_in_threadpool  # Runs blocking handlers off the event loop
+from typing import List, Optional
+from datetime import datetime
 from pydantic import BaseModel  # For request body validation
-from api.auth import get_current_user  # Function to get the currently authenticated user
-from query.handler import handle_query  # Function to process the query with LLM and vector store
+from api.rate_limit import rate_limit, refund, spend  # Authenticates the user and applies their per-endpoint rate limit
+from query.handler import handle_query, handle_query_batch, BATCH_MAX_QUESTIONS  # Query processing with LLM and vector store
+from retrieval.scope import build_scope  # Restricts retrieval to selected files, types and upload dates
+from upstream.singleflight import SingleFlight  # Shares one run between identical concurrent requests
 
 # Create a new APIRouter instance to group query-related endpoints
 router = APIRouter()
 
+# Identical queries in flight (double-clicks, client retries) get the answer of the one already running
+_query_flight = SingleFlight("query")
+
+# Optional scope shared by single and batch queries; omitted fields do not restrict the search
+class ScopedRequest(BaseModel):
+    files: Optional[List[str]] = None  # Only these filenames
+    extensions: Optional[List[str]] = None  # Only these file types, e.g. [".pdf", "md"]
+    uploaded_after: Optional[datetime] = None  # Only files uploaded at or after this time (UTC if no offset)
+    uploaded_before: Optional[datetime] = None  # Only files uploaded at or before this time
+
+    def scope(self):
+        if self.uploaded_after and self.uploaded_before and self.uploaded_after > self.uploaded_before:
+            raise HTTPException(status_code=400, detail="uploaded_after must not be later than uploaded_before")
+        return build_scope(self.files, self.extensions, self.uploaded_after, self.uploaded_before)
+
 # Define a request body schema using Pydantic
-class QueryRequest(BaseModel):
+class QueryRequest(ScopedRequest):
     query: str  # The input query string from the user
     conversation_id: str = None  # Optional conversation ID for context
 
@@ -16,10 +36,40 @@ class QueryRequest(BaseModel):
 @router.post("/query")
 async def query_endpoint(
     request: QueryRequest,  # Automatically parses and validates the incoming JSON body
-    user=Depends(get_current_user)  # Injects the authenticated user using FastAPI's dependency system
+    user=Depends(rate_limit("query"))  # Injects the authenticated user (429 with Retry-After when over the limit)
 ):
-    # Call the handler function with the query, user ID, and conversation ID
-    answer = handle_query(request.query, user["id"], request.conversation_id)
+    # Call the handler function with the query, user ID, conversation ID and optional scope.
+    # It blocks, so it runs on the threadpool; the same user sending the same query, conversation
+    # and scope while it runs joins it, and the answer is generated and saved to history once.
+    scope = request.scope()
+    key = (user["id"], request.query, request.conversation_id, repr(sorted(scope.items())) if scope else None)
+    answer = await _query_flight.run(key, run_in_threadpool, handle_query, request.query, user["id"], request.conversation_id, scope)
 
     # Return the answer in a JSON response
     return {"answer": answer}
+
+# Request body for batch evaluation runs
+class BatchQueryRequest(ScopedRequest):
+    questions: List[str]  # Answered independently, returned in the same order
+    save_history: bool = False  # Evaluation runs usually should not clutter search history
+
+# Answer many questions in one request with shared setup and batched embedding
+@router.post("/query/batch")
+async def query_batch_endpoint(
+    request: BatchQueryRequest,
+    user=Depends(rate_limit("query_batch"))  # One token per batch request
+):
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="No questions provided")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"Too many questions. Max: {BATCH_MAX_QUESTIONS}, got: {len(request.questions)}")
+    # Each question costs what a single /query does; a batch bigger than the burst empties the bucket and leaves it in debt
+    try:
+        spend("query", user["id"], len(request.questions))
+    except HTTPException:
+        # The batch is not run, so it does not use up one of the user's batch requests either
+        refund("query_batch", user["id"])
+        raise
+
+    # The batch takes a while; run it on the threadpool so the event loop keeps serving other requests
+    return await run_in_threadpool(handle_query_batch, request.questions, user["id"], request.save_history, request.scope())
@@ -0,0 +1,191 @@
+# Per-user token-bucket rate limiting for the expensive endpoints
+from fastapi import Depends, HTTPException
+from api.auth import get_current_user
+from monitoring.metrics import counter
+import logging
+import math
+import os
+import threading
+import time
+
+# Optional shared backend so limits hold across workers/instances
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Sustained requests per minute and burst size, per user and endpoint
+RATE_LIMITS = {
+    "query": (
+        float(os.getenv("RATE_LIMIT_QUERY_PER_MINUTE", "30")),
+        int(os.getenv("RATE_LIMIT_QUERY_BURST", "10")),
+    ),
+    # Per batch request; every question in it is also charged to the "query" bucket
+    "query_batch": (
+        float(os.getenv("RATE_LIMIT_QUERY_BATCH_PER_MINUTE", "2")),
+        int(os.getenv("RATE_LIMIT_QUERY_BATCH_BURST", "2")),
+    ),
+    "upload": (
+        float(os.getenv("RATE_LIMIT_UPLOAD_PER_MINUTE", "10")),
+        int(os.getenv("RATE_LIMIT_UPLOAD_BURST", "5")),
+    ),
+    # Per bulk upload; every accepted file or archive entry is also charged to the "upload" bucket
+    "upload_bulk": (
+        float(os.getenv("RATE_LIMIT_UPLOAD_BULK_PER_MINUTE", "2")),
+        int(os.getenv("RATE_LIMIT_UPLOAD_BULK_BURST", "2")),
+    ),
+}
+# e.g. redis://localhost:6379/0; unset keeps buckets in this process
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+
+RATE_LIMITED = counter("rag_rate_limited_total", "Requests rejected with 429 by the rate limiter", ["endpoint"])
+
+
+class MemoryTokenBuckets:
+    """Token buckets held in this process, keyed by "<endpoint>:<user_id>"."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def take(self, key, rate_per_sec, burst, cost=1):
+        """
+        Spend cost tokens. Returns (allowed, seconds until enough tokens refill).
+        A cost above burst is allowed from a full bucket and leaves it in debt.
+        """
+        now = time.monotonic()
+        needed = min(cost, burst)
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (burst, now, rate_per_sec))
+            tokens = min(burst, tokens + (now - updated) * rate_per_sec)
+            allowed = tokens >= needed
+            if allowed:
+                tokens -= cost
+            # Each bucket keeps its own rate, so pruning never drops a slow endpoint's bucket early
+            self._buckets[key] = (tokens, now, rate_per_sec)
+            self._calls += 1
+            if self._calls % 10000 == 0:
+                self._prune(now)
+        return allowed, 0.0 if allowed else (needed - tokens) / rate_per_sec
+
+    def refund(self, key, burst, cost=1):
+        """Give back cost tokens spent on a request that was then refused elsewhere."""
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated, rate_per_sec = self._buckets[key]
+                self._buckets[key] = (min(burst, tokens + cost), updated, rate_per_sec)
+
+    def _prune(self, now):
+        # Drop buckets that would have refilled completely anyway (idle users, debts paid off)
+        stale = [key for key, (tokens, updated, rate_per_sec) in self._buckets.items()
+                 if now - updated > max(3600, -tokens / rate_per_sec)]
+        for key in stale:
+            del self._buckets[key]
+
+
+# Refill and spend atomically in Redis; returns {allowed, retry_after_ms}
+_REDIS_TAKE = """
+local rate, burst, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+local needed = math.min(cost, burst)
+tokens = math.min(burst, tokens + (now - updated) * rate)
+local allowed = 0
+if tokens >= needed then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+-- Keep the key until it has refilled, so a debt is not forgotten
+redis.call('EXPIRE', KEYS[1], math.ceil((burst - tokens) / rate) + 60)
+if allowed == 1 then return {1, 0} end
+return {0, math.ceil((needed - tokens) / rate * 1000)}
+"""
+
+
+# Give tokens back to a bucket that still exists, capped at the burst
+_REDIS_REFUND = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens then
+    redis.call('HSET', KEYS[1], 'tokens', math.min(tonumber(ARGV[1]), tokens + tonumber(ARGV[2])))
+end
+return 0
+"""
+
+
+class RedisTokenBuckets:
+    """Token buckets shared by every worker through Redis; falls back to local buckets if Redis is down."""
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(_REDIS_TAKE)
+        self.refund_script = self.client.register_script(_REDIS_REFUND)
+        self.fallback = MemoryTokenBuckets()
+
+    def take(self, key, rate_per_sec, burst, cost=1):
+        try:
+            allowed, retry_after_ms = self.script(keys=[f"ratelimit:{key}"], args=[rate_per_sec, burst, cost, time.time()])
+            return bool(allowed), retry_after_ms / 1000
+        except Exception as e:
+            logging.warning(f"[RATE LIMIT] Redis unavailable, using in-process buckets: {e}")
+            return self.fallback.take(key, rate_per_sec, burst, cost)
+
+    def refund(self, key, burst, cost=1):
+        try:
+            self.refund_script(keys=[f"ratelimit:{key}"], args=[burst, cost])
+        except Exception as e:
+            logging.warning(f"[RATE LIMIT] Redis unavailable, refunding in-process buckets: {e}")
+            self.fallback.refund(key, burst, cost)
+
+
+def _create_buckets():
+    if RATE_LIMIT_REDIS_URL:
+        if redis is None:
+            logging.warning("[RATE LIMIT] RATE_LIMIT_REDIS_URL is set but the redis package is not installed; limits are per process")
+        else:
+            return RedisTokenBuckets(RATE_LIMIT_REDIS_URL)
+    return MemoryTokenBuckets()
+
+
+buckets = _create_buckets()
+
+
+def spend(endpoint, user_id, cost=1):
+    """
+    Spend cost tokens from the user's bucket for endpoint, raising 429 with
+    Retry-After when it cannot pay. For requests whose cost is only known
+    from the body (questions in a batch, files in an upload).
+    """
+    per_minute, burst = RATE_LIMITS[endpoint]
+    if per_minute <= 0 or cost <= 0:
+        return
+    allowed, retry_after = buckets.take(f"{endpoint}:{user_id}", per_minute / 60.0, burst, cost)
+    if not allowed:
+        RATE_LIMITED.inc(endpoint=endpoint)
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many {endpoint} requests. Please retry in {math.ceil(retry_after)} seconds.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+def refund(endpoint, user_id, cost=1):
+    """Give back tokens spent on a request that was refused by a later check (see spend)."""
+    per_minute, burst = RATE_LIMITS[endpoint]
+    if per_minute <= 0 or cost <= 0:
+        return
+    buckets.refund(f"{endpoint}:{user_id}", burst, cost)
+
+
+def rate_limit(endpoint):
+    """
+    Dependency that authenticates the user and spends one token from their bucket
+    for this endpoint, answering 429 with Retry-After when it is empty.
+    """
+    def dependency(user=Depends(get_current_user)):
+        spend(endpoint, user["id"])
+        return user
+
+    return dependency
@@ -1,13 +1,20 @@
 # FastAPI and other module imports
 from fastapi import APIRouter, File, UploadFile, Depends, BackgroundTasks, HTTPException, Form
-from api.auth import get_current_user                      # Dependency to get current authenticated user
-from db.models import save_file_metadata, add_message_objects_to_conversation  # Function to save metadata to DB
+from api.rate_limit import rate_limit, refund, spend               # Dependency: authenticated user, rate limited per endpoint
+from fastapi.concurrency import run_in_threadpool          # Runs blocking archive listing off the event loop
+from db.models import save_file_metadata, save_file_metadata_bulk, add_message_objects_to_conversation  # Functions to save metadata to DB
 from ingestion.pipeline import process_file                # Function that processes the uploaded file
+from ingestion.archive import ARCHIVE_SUFFIXES, is_archive, clean_entry_name, list_entries, read_entries  # Entry-by-entry archive reading
 from api.notifications import send_notification            # Function to notify the user
+from concurrent.futures import ThreadPoolExecutor          # Concurrent ingestion of bulk upload entries
+from typing import List
 import datetime                                             # Used for timestamping
 import logging                                              # For logging info, warnings, errors
 import mimetypes                                            # (Not used here, but typically for MIME type detection)
 import os                                                   # For file extension handling
+import shutil                                               # Removes a bulk upload's spool directory
+import tempfile                                             # Spool directory for bulk uploads
+import threading                                            # Bounds how far bulk reading runs ahead of ingestion
 import uuid                                                 # For generating unique IDs
 
 # Initialize router instance for API route grouping
@@ -86,6 +93,14 @@ SUPPORTED_EXTENSIONS = {
 # Maximum allowed file size: 50MB
 MAX_FILE_SIZE = 50 * 1024 * 1024
 
+# Bulk uploads: max files (including archive entries) and total uncompressed size per request
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "1000"))
+BULK_MAX_TOTAL_BYTES = int(os.getenv("BULK_MAX_TOTAL_MB", "500")) * 1024 * 1024
+# Files of one bulk upload ingested at the same time; entries are read at most this many ahead
+BULK_INGEST_PARALLELISM = int(os.getenv("BULK_INGEST_PARALLELISM", "2"))
+# Size of the pieces uploads are spooled to disk in
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
 def validate_file(file: UploadFile) -> dict:
     """
     Validate the uploaded file: check if file exists, check extension support,
@@ -122,7 +137,7 @@ def validate_file(file: UploadFile) -> dict:
 @router.post("/upload")
 async def upload_file(
     background_tasks: BackgroundTasks,
-    user=Depends(get_current_user),
+    user=Depends(rate_limit("upload")),
     file: UploadFile = File(...),
     conversation_id: str = Form(None)
 ):
@@ -190,7 +205,7 @@ async def upload_file(
         def pipeline_and_notify():
             try:
                 # Process the file
-                process_file(contents, file_info['filename'], user["id"])
+                process_file(contents, file_info['filename'], user["id"], uploaded_at=uploaded_at)
 
                 # Update conversation with success message if conversation_id provided
                 if conversation_id and upload_message_id:
@@ -265,6 +280,237 @@ async def upload_file(
         logging.error(f"[UPLOAD] Unexpected error: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def _skip_reason(filename, size):
+    """Why an entry of a bulk upload is not ingested, or None to accept it."""
+    extension = os.path.splitext(filename.lower())[1]
+    if extension not in SUPPORTED_EXTENSIONS:
+        return f"Unsupported file type: {extension or '(none)'}"
+    if size == 0:
+        return "File is empty"
+    if size > MAX_FILE_SIZE:
+        return f"File too large. Max: {MAX_FILE_SIZE // (1024*1024)}MB"
+    return None
+
+async def _spool(upload: UploadFile, path: str, limit: int) -> int:
+    """Copy an upload to disk piece by piece; stops (returning limit + 1) once it exceeds limit bytes."""
+    size = 0
+    with open(path, "wb") as out:
+        while True:
+            piece = await upload.read(SPOOL_CHUNK_SIZE)
+            if not piece:
+                return size
+            size += len(piece)
+            if size > limit:
+                return limit + 1
+            out.write(piece)
+
+def _read_accepted(sources):
+    """Yield (filename, bytes or None) for every accepted file, one at a time, in upload order."""
+    for path, upload_name, entries in sources:
+        if entries is None:
+            with open(path, "rb") as f:
+                yield upload_name, f.read()
+            continue
+        for entry_name, contents in read_entries(path, upload_name, list(entries), MAX_FILE_SIZE):
+            yield entries[entry_name], contents
+
+@router.post("/upload/bulk")
+async def upload_bulk(
+    background_tasks: BackgroundTasks,
+    user=Depends(rate_limit("upload_bulk")),
+    files: List[UploadFile] = File(...),
+    conversation_id: str = Form(None)
+):
+    """
+    Upload many files, or .zip / .tar / .tar.gz archives of them, in one request.
+    Entries are filtered by SUPPORTED_EXTENSIONS, their metadata is saved in one
+    statement, and everything is ingested by a single background job that reads
+    archive entries one at a time.
+    """
+    job_dir = tempfile.mkdtemp(prefix="rag-bulk-")
+    scheduled = False
+    try:
+        logging.info(f"[UPLOAD] Bulk upload of {len(files)} file(s) for user {user['id']}")
+        # (spooled path, uploaded filename, {entry name: stored filename} for archives or None)
+        sources = []
+        accepted, skipped = [], []
+        seen = set()
+        total_bytes = 0
+
+        def accept(filename, size):
+            nonlocal total_bytes
+            reason = _skip_reason(filename, size)
+            if reason is None and filename in seen:
+                reason = "Duplicate filename in this upload"
+            if reason is None and len(accepted) >= BULK_MAX_FILES:
+                reason = f"More than {BULK_MAX_FILES} files in one upload"
+            if reason is None and total_bytes + size > BULK_MAX_TOTAL_BYTES:
+                reason = f"Upload exceeds {BULK_MAX_TOTAL_BYTES // (1024*1024)}MB in total"
+            if reason:
+                skipped.append({"filename": filename, "reason": reason})
+                return False
+            seen.add(filename)
+            total_bytes += size
+            accepted.append({"filename": filename, "size_bytes": size})
+            return True
+
+        for index, upload in enumerate(files):
+            upload_name = upload.filename or f"file-{index}"
+            path = os.path.join(job_dir, str(index))
+            if is_archive(upload_name):
+                # Spool the archive to disk, then list its entries without decompressing them
+                if await _spool(upload, path, BULK_MAX_TOTAL_BYTES) > BULK_MAX_TOTAL_BYTES:
+                    skipped.append({"filename": upload_name, "reason": "Archive too large"})
+                    continue
+                try:
+                    entries = await run_in_threadpool(list_entries, path, upload_name)
+                except Exception as e:
+                    skipped.append({"filename": upload_name, "reason": f"Unreadable archive: {e}"})
+                    continue
+                wanted = {}
+                for entry_name, size in entries:
+                    filename = clean_entry_name(entry_name)
+                    if filename is None:
+                        continue
+                    if accept(filename, size):
+                        wanted[entry_name] = filename
+                if wanted:
+                    sources.append((path, upload_name, wanted))
+                continue
+
+            # Plain file: check the type before reading it at all
+            reason = _skip_reason(upload_name, 1)
+            if reason:
+                skipped.append({"filename": upload_name, "reason": reason})
+                continue
+            size = await _spool(upload, path, MAX_FILE_SIZE)
+            if accept(upload_name, size):
+                sources.append((path, upload_name, None))
+
+        if not accepted:
+            raise HTTPException(status_code=400, detail={"message": "No supported files in this upload", "skipped": skipped})
+        # Every accepted file costs what a single /upload does; the spool directory is removed on 429
+        try:
+            spend("upload", user["id"], len(accepted))
+        except HTTPException:
+            # Nothing is ingested, so the bulk request token goes back too
+            refund("upload_bulk", user["id"])
+            raise
+
+        # One multi-row INSERT for every accepted file
+        uploaded_at = datetime.datetime.now(datetime.timezone.utc)
+        save_file_metadata_bulk([(user["id"], item["filename"], uploaded_at) for item in accepted])
+        logging.info(f"[UPLOAD] Bulk metadata saved for {len(accepted)} file(s), {len(skipped)} skipped")
+
+        processing_id = str(uuid.uuid4())
+        upload_message_id = None
+        if conversation_id:
+            try:
+                upload_message = {
+                    "id": str(uuid.uuid4()),
+                    "text": f"📦 **Bulk Upload**\n\n**Files:** {len(accepted)}\n**Size:** {total_bytes // 1024:.1f} KB\n**Status:** Processing...\n\nI'm analyzing your documents and creating embeddings. This may take a few moments.",
+                    "isUser": False,
+                    "timestamp": uploaded_at.isoformat(),
+                    "type": "upload_card",
+                    "metadata": {
+                        "filenames": [item["filename"] for item in accepted],
+                        "file_count": len(accepted),
+                        "file_size": total_bytes,
+                        "processing_id": processing_id,
+                        "status": "processing"
+                    }
+                }
+                add_message_objects_to_conversation(conversation_id, [upload_message])
+                upload_message_id = upload_message["id"]
+            except Exception as e:
+                logging.warning(f"[UPLOAD] Failed to add bulk upload message to conversation: {e}")
+
+        # One job for the whole upload: entries are read (and decompressed) in order while
+        # up to BULK_INGEST_PARALLELISM earlier entries are being parsed and embedded
+        def ingest_all():
+            failed, chunks = [], 0
+            slots = threading.BoundedSemaphore(BULK_INGEST_PARALLELISM * 2)
+            try:
+                with ThreadPoolExecutor(BULK_INGEST_PARALLELISM, thread_name_prefix="bulk-ingest") as pool:
+                    futures = []
+                    for filename, contents in _read_accepted(sources):
+                        if contents is None:
+                            failed.append({"filename": filename, "error": "File too large once extracted"})
+                            continue
+                        slots.acquire()
+                        future = pool.submit(process_file, contents, filename, user["id"], False, uploaded_at)
+                        future.add_done_callback(lambda _: slots.release())
+                        futures.append((filename, future))
+                    for filename, future in futures:
+                        try:
+                            count = future.result()
+                        except Exception as e:
+                            failed.append({"filename": filename, "error": str(e)})
+                            continue
+                        if not count:
+                            # Parsed without error but nothing to search (empty, scanned or unreadable content)
+                            failed.append({"filename": filename, "error": "No content could be extracted"})
+                        chunks += count
+            except Exception as e:
+                logging.error(f"[UPLOAD] Bulk processing failed: {e}")
+                failed.append({"filename": None, "error": str(e)})
+            finally:
+                shutil.rmtree(job_dir, ignore_errors=True)
+
+            succeeded = len(accepted) - len([item for item in failed if item["filename"]])
+            logging.info(f"[UPLOAD] Bulk upload {processing_id}: {succeeded} processed, {len(failed)} failed, {chunks} chunks")
+            if conversation_id and upload_message_id:
+                try:
+                    status = "completed" if not failed else "failed" if not succeeded else "partial"
+                    failures = "".join(f"\n- {item['filename']}: {item['error']}" for item in failed[:20] if item["filename"])
+                    result_message = {
+                        "id": str(uuid.uuid4()),
+                        "text": f"{'✅' if not failed else '⚠️'} **Bulk Upload Complete**\n\n**{succeeded}** of **{len(accepted)}** files were processed and embedded into the knowledge base." + (f"\n\n**Failed:**{failures}" if failures else ""),
+                        "isUser": False,
+                        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                        "type": "upload_success_card" if not failed else "upload_error_card",
+                        "metadata": {
+                            "processing_id": processing_id,
+                            "status": status,
+                            "file_count": len(accepted),
+                            "failed": failed
+                        }
+                    }
+                    add_message_objects_to_conversation(conversation_id, [result_message])
+                except Exception as e:
+                    logging.error(f"[UPLOAD] Failed to add bulk result message to conversation: {e}")
+            message = f"Your bulk upload has been processed: {succeeded} of {len(accepted)} files are ready for queries."
+            if failed:
+                message += f" {len(failed)} failed."
+            send_notification(user["id"], message)
+
+        background_tasks.add_task(ingest_all)
+        scheduled = True
+
+        return {
+            "message": f"{len(accepted)} file(s) received, processing started.",
+            "processing_id": processing_id,
+            "upload_message_id": upload_message_id,
+            "accepted": accepted,
+            "skipped": skipped,
+            "total_size_bytes": total_bytes,
+            "uploaded_at": uploaded_at.isoformat()
+        }
+
+    # Handle known errors
+    except HTTPException:
+        raise
+
+    # Catch-all for unexpected issues
+    except Exception as e:
+        logging.error(f"[UPLOAD] Unexpected error in bulk upload: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+    finally:
+        # The background job owns the spool directory once it is scheduled
+        if not scheduled:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
 @router.get("/upload/supported-types")
 async def get_supported_file_types():
     """
@@ -274,6 +520,7 @@ async def get_supported_file_types():
     return {
         "supported_extensions": list(SUPPORTED_EXTENSIONS.keys()),
         "max_file_size_mb": MAX_FILE_SIZE // (1024 * 1024),
+        "bulk_archive_formats": list(ARCHIVE_SUFFIXES),
         "file_types": {
             "text_files": [ext for ext in SUPPORTED_EXTENSIONS if ext in ['.txt', '.md', '.csv', '.json', '.xml', '.html', '.htm']],
             "office_documents": [ext for ext in SUPPORTED_EXTENSIONS if ext in ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx']],
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+BM25 index build speed, size on disk and query latency.
+
+Indexes a synthetic corpus file by file (the way process_file does), then
+times identifier lookups and natural-language queries, and reports how
+often the chunk holding an exact identifier is ranked first.
+
+Run from the backend directory:
+    python -m bench.bench_bm25 --docs 500 --words-per-doc 2000
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from bench.harness import make_corpus, percentiles
+from retrieval.bm25 import LexicalIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--words-per-doc", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=300)
+    args = parser.parse_args()
+
+    from ingestion.pipeline import chunk_text
+
+    directory = tempfile.mkdtemp(prefix="ragbench-bm25-")
+    try:
+        corpus = make_corpus(args.docs, args.words_per_doc)
+        index = LexicalIndex(directory)
+        chunk_count = 0
+        raw_bytes = 0
+        start = time.perf_counter()
+        identifiers = []
+        for filename, body in corpus:
+            chunks = chunk_text(body.decode("utf-8"))
+            ids = [f"1_{filename}_{i}" for i in range(len(chunks))]
+            index.add_documents(ids, chunks, [{"filename": filename, "chunk_id": i} for i in range(len(chunks))])
+            chunk_count += len(chunks)
+            raw_bytes += sum(len(chunk.encode("utf-8")) for chunk in chunks)
+            for chunk_id, chunk in zip(ids, chunks):
+                identifiers.extend((word, chunk_id) for word in chunk.split() if word.startswith("SKU"))
+        build = time.perf_counter() - start
+        size = index.size_on_disk()
+        print(f"Indexed {chunk_count} chunks from {args.docs} files in {build:.2f}s "
+              f"({chunk_count / build:.0f} chunks/s, {len(index.segments)} segments)")
+        print(f"Index size {size / 1024:.0f} KB for {raw_bytes / 1024:.0f} KB of chunk text ({size / max(1, raw_bytes):.2f}x)")
+
+        step = max(1, len(identifiers) // args.queries)
+        sample = identifiers[::step][:args.queries]
+        latencies, hits = [], 0
+        for identifier, chunk_id in sample:
+            start = time.perf_counter()
+            results = index.search(identifier, top_k=5)
+            latencies.append(time.perf_counter() - start)
+            hits += any(result["id"] == chunk_id for result in results)
+        stats = percentiles(latencies)
+        print(f"Identifier queries: mean {stats['mean']:.2f} ms, p99 {stats['p99']:.2f} ms, target chunk in top 5: {hits / len(sample):.1%}")
+
+        latencies = []
+        for identifier, _ in sample:
+            start = time.perf_counter()
+            index.search("customer refund policy for warehouse shipment", top_k=5)
+            latencies.append(time.perf_counter() - start)
+        stats = percentiles(latencies)
+        print(f"Multi-term queries: mean {stats['mean']:.2f} ms, p99 {stats['p99']:.2f} ms")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
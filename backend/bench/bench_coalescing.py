@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Identical concurrent /query requests with and without coalescing.
+
+Sends --questions distinct questions, each as a burst of --duplicates
+identical requests spread over --jitter-ms (a double-click or a client
+retry), all bursts at once, first with COALESCING_ENABLED off and then on.
+Reports request latency, how many answers were generated (from the stage
+spans), how many embedding calls reached the model, and the
+coalesced-request counters. The query embedding cache is cleared before each run.
+
+With --across-users each duplicate comes from a different user (who
+uploaded the same corpus), so answers are not shared but the embedding of
+the common question text still is.
+
+Run from the backend directory:
+    python -m bench.bench_coalescing --questions 20 --duplicates 4
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from bench.harness import install_fakes, make_corpus, make_queries, percentiles
+
+
+async def bench(args):
+    from monitoring.metrics import STAGE_SECONDS
+    from embedding.base import get_embedding_provider
+    from query.embedding_cache import query_embedding_cache
+    import upstream.singleflight as singleflight
+
+    env = install_fakes(embed_latency_ms=args.embed_latency_ms, llm_latency_ms=args.llm_latency_ms)
+    corpus = make_corpus(args.docs)
+    questions = make_queries(corpus, args.questions)
+    # Count the query embeddings that reach the (stand-in) model
+    provider = get_embedding_provider()
+    embed_query = provider.embed_query
+    embed_calls = 0
+
+    def counted_embed_query(text):
+        nonlocal embed_calls
+        embed_calls += 1
+        return embed_query(text)
+
+    provider.embed_query = counted_embed_query
+
+    users = args.duplicates if args.across_users else 1
+    headers = [{"Authorization": f"Bearer {env.create_user(f'coalescing{i}@bench')[1]}"} for i in range(users)]
+
+    transport = httpx.ASGITransport(app=env.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for user_headers in headers:
+            for filename, body in corpus:
+                response = await client.post("/upload", headers=user_headers, files={"file": (filename, body, "text/plain")})
+                response.raise_for_status()
+
+        async def ask(question, duplicate, delay):
+            await asyncio.sleep(delay)
+            start = time.perf_counter()
+            response = await client.post("/query", headers=headers[duplicate % users], json={"query": question})
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        rng = random.Random(3)
+        delays = [[rng.uniform(0, args.jitter_ms / 1000) for _ in range(args.duplicates)] for _ in questions]
+        source = f"from {users} users" if args.across_users else "from one user"
+        print(f"{len(questions)} questions x {args.duplicates} identical requests {source} within {args.jitter_ms:.0f} ms")
+        print(f"{'coalescing':<12}{'p50 ms':>9}{'p95 ms':>9}{'answers':>9}{'embed calls':>13}{'coalesced q/e':>15}{'wall s':>8}")
+        for enabled in (False, True):
+            singleflight.COALESCING_ENABLED = enabled
+            query_embedding_cache._entries.clear()
+            STAGE_SECONDS.reset()
+            embed_calls = 0
+            before = {kind: singleflight.COALESCED.value(kind=kind) for kind in ("query", "embedding")}
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*(
+                ask(question, duplicate, delay) for question, burst in zip(questions, delays) for duplicate, delay in enumerate(burst)
+            ))
+            wall = time.perf_counter() - start
+            stages = {labels[0]: count for labels, (count, _) in STAGE_SECONDS.summary().items()}
+            coalesced = [singleflight.COALESCED.value(kind=kind) - before[kind] for kind in ("query", "embedding")]
+            stats = percentiles(latencies)
+            print(f"{'on' if enabled else 'off':<12}{stats['p50']:9.1f}{stats['p95']:9.1f}"
+                  f"{stages.get('llm_generation', 0):9d}{embed_calls:13d}"
+                  f"{coalesced[0]:>8d}/{coalesced[1]:<6d}{wall:8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--duplicates", type=int, default=4, help="identical requests per question")
+    parser.add_argument("--across-users", action="store_true", help="send each duplicate as a different user")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="spread of each burst")
+    parser.add_argument("--embed-latency-ms", type=float, default=30.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    args = parser.parse_args()
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
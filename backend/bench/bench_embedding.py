@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Throughput of the local CPU embedding backends, in chunks per second.
+
+Embeds --chunks synthetic ingest-sized chunks (chunk_text output of the
+usual synthetic corpus) with each backend in --backends, once per thread
+count in --threads, and reports the median of --repeat runs and the
+speedup over one thread. A warm-up run precedes each measurement, so the
+hashing backend's token cache and the ONNX session are warm, as they are
+in a long-running worker.
+
+The hashing backend tokenizes in Python and holds the GIL for most of its
+work, so it gains little from threads; ONNX batches run inside onnxruntime
+with the GIL released and scale with cores. "onnx" needs onnxruntime,
+tokenizers and an exported model in --model-dir (EMBEDDING_MODEL_DIR).
+
+Run from the backend directory:
+    python -m bench.bench_embedding --chunks 2000 --threads 1,4 --backends hashing,onnx
+"""
+import argparse
+import os
+import statistics
+import time
+
+from bench.harness import make_corpus
+
+
+def make_chunks(count, words_per_chunk):
+    from ingestion.pipeline import chunk_text
+    chunks = []
+    docs = max(1, count * (words_per_chunk - 50) // 600 + 1)
+    for _, body in make_corpus(docs, 600):
+        chunks.extend(chunk_text(body.decode("utf-8"), chunk_size=words_per_chunk))
+        if len(chunks) >= count:
+            break
+    return chunks[:count]
+
+
+def make_provider(backend, threads, batch_size, model_dir):
+    from embedding.local import HashingProvider, OnnxProvider
+    if backend == "hashing":
+        return HashingProvider(threads=threads, batch_size=batch_size)
+    if backend == "onnx":
+        return OnnxProvider(model_dir=model_dir, threads=threads, batch_size=batch_size)
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="hashing", help="comma-separated: hashing, onnx")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--words-per-chunk", type=int, default=300)
+    parser.add_argument("--threads", default=f"1,{os.cpu_count() or 1}", help="comma-separated thread counts")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--model-dir", default=None, help="ONNX model directory (default EMBEDDING_MODEL_DIR)")
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks, args.words_per_chunk)
+    thread_counts = list(dict.fromkeys(int(value) for value in args.threads.split(",") if value.strip()))
+    print(f"{len(chunks)} chunks of ~{args.words_per_chunk} words, batch size {args.batch_size}, {os.cpu_count()} CPUs")
+    print(f"{'backend':<10}{'threads':>8}{'chunks/s':>12}{'ms/chunk':>10}{'speedup':>9}")
+    for backend in [value.strip() for value in args.backends.split(",") if value.strip()]:
+        baseline = None
+        for threads in thread_counts:
+            try:
+                provider = make_provider(backend, threads, args.batch_size, args.model_dir)
+            except (ImportError, OSError) as e:
+                print(f"{backend:<10}{threads:>8}  skipped: {e}")
+                break
+            provider.embed_texts(chunks)
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                provider.embed_texts(chunks)
+                timings.append(time.perf_counter() - start)
+            rate = len(chunks) / statistics.median(timings)
+            baseline = baseline or rate
+            print(f"{backend:<10}{threads:>8}{rate:12.0f}{1000 / rate:10.3f}{rate / baseline:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Filtered shared-namespace vs per-user-namespace query latency.
+
+Loads the same synthetic multi-user corpus into the local Pinecone
+stand-in twice: once in the legacy shared layout (user_id metadata filter)
+and once migrated into one namespace per user with
+vectorstore.migrate_namespaces. Reports query latency for both layouts and
+the cost of deleting one user's data.
+
+Run from the backend directory:
+    python -m bench.bench_namespaces --users 50 --vectors-per-user 2000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from bench.fakes import FakeVectorIndex
+from bench.harness import percentiles
+from vectorstore.migrate_namespaces import migrate
+from vectorstore.pinecone_store import PineconeStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--vectors-per-user", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    index = FakeVectorIndex(dim=args.dim)
+    shared = PineconeStore(index, layout="shared")
+    namespaced = PineconeStore(index, layout="namespace")
+
+    start = time.perf_counter()
+    for user_id in range(1, args.users + 1):
+        values = rng.standard_normal((args.vectors_per_user, args.dim)).astype(np.float32)
+        shared.upsert(user_id, [
+            {"id": f"{user_id}_doc.txt_{i}", "values": row, "metadata": {"user_id": user_id, "filename": "doc.txt", "chunk_id": i}}
+            for i, row in enumerate(values)
+        ])
+    print(f"Loaded {args.users * args.vectors_per_user} vectors into the shared namespace in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    moved = migrate(index, list(range(1, args.users + 1)), "shared", "namespace")
+    print(f"Migrated {moved} vectors into per-user namespaces in {time.perf_counter() - start:.2f}s")
+
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    users = rng.integers(1, args.users + 1, size=args.queries)
+    print(f"{'layout':<12}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for label, store in (("shared", shared), ("namespace", namespaced)):
+        latencies = []
+        for user_id, query in zip(users, queries):
+            start = time.perf_counter()
+            matches = store.query(int(user_id), query, top_k=5)
+            latencies.append(time.perf_counter() - start)
+            assert all(match["metadata"]["user_id"] == user_id for match in matches)
+        stats = percentiles(latencies)
+        print(f"{label:<12}{stats['mean']:>10.2f}{stats['p50']:>10.2f}{stats['p99']:>10.2f}")
+
+    # Deleting one user: id list + filtered delete vs dropping a namespace
+    ids = [f"1_doc.txt_{i}" for i in range(args.vectors_per_user)]
+    start = time.perf_counter()
+    shared.delete(1, ids)
+    shared_delete = time.perf_counter() - start
+    start = time.perf_counter()
+    namespaced.delete_user(1)
+    namespace_delete = time.perf_counter() - start
+    print(f"Delete one user: shared {shared_delete * 1000:.1f} ms, namespace {namespace_delete * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Memory saved vs recall lost by float16 / int8 embedding storage.
+
+Builds one local collection per storage format from the same clustered
+synthetic embeddings, runs exact top-k searches against each, and reports
+on-disk vector bytes, recall@k relative to float32 and query latency.
+Also reports the per-entry footprint of the query embedding cache.
+
+Run from the backend directory:
+    python -m bench.bench_quantization --vectors 50000 --dim 768
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from bench.bench_vector_index import clustered_vectors
+from bench.harness import percentiles
+from query.embedding_cache import EmbeddingCache
+from vectorstore.local_store import UserCollection
+from vectorstore.quantization import DTYPES, bytes_per_vector
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    data = clustered_vectors(args.vectors, args.dim, args.clusters)
+    queries = clustered_vectors(args.queries, args.dim, args.clusters, seed=1)
+    root = tempfile.mkdtemp(prefix="ragbench-quant-")
+    try:
+        truth = None
+        print(f"{'dtype':<10}{'B/vector':>10}{'vectors MB':>12}{'saved':>8}{'recall@' + str(args.top_k):>11}{'mean ms':>10}{'p99 ms':>10}")
+        for dtype in DTYPES:
+            collection = UserCollection(os.path.join(root, dtype), dtype=dtype)
+            for offset in range(0, len(data), 1000):
+                collection.upsert([
+                    {"id": f"v{offset + i}", "values": row, "metadata": {}}
+                    for i, row in enumerate(data[offset:offset + 1000])
+                ])
+            size = sum(
+                os.path.getsize(os.path.join(collection.directory, name))
+                for name in os.listdir(collection.directory) if name.startswith(("vectors.", "scales."))
+            )
+
+            latencies, found = [], []
+            for query in queries:
+                start = time.perf_counter()
+                matches = collection.query(query, top_k=args.top_k, exact=True)
+                latencies.append(time.perf_counter() - start)
+                found.append({match["id"] for match in matches})
+            if truth is None:
+                truth, baseline = found, size
+            recall = np.mean([len(f & t) / max(1, len(t)) for f, t in zip(found, truth)])
+            stats = percentiles(latencies)
+            print(f"{dtype:<10}{bytes_per_vector(args.dim, dtype):>10}{size / 2**20:>12.1f}{1 - size / baseline:>8.0%}"
+                  f"{recall:>11.3f}{stats['mean']:>10.2f}{stats['p99']:>10.2f}")
+
+        print()
+        for dtype in DTYPES:
+            cache = EmbeddingCache(max_entries=len(queries), dtype=dtype)
+            for i, query in enumerate(queries):
+                cache.put(str(i), query.tolist())
+            error = max(float(np.abs(np.asarray(cache.get(str(i))) - query).max()) for i, query in enumerate(queries))
+            print(f"embedding cache {dtype:<8} {cache.nbytes() / len(cache):>7.0f} B/entry, max abs error {error:.2e}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Startup cost of one API worker: interpreter start plus `import main`.
+
+Runs `python -X importtime -c "import main"` in fresh subprocesses with
+placeholder credentials (no network is needed: Pinecone and Gemini clients
+are created on first use), then reports the median wall time, the median
+import time of main and the slowest modules by cumulative and self time.
+
+It also fails if any module from --forbid is imported at startup, so a
+top-level import of llama_index, pinecone or the Gemini SDK that would bring
+the multi-second startup back is caught, as is a median import time above
+--budget-ms.
+
+Run from the backend directory:
+    python -m bench.bench_startup --runs 5 --budget-ms 2000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_FORBIDDEN = "llama_index,pinecone,google.generativeai,google.genai,PyPDF2,docx,pptx,openpyxl,onnxruntime,tokenizers"
+
+
+def import_profile(backend_dir):
+    """Import main once in a fresh interpreter; returns (wall seconds, {module: (self_us, cumulative_us)})."""
+    env = dict(os.environ)
+    for key in ("PINECONE_API_KEY", "PINECONE_INDEX_NAME", "GEMINI_API_KEY"):
+        env.setdefault(key, "bench")
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=backend_dir, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"import main failed:\n{result.stderr[-2000:]}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return wall, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="modules listed per ranking")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail if median import of main exceeds this")
+    parser.add_argument("--forbid", default=DEFAULT_FORBIDDEN,
+                        help="comma-separated top-level packages that must not be imported at startup")
+    parser.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = parser.parse_args()
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    walls, imports, profiles = [], [], []
+    for _ in range(args.runs):
+        wall, modules = import_profile(backend_dir)
+        walls.append(wall)
+        imports.append(modules["main"][1] / 1e6)
+        profiles.append(modules)
+
+    # Rankings from the median run, so one cold-cache outlier does not dominate
+    median_run = profiles[imports.index(sorted(imports)[len(imports) // 2])]
+    by_cumulative = sorted(median_run.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    by_self = sorted(median_run.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+
+    forbidden = [name.strip() for name in args.forbid.split(",") if name.strip()]
+    leaked = sorted(
+        module for module in median_run
+        if any(module == name or module.startswith(name + ".") for name in forbidden)
+    )
+
+    print(f"runs: {args.runs}")
+    print(f"process start + import main: median {statistics.median(walls) * 1000:.0f} ms "
+          f"(min {min(walls) * 1000:.0f}, max {max(walls) * 1000:.0f})")
+    print(f"import main:                 median {statistics.median(imports) * 1000:.0f} ms")
+    print(f"modules imported:            {len(median_run)}")
+    print("\nslowest modules, cumulative (ms):")
+    for name, (_, cumulative) in by_cumulative:
+        print(f"  {cumulative / 1000:8.1f}  {name}")
+    print("\nslowest modules, self (ms):")
+    for name, (own, _) in by_self:
+        print(f"  {own / 1000:8.1f}  {name}")
+
+    failures = []
+    if leaked:
+        failures.append(f"deferred packages imported at startup: {', '.join(leaked[:10])}")
+    if args.budget_ms is not None and statistics.median(imports) * 1000 > args.budget_ms:
+        failures.append(f"import main took {statistics.median(imports) * 1000:.0f} ms, budget {args.budget_ms:.0f} ms")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "runs": args.runs,
+                "wall_ms": [round(w * 1000, 1) for w in walls],
+                "import_main_ms": [round(i * 1000, 1) for i in imports],
+                "slowest_cumulative_ms": {name: cumulative / 1000 for name, (_, cumulative) in by_cumulative},
+                "forbidden_imported": leaked,
+            }, f, indent=2)
+
+    for failure in failures:
+        print(f"\nFAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Flat vs two-level retrieval on one user with many documents.
+
+Ingests a synthetic corpus of --docs documents for a single user (each
+document mixes its own topic vocabulary with common words, like real files
+on different subjects), then answers questions drawn from random passages
+with RETRIEVAL_STRATEGY "flat" and "two_level" and reports:
+
+- retrieval latency (document selection + vector search [+ BM25], fused)
+- hit@k: how often the passage's own document is among the top-k results
+- overlap@k: share of flat search's top-k chunks that two-level also returns
+
+Run from the backend directory:
+    python -m bench.bench_two_level --docs 3000 --queries 300 --documents 10,20,50
+"""
+import argparse
+import datetime
+import random
+import time
+
+from bench.harness import install_fakes, percentiles
+
+_COMMON = (
+    "the of and to in is for on with as by at from that this which be are was it an or "
+    "report section data process system value result table figure page note"
+).split()
+
+
+def topical_corpus(num_docs, words_per_doc, vocabulary=20000, topic_words=40, seed=5):
+    """[(filename, text)] where each document draws most words from its own small topic vocabulary."""
+    rng = random.Random(seed)
+    words = [f"t{n:05d}" for n in range(vocabulary)]
+    corpus = []
+    for i in range(num_docs):
+        topic = rng.sample(words, topic_words)
+        body = [rng.choice(topic) if rng.random() < 0.6 else rng.choice(_COMMON) for _ in range(words_per_doc)]
+        corpus.append((f"doc_{i:05d}.txt", " ".join(body)))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=3000)
+    parser.add_argument("--words-per-doc", type=int, default=600)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--documents", default="10,20,50", help="documents searched in the second stage")
+    parser.add_argument("--mode", choices=("vector", "hybrid"), default="vector",
+                        help="vector isolates the stage two-level changes; hybrid adds the corpus-wide BM25 searches")
+    parser.add_argument("--backend", choices=("local", "pinecone"), default="local",
+                        help="the fake Pinecone index evaluates filters row by row in Python, so local is representative")
+    args = parser.parse_args()
+
+    env = install_fakes(vector_backend=args.backend)
+    import query.handler as handler
+    import retrieval.two_level as two_level
+    from db.models import save_file_metadata
+    from ingestion.pipeline import chunk_text, store_embeddings
+    from vectorstore.base import get_vector_store
+
+    handler.RETRIEVAL_MODE = args.mode
+    user_id, _ = env.create_user("two-level@bench")
+    corpus = topical_corpus(args.docs, args.words_per_doc)
+    start = time.perf_counter()
+    chunk_count = 0
+    passages = []
+    for filename, text in corpus:
+        save_file_metadata(user_id, filename, datetime.datetime.now(datetime.timezone.utc))
+        chunks = chunk_text(text)
+        chunk_count += store_embeddings(user_id, filename, chunks)
+        passages.extend((filename, chunk) for chunk in chunks)
+    print(f"Ingested {chunk_count} chunks from {args.docs} documents in {time.perf_counter() - start:.1f}s")
+
+    rng = random.Random(11)
+    questions = []
+    for _ in range(args.queries):
+        filename, chunk = rng.choice(passages)
+        words = chunk.split()
+        offset = rng.randrange(0, max(1, len(words) - 12))
+        questions.append((filename, " ".join(words[offset:offset + 12])))
+    embeddings = handler.embed_queries([text for _, text in questions], user_id=user_id)
+    vector_store = get_vector_store()
+
+    def run(strategy, limit):
+        two_level.RETRIEVAL_STRATEGY = strategy
+        two_level.TWO_LEVEL_DOCUMENTS = limit
+        # Warm the summary-matrix cache and the vector index outside the timed loop
+        handler.retrieve_multi(user_id, [questions[0][1]], [embeddings[0]], vector_store, top_k=args.top_k)
+        latencies, results, hits = [], [], 0
+        for (filename, text), embedding in zip(questions, embeddings):
+            begin = time.perf_counter()
+            matches = handler.retrieve_multi(user_id, [text], [embedding], vector_store, top_k=args.top_k)
+            latencies.append(time.perf_counter() - begin)
+            results.append([match["id"] for match in matches])
+            hits += any(match["metadata"].get("filename") == filename for match in matches)
+        return percentiles(latencies), results, hits / len(questions)
+
+    flat_stats, flat_results, flat_hits = run("flat", two_level.TWO_LEVEL_DOCUMENTS)
+    print(f"\n{args.mode} retrieval, top-{args.top_k}, {args.queries} queries, {args.backend} vector store")
+    print(f"{'strategy':<22}{'p50 ms':>9}{'p95 ms':>9}{'mean ms':>9}{'hit@k':>8}{'overlap@k':>11}")
+    print(f"{'flat':<22}{flat_stats['p50']:9.2f}{flat_stats['p95']:9.2f}{flat_stats['mean']:9.2f}{flat_hits:8.3f}{1.0:11.3f}")
+    for limit in [int(value) for value in args.documents.split(",")]:
+        stats, results, hits = run("two_level", limit)
+        overlap = sum(len(set(a) & set(b)) for a, b in zip(flat_results, results)) / max(1, sum(len(a) for a in flat_results))
+        label = f"two_level ({limit} docs)"
+        print(f"{label:<22}{stats['p50']:9.2f}{stats['p95']:9.2f}{stats['mean']:9.2f}{hits:8.3f}{overlap:11.3f}")
+
+
+if __name__ == "__main__":
+    main()
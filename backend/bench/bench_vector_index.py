@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Recall vs latency of the local IVF vector index against exact search.
+
+Builds a LocalVectorStore collection from clustered synthetic embeddings,
+then for each nprobe setting reports mean/p99 query latency and recall@k
+relative to an exact scan of the same collection.
+
+Run from the backend directory:
+    python -m bench.bench_vector_index --vectors 50000 --dim 768 --nprobe 1,4,8,16,32
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from bench.harness import percentiles
+from vectorstore.local_store import UserCollection
+
+
+def clustered_vectors(count, dim, clusters, seed=0):
+    """Gaussian mixture on the unit sphere, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32")
+    parser.add_argument("--filenames", type=int, default=50, help="distinct filenames for the filtered run")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="ragbench-vectors-")
+    try:
+        data = clustered_vectors(args.vectors, args.dim, args.clusters)
+        queries = clustered_vectors(args.queries, args.dim, args.clusters, seed=1)
+        collection = UserCollection(directory)
+
+        start = time.perf_counter()
+        batch = 1000
+        for offset in range(0, len(data), batch):
+            collection.upsert([
+                {"id": f"v{offset + i}", "values": row, "metadata": {"filename": f"file_{(offset + i) % args.filenames}.txt"}}
+                for i, row in enumerate(data[offset:offset + batch])
+            ])
+        build = time.perf_counter() - start
+        print(f"Built {len(collection)} x {args.dim} collection in {build:.2f}s "
+              f"({len(collection) / build:.0f} vectors/s, IVF lists: {0 if collection.centroids is None else len(collection.centroids)})")
+
+        def run(label, filters=None, **kwargs):
+            latencies, results = [], []
+            for query in queries:
+                start = time.perf_counter()
+                matches = collection.query(query, top_k=args.top_k, filters=filters, **kwargs)
+                latencies.append(time.perf_counter() - start)
+                results.append({match["id"] for match in matches})
+            return latencies, results
+
+        exact_latencies, truth = run("exact", exact=True)
+        stats = percentiles(exact_latencies)
+        print(f"{'mode':<14}{'mean ms':>10}{'p99 ms':>10}{'recall@' + str(args.top_k):>12}")
+        print(f"{'exact':<14}{stats['mean']:>10.2f}{stats['p99']:>10.2f}{1.0:>12.3f}")
+
+        for nprobe in [int(n) for n in args.nprobe.split(",") if n.strip()]:
+            latencies, found = run(f"nprobe={nprobe}", nprobe=nprobe)
+            recall = np.mean([len(f & t) / max(1, len(t)) for f, t in zip(found, truth)])
+            stats = percentiles(latencies)
+            print(f"{'nprobe=' + str(nprobe):<14}{stats['mean']:>10.2f}{stats['p99']:>10.2f}{recall:>12.3f}")
+
+        # Metadata filtering on a single filename
+        filters = {"filename": "file_0.txt"}
+        exact_latencies, truth = run("exact filtered", filters=filters, exact=True)
+        latencies, found = run("ivf filtered", filters=filters)
+        recall = np.mean([len(f & t) / max(1, len(t)) for f, t in zip(found, truth)])
+        print(f"{'exact+filter':<14}{percentiles(exact_latencies)['mean']:>10.2f}{percentiles(exact_latencies)['p99']:>10.2f}{1.0:>12.3f}")
+        print(f"{'ivf+filter':<14}{percentiles(latencies)['mean']:>10.2f}{percentiles(latencies)['p99']:>10.2f}{recall:>12.3f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Local stand-ins for the remote services used by the backend.
+
+These let the benchmark harness drive the real FastAPI app without
+Pinecone, Gemini or MySQL credentials:
+
+- HashingEmbedding: deterministic bag-of-words hashing embedder
+- FakeVectorIndex: NumPy brute-force index speaking the Pinecone Index API
+- FakeLLM: LLM with configurable first-token latency and token rate
+"""
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import CustomLLM, CompletionResponse, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+from embedding.local import hash_embeddings
+from vectorstore.base import matches_filter
+
+# Gemini embedding-001 dimension
+EMBEDDING_DIM = 768
+
+
+def hash_embed(text, dim=EMBEDDING_DIM):
+    """Signed feature hashing of word tokens, L2-normalised (the hashing embedding backend)."""
+    return hash_embeddings([text], dim)[0]
+
+
+class HashingEmbedding(BaseEmbedding):
+    """Drop-in for GeminiEmbedding with an optional simulated network latency."""
+
+    dim: int = EMBEDDING_DIM
+    latency_ms: float = 0.0
+
+    def _embed(self, text: str) -> List[float]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return hash_embed(text, self.dim).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        # One simulated round trip per batch, like batchEmbedContents
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return hash_embeddings(texts, self.dim).tolist()
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+
+class FakeVectorIndex:
+    """
+    In-memory brute-force vector index implementing the subset of the
+    Pinecone Index API the backend uses (upsert/query/fetch/delete/stats).
+    Vectors live in one growable float32 matrix per namespace.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM, latency_ms=0.0):
+        self.dim = dim
+        self.latency_ms = latency_ms
+        self._lock = threading.Lock()
+        self._namespaces = {}
+
+    def _namespace(self, namespace):
+        ns = self._namespaces.get(namespace or "")
+        if ns is None:
+            ns = self._namespaces[namespace or ""] = {
+                "matrix": np.zeros((0, self.dim), dtype=np.float32),
+                "ids": [],
+                "metadata": [],
+                "positions": {},
+            }
+        return ns
+
+    def _simulate_latency(self):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def upsert(self, vectors, namespace=None, **kwargs):
+        self._simulate_latency()
+        with self._lock:
+            ns = self._namespace(namespace)
+            new_rows = []
+            for vector in vectors:
+                if isinstance(vector, dict):
+                    vector_id, values, metadata = vector["id"], vector["values"], vector.get("metadata", {})
+                else:
+                    vector_id, values, metadata = vector[0], vector[1], vector[2] if len(vector) > 2 else {}
+                values = np.asarray(values, dtype=np.float32)
+                position = ns["positions"].get(vector_id)
+                if position is not None:
+                    ns["matrix"][position] = values
+                    ns["metadata"][position] = dict(metadata)
+                else:
+                    ns["positions"][vector_id] = len(ns["ids"]) + len(new_rows)
+                    new_rows.append((vector_id, values, dict(metadata)))
+            if new_rows:
+                ns["matrix"] = np.vstack([ns["matrix"], np.stack([row[1] for row in new_rows])])
+                ns["ids"].extend(row[0] for row in new_rows)
+                ns["metadata"].extend(row[2] for row in new_rows)
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector=None, top_k=10, filter=None, namespace=None,
+              include_values=False, include_metadata=False, **kwargs):
+        self._simulate_latency()
+        with self._lock:
+            ns = self._namespace(namespace)
+            matrix, ids, metadata = ns["matrix"], list(ns["ids"]), list(ns["metadata"])
+        if not ids:
+            return SimpleNamespace(matches=[], namespace=namespace or "")
+        if filter:
+            rows = np.array([i for i, meta in enumerate(metadata) if matches_filter(meta, filter)], dtype=np.int64)
+        else:
+            rows = np.arange(len(ids))
+        if rows.size == 0:
+            return SimpleNamespace(matches=[], namespace=namespace or "")
+        scores = matrix[rows] @ np.asarray(vector, dtype=np.float32)
+        k = min(top_k, rows.size)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        matches = []
+        for position in best:
+            row = int(rows[position])
+            matches.append(SimpleNamespace(
+                id=ids[row],
+                score=float(scores[position]),
+                values=matrix[row].tolist() if include_values else [],
+                metadata=dict(metadata[row]) if include_metadata else {},
+            ))
+        return SimpleNamespace(matches=matches, namespace=namespace or "")
+
+    def fetch(self, ids, namespace=None, **kwargs):
+        self._simulate_latency()
+        with self._lock:
+            ns = self._namespace(namespace)
+            vectors = {}
+            for vector_id in ids:
+                position = ns["positions"].get(vector_id)
+                if position is not None:
+                    vectors[vector_id] = SimpleNamespace(
+                        id=vector_id,
+                        values=ns["matrix"][position].tolist(),
+                        metadata=dict(ns["metadata"][position]),
+                    )
+        return SimpleNamespace(vectors=vectors, namespace=namespace or "")
+
+    def delete(self, ids=None, delete_all=False, filter=None, namespace=None, **kwargs):
+        self._simulate_latency()
+        with self._lock:
+            ns = self._namespace(namespace)
+            if delete_all:
+                keep = []
+            elif ids is not None:
+                doomed = set(ids)
+                keep = [i for i, vector_id in enumerate(ns["ids"]) if vector_id not in doomed]
+            elif filter:
+                keep = [i for i, meta in enumerate(ns["metadata"]) if not matches_filter(meta, filter)]
+            else:
+                return {}
+            ns["matrix"] = ns["matrix"][keep] if keep else np.zeros((0, self.dim), dtype=np.float32)
+            ns["ids"] = [ns["ids"][i] for i in keep]
+            ns["metadata"] = [ns["metadata"][i] for i in keep]
+            ns["positions"] = {vector_id: i for i, vector_id in enumerate(ns["ids"])}
+        return {}
+
+    def list(self, prefix=None, namespace=None, limit=100, **kwargs):
+        """Yield pages of vector ids, like Index.list on serverless indexes."""
+        with self._lock:
+            ids = [vector_id for vector_id in self._namespace(namespace)["ids"]
+                   if prefix is None or vector_id.startswith(prefix)]
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    def describe_index_stats(self, **kwargs):
+        with self._lock:
+            namespaces = {name: {"vector_count": len(ns["ids"])} for name, ns in self._namespaces.items()}
+        return {
+            "dimension": self.dim,
+            "namespaces": namespaces,
+            "total_vector_count": sum(ns["vector_count"] for ns in namespaces.values()),
+        }
+
+
+class FakePinecone:
+    """Stand-in for pinecone.Pinecone that hands out one shared FakeVectorIndex."""
+
+    index = None
+
+    def __init__(self, api_key=None, **kwargs):
+        pass
+
+    def Index(self, name=None, **kwargs):
+        return FakePinecone.index
+
+
+class FakeLLM(CustomLLM):
+    """LLM with simulated first-token latency and generation rate."""
+
+    latency_ms: float = 300.0
+    tokens_per_sec: float = 80.0
+    answer_tokens: int = 60
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=32768, num_output=1024, model_name="fake-llm")
+
+    def _answer(self, prompt: str) -> str:
+        # Echo the start of the retrieved context so answers look grounded
+        words = prompt.split()
+        filler = words[:self.answer_tokens] if words else ["ok"]
+        return "Based on your documents: " + " ".join(filler)
+
+    def _wait(self):
+        generation = self.answer_tokens / self.tokens_per_sec if self.tokens_per_sec else 0.0
+        time.sleep(self.latency_ms / 1000 + generation)
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        self._wait()
+        return CompletionResponse(text=self._answer(prompt))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        self._wait()
+        text = self._answer(prompt)
+        yield CompletionResponse(text=text, delta=text)
@@ -0,0 +1,175 @@
+"""
+Wire the local stand-ins into the backend and drive it through ASGI.
+
+install_fakes() should run before the app handles its first request: the
+Pinecone and Gemini clients are created lazily on first use, so patching
+them beforehand is enough.
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from bench.fakes import EMBEDDING_DIM, FakeLLM, FakePinecone, FakeVectorIndex, HashingEmbedding
+from bench.sqlite_db import create_database
+
+
+class BenchEnvironment:
+    def __init__(self, app, get_connection, vector_index, embed_model, llm):
+        self.app = app
+        self.get_connection = get_connection
+        self.vector_index = vector_index
+        self.embed_model = embed_model
+        self.llm = llm
+
+    def create_user(self, email):
+        """Insert a user directly and return (user_id, bearer token)."""
+        from api.auth import create_access_token
+        conn = self.get_connection()
+        cur = conn.cursor()
+        cur.execute("INSERT INTO users (email, password_hash) VALUES (%s, %s)", (email, "bench"))
+        conn.commit()
+        user_id = cur.lastrowid
+        cur.close()
+        conn.close()
+        return user_id, create_access_token({"sub": str(user_id), "email": email})
+
+
+def install_fakes(db_path=None, dim=EMBEDDING_DIM, embed_latency_ms=0.0, vector_latency_ms=0.0,
+                  llm_latency_ms=300.0, llm_tokens_per_sec=80.0, vector_backend="pinecone"):
+    """
+    Replace Pinecone, Gemini and MySQL with local stand-ins and import the app.
+    vector_backend="local" serves retrieval from the embedded LocalVectorStore
+    instead of the fake Pinecone index.
+    """
+    for key in ("PINECONE_API_KEY", "PINECONE_INDEX_NAME", "GEMINI_API_KEY"):
+        os.environ.setdefault(key, "bench")
+
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="ragbench-"), "bench.sqlite3")
+    get_connection = create_database(db_path)
+    vector_index = FakeVectorIndex(dim=dim, latency_ms=vector_latency_ms)
+    embed_model = HashingEmbedding(dim=dim, latency_ms=embed_latency_ms)
+    llm = FakeLLM(latency_ms=llm_latency_ms, tokens_per_sec=llm_tokens_per_sec)
+
+    # Load tests measure throughput, not the per-user rate limiter (set these to exercise it)
+    os.environ.setdefault("RATE_LIMIT_QUERY_PER_MINUTE", "0")
+    os.environ.setdefault("RATE_LIMIT_UPLOAD_PER_MINUTE", "0")
+    os.environ.setdefault("RATE_LIMIT_QUERY_BATCH_PER_MINUTE", "0")
+    os.environ.setdefault("RATE_LIMIT_UPLOAD_BULK_PER_MINUTE", "0")
+
+    import pinecone
+    FakePinecone.index = vector_index
+    pinecone.Pinecone = FakePinecone
+
+    import llama_index.llms.gemini as gemini_llm
+    gemini_llm.Gemini = lambda **kwargs: llm
+
+    import db.connection
+    import db.models
+    import api.auth
+    import scheduler.cleanup
+    db.connection.get_connection = get_connection
+    db.models.get_connection = get_connection
+    api.auth.get_connection = get_connection
+    scheduler.cleanup.get_connection = get_connection
+    # The SQLite schema already has the chunks, content, documents and document_vectors tables (the MySQL DDL does not parse in SQLite)
+    import retrieval.chunk_store
+    import ingestion.dedup
+    import ingestion.catalog
+    import retrieval.two_level
+    retrieval.chunk_store._table_ready = True
+    ingestion.dedup._tables_ready = True
+    ingestion.catalog._table_ready = True
+    retrieval.two_level._table_ready = True
+
+    # Keep BM25 segments next to the throwaway database, not in the real LEXICAL_INDEX_DIR
+    import retrieval.bm25
+    retrieval.bm25.LEXICAL_INDEX_DIR = os.path.join(os.path.dirname(db_path), "lexical")
+
+    import vectorstore.base
+    if vector_backend == "local":
+        from vectorstore.local_store import LocalVectorStore
+        vectorstore.base._store = LocalVectorStore(os.path.join(os.path.dirname(db_path), "vectors"))
+    else:
+        from vectorstore.pinecone_store import PineconeStore
+        vectorstore.base._store = PineconeStore(vector_index)
+
+    # The stand-in plays the remote model, so embedding calls still go through the upstream limits
+    import embedding.base
+    from embedding.gemini import GeminiProvider
+    embedding.base._provider = GeminiProvider(embed_model)
+
+    import main
+    return BenchEnvironment(main.app, get_connection, vector_index, embed_model, llm)
+
+
+# Vocabulary for synthetic documents; identifiers mimic code symbols and SKUs
+_WORDS = (
+    "invoice order customer shipment warehouse policy refund contract payment "
+    "schedule report metric latency throughput cluster service deploy backup "
+    "account billing region quota vendor product catalog review release "
+    "handbook onboarding security access audit budget forecast revenue"
+).split()
+
+
+def make_corpus(num_docs, words_per_doc=600, seed=7):
+    """Return [(filename, bytes)] of synthetic text documents."""
+    rng = random.Random(seed)
+    docs = []
+    for i in range(num_docs):
+        words = [rng.choice(_WORDS) for _ in range(words_per_doc)]
+        # Sprinkle unique identifiers so exact-match questions exist
+        for j in range(0, words_per_doc, 50):
+            words[j] = f"SKU{i:04d}x{j:03d}"
+        docs.append((f"doc_{i:04d}.txt", " ".join(words).encode("utf-8")))
+    return docs
+
+
+def make_queries(corpus, count, seed=11):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        _, body = rng.choice(corpus)
+        words = body.decode("utf-8").split()
+        start = rng.randrange(0, max(1, len(words) - 8))
+        queries.append("What does the document say about " + " ".join(words[start:start + 8]) + "?")
+    return queries
+
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    values = np.asarray(samples) * 1000
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "mean": float(values.mean()),
+    }
+
+
+async def run_load(client, requests, concurrency):
+    """
+    Issue requests (callables taking the client and returning a coroutine)
+    with at most `concurrency` in flight. Returns (latencies, errors, wall time).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(make_request):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await make_request(client)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(request) for request in requests))
+    return latencies, errors, time.perf_counter() - start
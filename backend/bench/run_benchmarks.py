@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Offline load benchmark for /upload and /query.
+
+Runs the real FastAPI app in-process with local stand-ins for Pinecone,
+Gemini and MySQL, sweeps concurrency levels and reports throughput and
+latency percentiles per endpoint plus the mean time spent in each stage.
+
+Run from the backend directory:
+    python -m bench.run_benchmarks --docs 20 --queries 50 --concurrency 1,4,16
+"""
+import argparse
+import asyncio
+import json
+
+import httpx
+
+from bench.harness import install_fakes, make_corpus, make_queries, percentiles, run_load
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20, help="documents uploaded per concurrency level")
+    parser.add_argument("--words-per-doc", type=int, default=600)
+    parser.add_argument("--queries", type=int, default=50, help="queries issued per concurrency level")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--embed-latency-ms", type=float, default=30.0)
+    parser.add_argument("--vector-latency-ms", type=float, default=20.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=80.0)
+    parser.add_argument("--vector-backend", choices=["pinecone", "local"], default="pinecone",
+                        help="fake Pinecone index or the embedded local store")
+    parser.add_argument("--json", dest="json_path", help="also write results to this file")
+    return parser.parse_args()
+
+
+async def bench(args):
+    from monitoring.metrics import STAGE_SECONDS
+
+    env = install_fakes(
+        embed_latency_ms=args.embed_latency_ms,
+        vector_latency_ms=args.vector_latency_ms,
+        llm_latency_ms=args.llm_latency_ms,
+        llm_tokens_per_sec=args.llm_tokens_per_sec,
+        vector_backend=args.vector_backend,
+    )
+    corpus = make_corpus(args.docs, args.words_per_doc)
+    queries = make_queries(corpus, args.queries)
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    results = []
+    transport = httpx.ASGITransport(app=env.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for level in levels:
+            # Fresh user per level so corpus size is identical for every run
+            _, token = env.create_user(f"bench-c{level}@example.com")
+            headers = {"Authorization": f"Bearer {token}"}
+            STAGE_SECONDS.reset()
+
+            def upload(filename, body):
+                return lambda c: c.post("/upload", headers=headers, files={"file": (filename, body, "text/plain")})
+
+            def ask(question):
+                return lambda c: c.post("/query", headers=headers, json={"query": question})
+
+            for endpoint, requests in (
+                ("/upload", [upload(name, body) for name, body in corpus]),
+                ("/query", [ask(question) for question in queries]),
+            ):
+                latencies, errors, wall = await run_load(client, requests, level)
+                results.append({
+                    "endpoint": endpoint,
+                    "concurrency": level,
+                    "requests": len(latencies),
+                    "errors": errors,
+                    "throughput_rps": len(latencies) / wall if wall else 0.0,
+                    "latency_ms": percentiles(latencies),
+                })
+
+            stages = {labels[0]: (count, total) for labels, (count, total) in STAGE_SECONDS.summary().items()}
+            results.append({
+                "concurrency": level,
+                "stage_mean_ms": {stage: total / count * 1000 for stage, (count, total) in sorted(stages.items()) if count},
+            })
+    return results
+
+
+def print_report(results):
+    print(f"{'endpoint':<10}{'conc':>6}{'reqs':>7}{'err':>5}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for row in results:
+        if "endpoint" in row:
+            lat = row["latency_ms"]
+            print(f"{row['endpoint']:<10}{row['concurrency']:>6}{row['requests']:>7}{row['errors']:>5}"
+                  f"{row['throughput_rps']:>9.1f}{lat['p50']:>10.1f}{lat['p95']:>10.1f}{lat['p99']:>10.1f}")
+        else:
+            stages = ", ".join(f"{stage}={ms:.1f}" for stage, ms in row["stage_mean_ms"].items())
+            print(f"  stage means @ concurrency {row['concurrency']}: {stages}")
+
+
+def main():
+    args = parse_args()
+    results = asyncio.run(bench(args))
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
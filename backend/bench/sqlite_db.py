@@ -0,0 +1,213 @@
+"""
+SQLite stand-in for the MySQL connection used by db.models and api.auth.
+
+Exposes the small slice of the mysql.connector API the backend relies on
+(cursor(dictionary=True), execute/executemany, fetchone/fetchall, rowcount,
+commit, close, GET_LOCK/RELEASE_LOCK) and rewrites the MySQL-specific SQL
+the models emit.
+"""
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT UNIQUE,
+    password_hash TEXT,
+    token TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    filename TEXT,
+    uploaded_at TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS search_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    query TEXT,
+    answer TEXT,
+    created_at TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS chat_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    chat_id TEXT UNIQUE,
+    conversation TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    body BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS usage_daily (
+    user_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    embedding_tokens INTEGER NOT NULL DEFAULT 0,
+    llm_input_tokens INTEGER NOT NULL DEFAULT 0,
+    llm_output_tokens INTEGER NOT NULL DEFAULT 0,
+    requests INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+CREATE TABLE IF NOT EXISTS content_objects (
+    content_hash TEXT PRIMARY KEY,
+    refcount INTEGER NOT NULL DEFAULT 0,
+    ready INTEGER NOT NULL DEFAULT 0,
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    size_bytes INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS content_refs (
+    user_id INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, filename)
+);
+CREATE TABLE IF NOT EXISTS documents (
+    user_id INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'processing',
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    id_prefix TEXT,
+    content_hash TEXT,
+    size_bytes INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, filename)
+);
+CREATE TABLE IF NOT EXISTS document_vectors (
+    owner_id INTEGER NOT NULL,
+    doc_key TEXT NOT NULL,
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (owner_id, doc_key)
+);
+"""
+
+_INTERVAL_RE = re.compile(r"NOW\(\)\s*-\s*INTERVAL\s+(\d+)\s+(DAY|HOUR|MINUTE)", re.IGNORECASE)
+
+
+def _adapt_datetime(value):
+    # Store everything as naive UTC so TIMESTAMP columns round-trip
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(" ")
+
+
+def _convert_timestamp(raw):
+    return datetime.fromisoformat(raw.decode("utf-8"))
+
+
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_converter("TIMESTAMP", _convert_timestamp)
+
+
+def translate_sql(sql):
+    """Rewrite the MySQL dialect used in db.models into SQLite."""
+    sql = _INTERVAL_RE.sub(lambda m: f"datetime('now', '-{m.group(1)} {m.group(2).lower()}s')", sql)
+    sql = re.sub(r"NOW\(\)", "CURRENT_TIMESTAMP", sql, flags=re.IGNORECASE)
+    # MySQL upsert -> SQLite upsert (conflict target may be omitted since SQLite 3.35)
+    sql = re.sub(r"ON DUPLICATE KEY UPDATE", "ON CONFLICT DO UPDATE SET", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"VALUES\((\w+)\)", r"excluded.\1", sql)
+    # SQLite locks the whole database for a write transaction; row locks are implicit
+    sql = re.sub(r"\s+FOR UPDATE", "", sql, flags=re.IGNORECASE)
+    return sql.replace("%s", "?")
+
+
+class SQLiteCursor:
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(translate_sql(sql), tuple(params or ()))
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(translate_sql(sql), [tuple(p) for p in seq_of_params])
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        columns = [column[0] for column in self._cursor.description]
+        return dict(zip(columns, row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+# MySQL named locks (GET_LOCK / RELEASE_LOCK): name -> holding connection, released on close
+_named_locks = {}
+_named_locks_guard = threading.Lock()
+
+
+class SQLiteConnection:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(
+            path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+            timeout=30,
+        )
+        self._conn.create_function("GET_LOCK", 2, self._get_lock)
+        self._conn.create_function("RELEASE_LOCK", 1, self._release_lock)
+
+    def _get_lock(self, name, timeout):
+        # Never waits: the backend only asks with a timeout of 0
+        with _named_locks_guard:
+            holder = _named_locks.setdefault(name, self)
+        return 1 if holder is self else 0
+
+    def _release_lock(self, name):
+        with _named_locks_guard:
+            if _named_locks.get(name) is not self:
+                return 0
+            del _named_locks[name]
+        return 1
+
+    def cursor(self, dictionary=False):
+        return SQLiteCursor(self._conn.cursor(), dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        with _named_locks_guard:
+            for name in [name for name, holder in _named_locks.items() if holder is self]:
+                del _named_locks[name]
+        self._conn.close()
+
+
+def create_database(path):
+    """Create the schema and return a get_connection() replacement bound to path."""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    conn.commit()
+    conn.close()
+
+    def get_connection():
+        return SQLiteConnection(path)
+
+    return get_connection
@@ -0,0 +1,14 @@
+# Create the tables added on top of the original schema (safe to re-run)
+from db.models import create_chunks_table, create_usage_table, create_content_tables, create_documents_table, create_document_vectors_table
+
+def init_db():
+    create_chunks_table()
+    create_usage_table()
+    create_content_tables()
+    create_documents_table()
+    create_document_vectors_table()
+    print("✅ Database tables are up to date")
+
+# Run from the backend directory: python -m db.init_db
+if __name__ == "__main__":
+    init_db()
@@ -15,6 +15,30 @@ def save_file_metadata(user_id, filename, uploaded_at):
     cur.close()
     conn.close()
 
+# Save metadata for many uploaded files in one multi-row INSERT; rows are (user_id, filename, uploaded_at)
+def save_file_metadata_bulk(rows):
+    if not rows:
+        return
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.executemany(
+        "INSERT INTO files (user_id, filename, uploaded_at) VALUES (%s, %s, %s)",
+        rows
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+
+# Get the IDs of every registered user (used by maintenance scripts)
+def get_all_user_ids():
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM users ORDER BY id")
+    user_ids = [row[0] for row in cur.fetchall()]
+    cur.close()
+    conn.close()
+    return user_ids
+
 # Save search history (commented out; can be enabled if needed)
 def save_search_history(user_id, query, answer):
     conn = get_connection()
@@ -27,21 +51,545 @@ def save_search_history(user_id, query, answer):
     cur.close()
     conn.close()
 
-# Delete old files and search history based on a cutoff datetime (commented out; can be enabled)
-# def delete_old_files_and_history(cutoff):
-#     conn = get_connection()
-#     cur = conn.cursor()
-#     # Delete files uploaded before the cutoff
-#     cur.execute(
-#         "DELETE FROM files WHERE uploaded_at < %s",
-#         (cutoff,)
-#     )
-#     # Delete search history before the cutoff
-#     cur.execute(
-#         "DELETE FROM search_history WHERE created_at < %s",
-#         (cutoff,)
-#     )
-#     conn.commit()
+# Save many search history rows in one round-trip; rows are (user_id, query, answer)
+def save_search_history_bulk(rows):
+    if not rows:
+        return
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.executemany(
+        "INSERT INTO search_history (user_id, query, answer, created_at) VALUES (%s, %s, %s, NOW())",
+        rows
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+
+# Fetch a batch of files uploaded before the cutoff, oldest first.
+# still_live is 1 when the same user re-uploaded the same filename after the cutoff,
+# in which case the vectors belong to the newer upload and must be kept.
+def get_expired_files(cutoff, limit):
+    conn = get_connection()
+    cur = conn.cursor(dictionary=True)
+    cur.execute("""
+        SELECT f.id, f.user_id, f.filename,
+               EXISTS(
+                   SELECT 1 FROM files g
+                   WHERE g.user_id = f.user_id AND g.filename = f.filename AND g.uploaded_at >= %s
+               ) AS still_live
+        FROM files f
+        WHERE f.uploaded_at < %s
+        ORDER BY f.id
+        LIMIT %s
+    """, (cutoff, cutoff, limit))
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+    return rows
+
+# Filenames the user uploaded within [after, before] (either bound may be None)
+def get_user_filenames_uploaded_between(user_id, after=None, before=None):
+    conn = get_connection()
+    cur = conn.cursor()
+    sql = "SELECT DISTINCT filename FROM files WHERE user_id = %s"
+    params = [user_id]
+    if after is not None:
+        sql += " AND uploaded_at >= %s"
+        params.append(after)
+    if before is not None:
+        sql += " AND uploaded_at <= %s"
+        params.append(before)
+    cur.execute(sql, tuple(params))
+    filenames = {row[0] for row in cur.fetchall()}
+    cur.close()
+    conn.close()
+    return filenames
+
+# Delete file rows by primary key in one statement
+def delete_files_by_ids(file_ids):
+    if not file_ids:
+        return 0
+    conn = get_connection()
+    cur = conn.cursor()
+    placeholders = ", ".join(["%s"] * len(file_ids))
+    cur.execute(f"DELETE FROM files WHERE id IN ({placeholders})", tuple(file_ids))
+    deleted = cur.rowcount
+    conn.commit()
+    cur.close()
+    conn.close()
+    return deleted
+
+# Delete at most `limit` search history rows older than the cutoff; returns rows removed
+def delete_old_search_history(cutoff, limit):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "DELETE FROM search_history WHERE created_at < %s ORDER BY created_at LIMIT %s",
+        (cutoff, limit)
+    )
+    deleted = cur.rowcount
+    conn.commit()
+    cur.close()
+    conn.close()
+    return deleted
+
+# Chunk text lives here rather than in vector metadata; body is zlib-compressed text
+CHUNKS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS chunks (
+        id VARCHAR(512) NOT NULL PRIMARY KEY,
+        user_id INT NOT NULL,
+        body MEDIUMBLOB NOT NULL,
+        INDEX idx_chunks_user (user_id)
+    )
+"""
+
+# Create the chunks table if it does not exist yet
+def create_chunks_table():
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(CHUNKS_TABLE_DDL)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+# Insert or replace chunk bodies in one round-trip; rows are (id, user_id, body)
+def save_chunks(rows):
+    if not rows:
+        return
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.executemany("REPLACE INTO chunks (id, user_id, body) VALUES (%s, %s, %s)", rows)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+# Bulk lookup of chunk bodies by vector ID; returns {id: body} for the ids that exist
+def get_chunks(chunk_ids):
+    if not chunk_ids:
+        return {}
+    conn = get_connection()
+    cur = conn.cursor()
+    placeholders = ", ".join(["%s"] * len(chunk_ids))
+    cur.execute(f"SELECT id, body FROM chunks WHERE id IN ({placeholders})", tuple(chunk_ids))
+    bodies = {row[0]: row[1] for row in cur.fetchall()}
+    cur.close()
+    conn.close()
+    return bodies
+
+# Delete chunk bodies by vector ID; returns rows removed
+def delete_chunks(chunk_ids):
+    if not chunk_ids:
+        return 0
+    conn = get_connection()
+    cur = conn.cursor()
+    placeholders = ", ".join(["%s"] * len(chunk_ids))
+    cur.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", tuple(chunk_ids))
+    deleted = cur.rowcount
+    conn.commit()
+    cur.close()
+    conn.close()
+    return deleted
+
+# Daily per-user usage totals, written in bulk by monitoring.usage
+USAGE_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS usage_daily (
+        user_id INT NOT NULL,
+        day DATE NOT NULL,
+        embedding_tokens BIGINT NOT NULL DEFAULT 0,
+        llm_input_tokens BIGINT NOT NULL DEFAULT 0,
+        llm_output_tokens BIGINT NOT NULL DEFAULT 0,
+        requests INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day)
+    )
+"""
+
+# Create the usage_daily table if it does not exist yet
+def create_usage_table():
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(USAGE_TABLE_DDL)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+# Add usage deltas in one round-trip; rows are (user_id, day, embedding, llm_input, llm_output, requests)
+def add_usage(rows):
+    if not rows:
+        return
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.executemany("""
+        INSERT INTO usage_daily (user_id, day, embedding_tokens, llm_input_tokens, llm_output_tokens, requests)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            embedding_tokens = embedding_tokens + VALUES(embedding_tokens),
+            llm_input_tokens = llm_input_tokens + VALUES(llm_input_tokens),
+            llm_output_tokens = llm_output_tokens + VALUES(llm_output_tokens),
+            requests = requests + VALUES(requests)
+    """, rows)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+# Content-addressed documents shared across users: one row per distinct file (by SHA-256),
+# and one reference per (user, filename) pointing at it
+CONTENT_OBJECTS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS content_objects (
+        content_hash CHAR(64) NOT NULL PRIMARY KEY,
+        refcount INT NOT NULL DEFAULT 0,
+        ready TINYINT NOT NULL DEFAULT 0,
+        chunk_count INT NOT NULL DEFAULT 0,
+        size_bytes BIGINT NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+CONTENT_REFS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS content_refs (
+        user_id INT NOT NULL,
+        filename VARCHAR(255) NOT NULL,
+        content_hash CHAR(64) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, filename),
+        INDEX idx_content_refs_hash (content_hash)
+    )
+"""
+
+# Create the content_objects and content_refs tables if they do not exist yet
+def create_content_tables():
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(CONTENT_OBJECTS_TABLE_DDL)
+    cur.execute(CONTENT_REFS_TABLE_DDL)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+# Look up a shared content object; returns a dict or None
+def get_content_object(content_hash):
+    conn = get_connection()
+    cur = conn.cursor(dictionary=True)
+    cur.execute(
+        "SELECT content_hash, refcount, ready, chunk_count, size_bytes FROM content_objects WHERE content_hash = %s",
+        (content_hash,)
+    )
+    row = cur.fetchone()
+    cur.close()
+    conn.close()
+    return row
+
+# Record that a content object's chunks are fully stored
+def mark_content_ready(content_hash, chunk_count, size_bytes):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE content_objects SET ready = 1, chunk_count = %s, size_bytes = %s WHERE content_hash = %s",
+        (chunk_count, size_bytes, content_hash)
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+
+# Drop one reference to a content object inside an open transaction; returns the refcount left
+def _release_content(cur, content_hash):
+    cur.execute("UPDATE content_objects SET refcount = refcount - 1 WHERE content_hash = %s", (content_hash,))
+    cur.execute("SELECT refcount FROM content_objects WHERE content_hash = %s", (content_hash,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+# Point (user_id, filename) at content_hash, adjusting both refcounts in one transaction.
+# Returns the previously referenced hash if that object is now unreferenced, else None.
+def set_content_ref(user_id, filename, content_hash):
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "SELECT content_hash FROM content_refs WHERE user_id = %s AND filename = %s FOR UPDATE",
+            (user_id, filename)
+        )
+        row = cur.fetchone()
+        previous = row[0] if row else None
+        if previous == content_hash:
+            conn.commit()
+            return None
+        cur.execute("""
+            INSERT INTO content_objects (content_hash, refcount) VALUES (%s, 1)
+            ON DUPLICATE KEY UPDATE refcount = refcount + 1
+        """, (content_hash,))
+        if previous is None:
+            cur.execute(
+                "INSERT INTO content_refs (user_id, filename, content_hash) VALUES (%s, %s, %s)",
+                (user_id, filename, content_hash)
+            )
+        else:
+            cur.execute(
+                "UPDATE content_refs SET content_hash = %s WHERE user_id = %s AND filename = %s",
+                (content_hash, user_id, filename)
+            )
+        released = previous if previous and _release_content(cur, previous) <= 0 else None
+        conn.commit()
+        return released
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+# Remove the reference from (user_id, filename). Returns its hash if the object is now unreferenced, else None.
+def remove_content_ref(user_id, filename):
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "SELECT content_hash FROM content_refs WHERE user_id = %s AND filename = %s FOR UPDATE",
+            (user_id, filename)
+        )
+        row = cur.fetchone()
+        if not row:
+            conn.commit()
+            return None
+        cur.execute("DELETE FROM content_refs WHERE user_id = %s AND filename = %s", (user_id, filename))
+        released = row[0] if _release_content(cur, row[0]) <= 0 else None
+        conn.commit()
+        return released
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+# Delete a content object row, but only while nothing references it; returns True if deleted
+def delete_unreferenced_content(content_hash):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM content_objects WHERE content_hash = %s AND refcount <= 0", (content_hash,))
+    deleted = cur.rowcount > 0
+    conn.commit()
+    cur.close()
+    conn.close()
+    return deleted
+
+# Map of content_hash -> filename for every shared document the user references
+def get_user_content_refs(user_id):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT content_hash, filename FROM content_refs WHERE user_id = %s ORDER BY created_at",
+        (user_id,)
+    )
+    refs = {}
+    for content_hash, filename in cur.fetchall():
+        # The same content under two names is searched once and shown under its first name
+        refs.setdefault(content_hash, filename)
+    cur.close()
+    conn.close()
+    return refs
+
+# Document catalog: one row per (user, filename) with what its last ingest stored.
+# A file's own vectors are id_prefix + 0 .. chunk_count - 1; content_hash is set instead
+# when its chunks live in the shared content space (see ingestion.dedup)
+DOCUMENTS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS documents (
+        user_id INT NOT NULL,
+        filename VARCHAR(255) NOT NULL,
+        status VARCHAR(16) NOT NULL DEFAULT 'processing',
+        chunk_count INT NOT NULL DEFAULT 0,
+        id_prefix VARCHAR(512) NULL,
+        content_hash CHAR(64) NULL,
+        size_bytes BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, filename)
+    )
+"""
+
+# Create the documents table if it does not exist yet
+def create_documents_table():
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(DOCUMENTS_TABLE_DDL)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+# Mark a document as being (re)ingested, creating its catalog row if needed
+def mark_document_processing(user_id, filename, size_bytes):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO documents (user_id, filename, status, size_bytes, updated_at)
+        VALUES (%s, %s, 'processing', %s, NOW())
+        ON DUPLICATE KEY UPDATE status = VALUES(status), size_bytes = VALUES(size_bytes), updated_at = VALUES(updated_at)
+    """, (user_id, filename, size_bytes))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+# Record the outcome of an ingest; returns False if the row is gone (the file was deleted meanwhile)
+def save_document(user_id, filename, status, chunk_count, id_prefix, content_hash):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        UPDATE documents SET status = %s, chunk_count = %s, id_prefix = %s, content_hash = %s, updated_at = NOW()
+        WHERE user_id = %s AND filename = %s
+    """, (status, chunk_count, id_prefix, content_hash, user_id, filename))
+    updated = cur.rowcount > 0
+    conn.commit()
+    cur.close()
+    conn.close()
+    return updated
+
+# Set only the status of a document (e.g. 'failed'), keeping its recorded vector range
+def set_document_status(user_id, filename, status):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE documents SET status = %s, updated_at = NOW() WHERE user_id = %s AND filename = %s",
+        (status, user_id, filename)
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+
+# Catalog rows for some of a user's files; returns {filename: row dict}
+def get_documents(user_id, filenames):
+    filenames = list(filenames)
+    if not filenames:
+        return {}
+    conn = get_connection()
+    cur = conn.cursor(dictionary=True)
+    placeholders = ", ".join(["%s"] * len(filenames))
+    cur.execute(f"""
+        SELECT filename, status, chunk_count, id_prefix, content_hash, size_bytes
+        FROM documents WHERE user_id = %s AND filename IN ({placeholders})
+    """, (user_id, *filenames))
+    rows = {row["filename"]: row for row in cur.fetchall()}
+    cur.close()
+    conn.close()
+    return rows
+
+# Page through a user's files, newest upload first, with their catalog details (None for files ingested before the catalog)
+def list_user_documents(user_id, limit, offset):
+    conn = get_connection()
+    cur = conn.cursor(dictionary=True)
+    cur.execute("""
+        SELECT f.filename, MAX(f.uploaded_at) AS uploaded_at, COUNT(*) AS uploads,
+               d.status, d.chunk_count, d.content_hash, d.size_bytes
+        FROM files f
+        LEFT JOIN documents d ON d.user_id = f.user_id AND d.filename = f.filename
+        WHERE f.user_id = %s
+        GROUP BY f.filename, d.status, d.chunk_count, d.content_hash, d.size_bytes
+        ORDER BY uploaded_at DESC, f.filename
+        LIMIT %s OFFSET %s
+    """, (user_id, limit, offset))
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+    return rows
+
+# Number of upload records a user has for one filename
+def count_user_files(user_id, filename):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM files WHERE user_id = %s AND filename = %s", (user_id, filename))
+    count = cur.fetchone()[0]
+    cur.close()
+    conn.close()
+    return count
+
+# Delete a user's catalog rows and upload records for the given filenames in one transaction; returns upload rows removed
+def delete_documents(user_id, filenames, include_files=True):
+    filenames = list(filenames)
+    if not filenames:
+        return 0
+    conn = get_connection()
+    cur = conn.cursor()
+    placeholders = ", ".join(["%s"] * len(filenames))
+    try:
+        cur.execute(f"DELETE FROM documents WHERE user_id = %s AND filename IN ({placeholders})", (user_id, *filenames))
+        removed = 0
+        if include_files:
+            cur.execute(f"DELETE FROM files WHERE user_id = %s AND filename IN ({placeholders})", (user_id, *filenames))
+            removed = cur.rowcount
+        conn.commit()
+        return removed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+# One summary vector per document (the normalised mean of its chunk embeddings) for
+# two-level retrieval; doc_key is the filename, or the content hash for shared documents
+DOCUMENT_VECTORS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS document_vectors (
+        owner_id INT NOT NULL,
+        doc_key VARCHAR(255) NOT NULL,
+        chunk_count INT NOT NULL DEFAULT 0,
+        vector BLOB NOT NULL,
+        PRIMARY KEY (owner_id, doc_key)
+    )
+"""
+
+# Create the document_vectors table if it does not exist yet
+def create_document_vectors_table():
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(DOCUMENT_VECTORS_TABLE_DDL)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+# Store (or replace) a document's summary vector; vector is float32 bytes
+def save_document_vector(owner_id, doc_key, chunk_count, vector):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO document_vectors (owner_id, doc_key, chunk_count, vector) VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE chunk_count = VALUES(chunk_count), vector = VALUES(vector)
+    """, (owner_id, doc_key, chunk_count, vector))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+# Summary vectors of an owner's documents as {doc_key: float32 bytes}; doc_keys=None returns all of them
+def get_document_vectors(owner_id, doc_keys=None):
+    if doc_keys is not None and not doc_keys:
+        return {}
+    conn = get_connection()
+    cur = conn.cursor()
+    if doc_keys is None:
+        cur.execute("SELECT doc_key, vector FROM document_vectors WHERE owner_id = %s", (owner_id,))
+    else:
+        doc_keys = list(doc_keys)
+        placeholders = ", ".join(["%s"] * len(doc_keys))
+        cur.execute(
+            f"SELECT doc_key, vector FROM document_vectors WHERE owner_id = %s AND doc_key IN ({placeholders})",
+            (owner_id, *doc_keys)
+        )
+    vectors = {doc_key: bytes(vector) for doc_key, vector in cur.fetchall()}
+    cur.close()
+    conn.close()
+    return vectors
+
+# Delete the summary vectors of some of an owner's documents
+def delete_document_vectors(owner_id, doc_keys):
+    doc_keys = list(doc_keys)
+    if not doc_keys:
+        return 0
+    conn = get_connection()
+    cur = conn.cursor()
+    placeholders = ", ".join(["%s"] * len(doc_keys))
+    cur.execute(
+        f"DELETE FROM document_vectors WHERE owner_id = %s AND doc_key IN ({placeholders})",
+        (owner_id, *doc_keys)
+    )
+    deleted = cur.rowcount
+    conn.commit()
+    cur.close()
+    conn.close()
+    return deleted
 
 # Create a new chat conversation for the user
 def create_new_conversation(user_id: str) -> str:
@@ -182,8 +730,23 @@ def get_conversation_history(user_id: str, chat_id: str):
         cur.close()
         conn.close()
 
-# Add messages to a conversation
-def add_messages_to_conversation(user_id: str, chat_id: str, user_message: str, bot_response: str):
+# Load the raw stored conversation (messages plus metadata), or None if it does not exist
+def get_conversation_data(user_id: str, chat_id: str):
+    conn = get_connection()
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute("""
+            SELECT conversation FROM chat_history
+            WHERE user_id = %s AND chat_id = %s
+        """, (user_id, chat_id))
+        result = cur.fetchone()
+        return json.loads(result['conversation']) if result else None
+    finally:
+        cur.close()
+        conn.close()
+
+# Add messages to a conversation; memory (rolling summary state) is saved into its metadata in the same write
+def add_messages_to_conversation(user_id: str, chat_id: str, user_message: str, bot_response: str, memory: dict = None):
     try:
         conn = get_connection()
         cur = conn.cursor(dictionary=True)
@@ -222,6 +785,8 @@ def add_messages_to_conversation(user_id: str, chat_id: str, user_message: str,
                 "timestamp": timestamp
             }
         ])
+        if memory is not None:
+            conversation_data.setdefault('metadata', {})['memory'] = memory
 
         # Update conversation in database
         if not result:
@@ -0,0 +1 @@
+# Embedding providers package
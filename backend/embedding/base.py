@@ -0,0 +1,67 @@
+"""
+Embedding provider interface shared by ingestion and querying.
+
+A provider turns texts into embeddings (lists of floats):
+
+    provider = get_embedding_provider()
+    vectors = provider.embed_texts(chunks)   # documents, batched
+    vector = provider.embed_query(question)
+
+Remote providers are called through the "gemini_embedding" upstream by
+their callers (concurrency limit, circuit breaker, fair scheduling), one
+call per batch_size texts. Local providers run on this machine's CPU and
+spread large inputs over their own threads, so callers use them directly.
+
+The backend is chosen per deployment with EMBEDDING_BACKEND:
+- "gemini" (default): Gemini embedding-001 over the network
+- "onnx": a sentence-transformer style model exported to ONNX, on CPU
+- "hashing": deterministic feature hashing, no model (offline runs and tests)
+
+Embeddings of different backends are not comparable: switching backends
+means re-ingesting into a fresh index (or one of the new dimension).
+"""
+import os
+import threading
+
+from dotenv import load_dotenv
+load_dotenv()
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "gemini").lower()
+
+
+class EmbeddingProvider:
+    # Whether calls leave the machine (and so go through the upstream protections)
+    remote = True
+    # Texts per call to embed_texts that callers should not exceed for remote providers
+    batch_size = 100
+
+    def embed_texts(self, texts):
+        """Embed document texts; returns one list of floats per text, in order."""
+        raise NotImplementedError
+
+    def embed_query(self, text):
+        return self.embed_texts([text])[0]
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_embedding_provider():
+    """Return the process-wide embedding provider for the configured backend."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                if EMBEDDING_BACKEND == "gemini":
+                    from embedding.gemini import GeminiProvider
+                    _provider = GeminiProvider()
+                elif EMBEDDING_BACKEND == "onnx":
+                    from embedding.local import OnnxProvider
+                    _provider = OnnxProvider()
+                elif EMBEDDING_BACKEND == "hashing":
+                    from embedding.local import HashingProvider
+                    _provider = HashingProvider()
+                else:
+                    raise ValueError(f"Unknown EMBEDDING_BACKEND: {EMBEDDING_BACKEND}")
+    return _provider
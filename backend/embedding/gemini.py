@@ -0,0 +1,68 @@
+"""
+Gemini embedding-001 through llama_index's GeminiEmbedding.
+
+Any llama_index embedding model can be passed in instead (the benchmark
+harness passes a local stand-in); batching then falls back to the model's
+own get_text_embedding_batch.
+"""
+import os
+import threading
+
+from embedding.base import EmbeddingProvider
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_EMBEDDING_MODEL = "models/embedding-001"
+# What the vectors are for (GeminiEmbedding's default, which its query embeddings use too)
+GEMINI_EMBEDDING_TASK = "retrieval_document"
+# Seconds one embedding request may take before the SDK gives up on it
+GEMINI_EMBED_TIMEOUT = float(os.getenv("GEMINI_EMBED_TIMEOUT", "60"))
+# Gemini accepts at most 100 texts per batch embedding request
+EMBED_BATCH_SIZE = 100
+
+
+class GeminiProvider(EmbeddingProvider):
+    remote = True
+    batch_size = EMBED_BATCH_SIZE
+
+    def __init__(self, model=None):
+        self._model = model
+        # A model passed in is used as it is, batching included
+        self._custom = model is not None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        # Created on first use: llama_index and the Gemini SDK take seconds to import
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from llama_index.embeddings.gemini import GeminiEmbedding
+                    self._model = GeminiEmbedding(
+                        api_key=GEMINI_API_KEY,
+                        model_name=GEMINI_EMBEDDING_MODEL,
+                        task_type=GEMINI_EMBEDDING_TASK,
+                        request_options={"timeout": GEMINI_EMBED_TIMEOUT},
+                    )
+        return self._model
+
+    def embed_texts(self, texts):
+        """Embed many texts in as few API calls as possible (one per EMBED_BATCH_SIZE texts)."""
+        model = self.model  # Also configures the SDK's API key
+        if self._custom:
+            return model.get_text_embedding_batch(texts)
+        # GeminiEmbedding embeds list input one text at a time; the SDK itself sends
+        # a list as a single batchEmbedContents request
+        import google.generativeai as genai
+        embeddings = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            response = genai.embed_content(
+                model=GEMINI_EMBEDDING_MODEL,
+                content=texts[start:start + EMBED_BATCH_SIZE],
+                task_type=GEMINI_EMBEDDING_TASK,
+                request_options={"timeout": GEMINI_EMBED_TIMEOUT},
+            )
+            embeddings.extend(response["embedding"])
+        return embeddings
+
+    def embed_query(self, text):
+        return self.model.get_query_embedding(text)
@@ -0,0 +1,146 @@
+"""
+Embedding on this machine's CPU: no network, no per-call cost.
+
+LocalProvider sorts a request's texts by length, cuts them into batches of
+EMBEDDING_BATCH_SIZE (similar lengths keep padding small) and runs the
+batches on a process-wide pool of EMBEDDING_THREADS threads, which also
+bounds the CPU embedding takes from the rest of the worker. A request that
+fits one batch (a query) runs on the calling thread, so it never waits
+behind an ingest in the pool.
+
+- OnnxProvider: a sentence-transformer style model exported to ONNX
+  (EMBEDDING_MODEL_DIR holding model.onnx and tokenizer.json, e.g.
+  all-MiniLM-L6-v2), mean-pooled over tokens. Needs the optional
+  onnxruntime and tokenizers packages. Each batch runs single-threaded in
+  onnxruntime, so EMBEDDING_THREADS batches use that many cores.
+- HashingProvider: signed feature hashing of word tokens into
+  EMBEDDING_DIM buckets. Lexical, not semantic, but deterministic and
+  dependency-free: for offline development and tests.
+"""
+import hashlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from embedding.base import EmbeddingProvider
+
+# Threads embedding batches in parallel (one core each)
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", str(os.cpu_count() or 1)))
+# Texts per model call
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# ONNX model directory and the token limit texts are truncated to
+EMBEDDING_MODEL_DIR = os.getenv("EMBEDDING_MODEL_DIR", "./models/all-MiniLM-L6-v2")
+EMBEDDING_MAX_TOKENS = int(os.getenv("EMBEDDING_MAX_TOKENS", "256"))
+# Hashing embedder dimension (768 matches Gemini embedding-001, so an existing index fits)
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "768"))
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class LocalProvider(EmbeddingProvider):
+    remote = False
+
+    def __init__(self, threads=None, batch_size=None):
+        self.threads = max(1, threads or EMBEDDING_THREADS)
+        self.batch_size = max(1, batch_size or EMBEDDING_BATCH_SIZE)
+        self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="embed") if self.threads > 1 else None
+
+    def _embed_batch(self, texts):
+        """Embed one batch; returns a float32 matrix with one normalised row per text."""
+        raise NotImplementedError
+
+    def embed_texts(self, texts):
+        if not texts:
+            return []
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [[texts[i] for i in order[start:start + self.batch_size]]
+                   for start in range(0, len(order), self.batch_size)]
+        if self._pool is None or len(batches) == 1:
+            matrices = [self._embed_batch(batch) for batch in batches]
+        else:
+            matrices = list(self._pool.map(self._embed_batch, batches))
+        embeddings = [None] * len(texts)
+        for i, row in zip(order, np.vstack(matrices)):
+            embeddings[i] = row.tolist()
+        return embeddings
+
+
+class OnnxProvider(LocalProvider):
+    def __init__(self, model_dir=None, max_tokens=None, threads=None, batch_size=None):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ImportError("onnxruntime and tokenizers are required for EMBEDDING_BACKEND=onnx")
+        super().__init__(threads, batch_size)
+        model_dir = model_dir or EMBEDDING_MODEL_DIR
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_tokens or EMBEDDING_MAX_TOKENS)
+        # Pad each batch to its longest text only
+        self.tokenizer.enable_padding()
+        options = onnxruntime.SessionOptions()
+        # Parallelism comes from running batches on separate threads; a shared session is thread-safe
+        options.intra_op_num_threads = 1
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _embed_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+        # Token embeddings (batch, tokens, dim), averaged over the real (unpadded) tokens
+        hidden = self.session.run(None, feeds)[0]
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        return _normalize(pooled)
+
+
+_TOKEN_RE = re.compile(r"\w+")
+# Hash of every token seen so far; vocabularies repeat, so most lookups skip blake2b
+_token_hashes = {}
+_TOKEN_CACHE_SIZE = 500_000
+
+
+def _token_hash(token):
+    value = _token_hashes.get(token)
+    if value is None:
+        value = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+        if len(_token_hashes) < _TOKEN_CACHE_SIZE:
+            _token_hashes[token] = value
+    return value
+
+
+def hash_embeddings(texts, dim=EMBEDDING_DIM):
+    """Signed feature hashing of lower-cased word tokens, L2-normalised; one row per text."""
+    hashes, rows = [], []
+    for row, text in enumerate(texts):
+        tokens = _TOKEN_RE.findall(text.lower())
+        hashes.extend(map(_token_hash, tokens))
+        rows.append(len(tokens))
+    values = np.array(hashes, dtype=np.uint64)
+    # Bucket from the hash modulo dim, sign from its top bit
+    cells = np.repeat(np.arange(len(texts), dtype=np.int64) * dim, rows) + (values % np.uint64(dim)).astype(np.int64)
+    signs = np.where(values >> np.uint64(63), 1.0, -1.0)
+    matrix = np.bincount(cells, weights=signs, minlength=len(texts) * dim).reshape(len(texts), dim)
+    return _normalize(matrix)
+
+
+class HashingProvider(LocalProvider):
+    def __init__(self, dim=None, threads=None, batch_size=None):
+        super().__init__(threads, batch_size)
+        self.dim = dim or EMBEDDING_DIM
+
+    def _embed_batch(self, texts):
+        return hash_embeddings(texts, self.dim)
@@ -0,0 +1,64 @@
+"""
+Reading uploaded .zip / .tar / .tar.gz archives one entry at a time.
+
+Entries are listed from the archive's own index (the zip central directory,
+or one streamed pass over tar headers) so they can be filtered and recorded
+before anything is decompressed; read_entries() then decompresses them in
+archive order, holding only the current entry in memory.
+"""
+import posixpath
+import tarfile
+import zipfile
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz')
+
+
+def is_archive(filename):
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def clean_entry_name(name):
+    """Normalized relative path of an archive entry, or None for unsafe or metadata entries."""
+    name = name.replace("\\", "/")
+    parts = [part for part in name.split("/") if part not in ("", ".")]
+    if not parts or ".." in parts:
+        return None
+    # macOS resource forks and similar archive noise
+    if parts[0] == "__MACOSX" or parts[-1].startswith("._"):
+        return None
+    return posixpath.join(*parts)
+
+
+def list_entries(path, filename):
+    """(entry name, uncompressed size) for every regular file in the archive."""
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            return [(info.filename, info.file_size) for info in archive.infolist() if not info.is_dir()]
+    with tarfile.open(path, mode="r:*") as archive:
+        return [(member.name, member.size) for member in archive if member.isfile()]
+
+
+def read_entries(path, filename, names, max_size):
+    """
+    Yield (entry name, bytes) for the wanted entries in archive order. An entry
+    larger than max_size once decompressed yields (name, None) instead. A name
+    recorded more than once is read from its first record only, the one
+    list_entries() reported first.
+    """
+    wanted = set(names)
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.filename in wanted:
+                    wanted.discard(info.filename)
+                    with archive.open(info) as entry:
+                        data = entry.read(max_size + 1)
+                    yield info.filename, data if len(data) <= max_size else None
+        return
+    with tarfile.open(path, mode="r:*") as archive:
+        for member in archive:
+            if member.isfile() and member.name in wanted:
+                wanted.discard(member.name)
+                entry = archive.extractfile(member)
+                data = entry.read(max_size + 1)
+                yield member.name, data if len(data) <= max_size else None
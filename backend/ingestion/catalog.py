@@ -0,0 +1,145 @@
+"""
+Document catalog: what each of a user's files put into the search indexes.
+
+Every ingest records, per (user, filename), how many chunks it stored and
+under which vector id prefix (ids are "<user_id>_<filename>_<n>" for
+n < chunk_count), or the content hash when the chunks live in the shared
+content space. That makes a file's vectors enumerable without touching the
+vector store, so deleting a file removes exactly its ids in bulk batches: no
+list scan, no similarity query. Files ingested before the catalog existed
+fall back to one prefix listing.
+
+Re-ingesting a file that now has fewer chunks (or moved to the shared space)
+drops the ids the new version no longer covers. A first ingest that fails
+has no recorded range either, so its leftovers are found by listing too.
+"""
+import logging
+import re
+import threading
+
+from db import models
+from ingestion import dedup
+from retrieval.two_level import forget_documents
+
+_table_ready = False
+_table_lock = threading.Lock()
+
+
+def _ensure_table():
+    global _table_ready
+    if not _table_ready:
+        with _table_lock:
+            if not _table_ready:
+                models.create_documents_table()
+                _table_ready = True
+
+
+def file_id_prefix(user_id, filename):
+    return f"{user_id}_{filename}_"
+
+
+def _listed_vector_ids(vector_store, user_id, filename):
+    # Only for files without a catalog row; check the suffix so "a.txt" does not match "a.txt_v2.txt"
+    prefix = file_id_prefix(user_id, filename)
+    pattern = re.compile(re.escape(prefix) + r"\d+$")
+    return [vector_id for vector_id in vector_store.list_ids(user_id, prefix) if pattern.match(vector_id)]
+
+
+def delete_vectors(user_id, ids, vector_store=None):
+    """Remove chunks from the user's vector store, BM25 index and chunk store (each batches internally)."""
+    from retrieval.bm25 import get_lexical_index
+    from retrieval.chunk_store import delete_chunk_texts
+    from vectorstore.base import get_vector_store
+    if not ids:
+        return 0
+    (vector_store or get_vector_store()).delete(user_id, ids)
+    get_lexical_index(user_id).delete(ids)
+    delete_chunk_texts(ids)
+    return len(ids)
+
+
+def ingest_started(user_id, filename, size_bytes):
+    _ensure_table()
+    models.mark_document_processing(user_id, filename, size_bytes)
+
+
+def ingest_failed(user_id, filename):
+    _ensure_table()
+    models.set_document_status(user_id, filename, "failed")
+
+
+def ingest_finished(user_id, filename, chunk_count, content_hash=None):
+    """Record a successful ingest and drop the ids a previous version stored beyond it."""
+    _ensure_table()
+    previous = models.get_documents(user_id, [filename]).get(filename)
+    prefix = None if content_hash else file_id_prefix(user_id, filename)
+    if previous is None or not models.save_document(user_id, filename, "ready", chunk_count, prefix, content_hash):
+        # The file was deleted while it was being ingested: take back what was just stored
+        logging.info(f"{filename} of user {user_id} was deleted during ingestion, removing its chunks")
+        if content_hash:
+            dedup.release_file(user_id, filename)
+            dedup.purge_content(content_hash)
+        else:
+            delete_vectors(user_id, [f"{prefix}{i}" for i in range(chunk_count)])
+            forget_documents(user_id, [filename])
+        return
+    if previous["id_prefix"]:
+        keep = 0 if content_hash else chunk_count
+        stale = [f"{previous['id_prefix']}{i}" for i in range(keep, previous["chunk_count"])]
+        if stale:
+            delete_vectors(user_id, stale)
+
+
+def remove_files(user_id, filenames, vector_store=None):
+    """
+    Remove the chunks of the given files and their catalog rows (upload
+    records are left to the caller). Returns the number of the user's own
+    vectors deleted; shared content is released instead.
+    """
+    from vectorstore.base import get_vector_store
+    _ensure_table()
+    vector_store = vector_store or get_vector_store()
+    documents = models.get_documents(user_id, filenames)
+    ids = []
+    for filename in filenames:
+        document = documents.get(filename)
+        if document is not None and document["id_prefix"]:
+            ids.extend(f"{document['id_prefix']}{i}" for i in range(document["chunk_count"]))
+        elif document is None or not document["content_hash"]:
+            # No recorded range: a file from before the catalog, or a first ingest that never finished
+            ids.extend(_listed_vector_ids(vector_store, user_id, filename))
+        # Shared content: drop the reference; its vectors go with the last one
+        dedup.release_file(user_id, filename)
+    removed = delete_vectors(user_id, ids, vector_store)
+    forget_documents(user_id, filenames)
+    models.delete_documents(user_id, filenames, include_files=False)
+    return removed
+
+
+def delete_document(user_id, filename):
+    """Delete one of a user's files everywhere. Returns a summary, or None if the user has no such file."""
+    _ensure_table()
+    if not models.get_documents(user_id, [filename]) and not models.count_user_files(user_id, filename):
+        return None
+    chunks = remove_files(user_id, [filename])
+    uploads = models.delete_documents(user_id, [filename])
+    logging.info(f"Deleted {filename} of user {user_id}: {chunks} vectors, {uploads} upload records")
+    return {"filename": filename, "vectors_deleted": chunks, "uploads_deleted": uploads}
+
+
+def list_documents(user_id, limit=100, offset=0):
+    _ensure_table()
+    documents = []
+    for row in models.list_user_documents(user_id, limit, offset):
+        uploaded_at = row["uploaded_at"]
+        documents.append({
+            "filename": row["filename"],
+            "uploaded_at": uploaded_at.isoformat() if hasattr(uploaded_at, "isoformat") else uploaded_at,
+            "uploads": row["uploads"],
+            # Files ingested before the catalog existed have no recorded details
+            "status": row["status"] or "unknown",
+            "chunk_count": row["chunk_count"],
+            "size_bytes": row["size_bytes"],
+            "shared": bool(row["content_hash"]),
+        })
+    return documents
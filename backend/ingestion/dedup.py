@@ -0,0 +1,151 @@
+"""
+Content-addressed deduplication of uploads across users.
+
+A file is identified by the SHA-256 of its extension and bytes (the
+extension decides how the bytes are parsed and chunked). The first upload
+of some content is parsed, chunked and embedded once into a shared space
+(vector, chunk and BM25 owner SHARED_CONTENT_OWNER, ids "c_<hash>_<n>");
+every later upload of the same file type and bytes, by any user, only adds
+a (user, filename) reference in content_refs. Queries search the user's own
+vectors plus the shared vectors of the content they reference, and show
+each shared chunk under the filename that user gave it.
+
+References are counted: replacing or deleting a user's file drops its
+reference, and the shared vectors, chunks and index entries go once the last
+reference is gone.
+
+Deduplication is opt-in (CONTENT_DEDUP=on). Shared content lives under one
+owner, so it gives up the per-user isolation of the vector store namespaces
+and BM25 indexes, and every query of a user with shared files adds a
+content-hash filter that grows with those files. It pays off where many
+users upload the same documents. Note also that an upload matching existing
+content completes much faster, which tells the uploader that someone has
+uploaded the identical file before.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+from monitoring.metrics import counter
+
+# "off" (default) or "on"; turning it off again stores new uploads per user, existing references keep working
+CONTENT_DEDUP = os.getenv("CONTENT_DEDUP", "off").lower() == "on"
+# Vector store / chunk store / lexical index owner for shared content (no real user has id 0)
+SHARED_CONTENT_OWNER = 0
+# How long a user's reference list is cached per worker; local changes invalidate it at once
+CONTENT_REFS_CACHE_SECONDS = float(os.getenv("CONTENT_REFS_CACHE_SECONDS", "30"))
+
+DEDUP_HITS = counter("rag_dedup_hits_total", "Uploads that matched already-ingested content")
+DEDUP_EMBEDDINGS_SAVED = counter("rag_dedup_embeddings_saved_total", "Chunk embeddings (and vectors) not created again thanks to deduplication")
+DEDUP_BYTES_SAVED = counter("rag_dedup_bytes_saved_total", "Uploaded bytes not parsed or stored again thanks to deduplication")
+DEDUP_PURGED = counter("rag_dedup_objects_purged_total", "Shared documents removed after their last reference")
+
+_tables_ready = False
+_tables_lock = threading.Lock()
+_refs_cache = {}
+_refs_lock = threading.Lock()
+
+
+def _ensure_tables():
+    global _tables_ready
+    if not _tables_ready:
+        with _tables_lock:
+            if not _tables_ready:
+                from db.models import create_content_tables
+                create_content_tables()
+                _tables_ready = True
+
+
+def content_hash(contents, filename):
+    digest = hashlib.sha256(os.path.splitext(filename)[1].lower().encode("utf-8") + b"\0")
+    digest.update(contents)
+    return digest.hexdigest()
+
+
+def shared_chunk_prefix(digest):
+    return f"c_{digest}_"
+
+
+def _invalidate(user_id):
+    with _refs_lock:
+        _refs_cache.pop(user_id, None)
+
+
+def user_content(user_id):
+    """{content_hash: filename} of the shared documents this user references (cached briefly)."""
+    from db.models import get_user_content_refs
+    # Consulted even with CONTENT_DEDUP=off, which only stops new uploads from being shared
+    now = time.monotonic()
+    with _refs_lock:
+        cached = _refs_cache.get(user_id)
+    if cached and cached[0] > now:
+        return cached[1]
+    _ensure_tables()
+    refs = get_user_content_refs(user_id)
+    with _refs_lock:
+        _refs_cache[user_id] = (now + CONTENT_REFS_CACHE_SECONDS, refs)
+    return refs
+
+
+def reference_content(user_id, filename, digest, size_bytes):
+    """
+    Point (user_id, filename) at digest. Returns the chunk count if the content
+    is already fully ingested (nothing left to do), else None.
+    """
+    from db.models import get_content_object, set_content_ref
+    _ensure_tables()
+    released = set_content_ref(user_id, filename, digest)
+    _invalidate(user_id)
+    if released:
+        purge_content(released)
+    existing = get_content_object(digest)
+    if existing and existing["ready"]:
+        DEDUP_HITS.inc()
+        DEDUP_EMBEDDINGS_SAVED.inc(existing["chunk_count"])
+        DEDUP_BYTES_SAVED.inc(size_bytes)
+        logging.info(f"Reusing ingested content {digest[:12]} ({existing['chunk_count']} chunks) for user {user_id}")
+        return existing["chunk_count"]
+    return None
+
+
+def content_ingested(digest, chunk_count, size_bytes):
+    from db.models import mark_content_ready
+    mark_content_ready(digest, chunk_count, size_bytes)
+
+
+def release_file(user_id, filename):
+    """Drop the user's reference to filename, purging the shared content if it was the last one."""
+    from db.models import remove_content_ref
+    _ensure_tables()
+    released = remove_content_ref(user_id, filename)
+    _invalidate(user_id)
+    if released:
+        purge_content(released)
+
+
+def purge_content(digest):
+    """Remove an unreferenced document's shared vectors, chunk texts and lexical entries."""
+    from db.models import delete_unreferenced_content
+    from retrieval.bm25 import get_lexical_index
+    from retrieval.chunk_store import delete_chunk_texts
+    from retrieval.two_level import forget_documents
+    from vectorstore.base import get_vector_store
+
+    # The row goes first and only while unreferenced, so a concurrent new reference keeps the content
+    if not delete_unreferenced_content(digest):
+        return 0
+    vector_store = get_vector_store()
+    prefix = shared_chunk_prefix(digest)
+    pattern = re.compile(re.escape(prefix) + r"\d+$")
+    ids = [vector_id for vector_id in vector_store.list_ids(SHARED_CONTENT_OWNER, prefix) if pattern.match(vector_id)]
+    if ids:
+        vector_store.delete(SHARED_CONTENT_OWNER, ids)
+        get_lexical_index(SHARED_CONTENT_OWNER).delete(ids)
+        delete_chunk_texts(ids)
+    forget_documents(SHARED_CONTENT_OWNER, [digest])
+    DEDUP_PURGED.inc()
+    logging.info(f"Purged shared content {digest[:12]} ({len(ids)} chunks)")
+    return len(ids)
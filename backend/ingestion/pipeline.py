@@ -5,9 +5,22 @@ import csv
 import xml.etree.ElementTree as ET
 import logging
 import os
+import threading
+import numpy as np
 from io import StringIO
 from db.models import save_file_metadata
 from api.notifications import send_notification
+from monitoring.metrics import span
+from upstream.client import get_upstream
+from upstream.scheduler import BULK
+from monitoring.usage import usage, estimate_tokens
+from concurrent.futures import ThreadPoolExecutor
+from ingestion.tabular import TABULAR_EXTENSIONS, iter_table_chunks  # Streaming CSV/TSV/Excel row blocks
+from ingestion.structured import STRUCTURED_EXTENSIONS, iter_structured_chunks  # Path-annotated JSON/XML/YAML records
+from ingestion import dedup  # Content-addressed sharing of identical uploads
+from ingestion import catalog  # Per-file record of the chunks each ingest stored
+from retrieval.two_level import record_document  # Per-document summary vectors
+from embedding.base import get_embedding_provider  # Gemini or a local CPU model, per deployment
 
 # Load environment variables early
 from dotenv import load_dotenv
@@ -19,39 +32,30 @@ PINECONE_ENV = os.getenv("PINECONE_ENV")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-# Document parsing libraries
-try:
-    from PyPDF2 import PdfReader
-except ImportError:
-    PdfReader = None
-    logging.warning("PyPDF2 not installed. PDF parsing will not work.")
+# Background ingestion can wait much longer than a chat request for an upstream slot
+INGEST_MAX_WAIT_SECONDS = float(os.getenv("INGEST_MAX_WAIT_SECONDS", "60"))
+# Embedding calls in flight per file; the upstream scheduler keeps files from different users fair
+INGEST_EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))
+# Chunks embedded and written per window, bounding memory for very large files
+INGEST_WINDOW_CHUNKS = int(os.getenv("INGEST_WINDOW_CHUNKS", "500"))
 
-try:
-    from docx import Document
-except ImportError:
-    Document = None
-    logging.warning("python-docx not installed. DOCX parsing will not work.")
-
-try:
-    import openpyxl
-except ImportError:
-    openpyxl = None
-    logging.warning("openpyxl not installed. Excel parsing will not work.")
-
-try:
-    from pptx import Presentation
-except ImportError:
-    Presentation = None
-    logging.warning("python-pptx not installed. PowerPoint parsing will not work.")
-
-# LlamaIndex and Pinecone imports
-from llama_index.embeddings.google import GeminiEmbedding
+# Document parsing libraries and the Pinecone client are imported on first use:
+# together they take seconds to import, and connecting at import time would stop a
+# worker from starting (or the app from starting at all) without network
+_pinecone_index = None
+_client_lock = threading.Lock()
 
 
 def get_pinecone_index():
-    from pinecone import Pinecone
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    return pc.Index(PINECONE_INDEX_NAME)
+    """Process-wide Pinecone index handle, connected on first use."""
+    global _pinecone_index
+    if _pinecone_index is None:
+        with _client_lock:
+            if _pinecone_index is None:
+                from pinecone import Pinecone
+                pc = Pinecone(api_key=PINECONE_API_KEY)
+                _pinecone_index = pc.Index(PINECONE_INDEX_NAME)
+    return _pinecone_index
 
 
 def parse_text_file(contents, encoding='utf-8'):
@@ -68,10 +72,10 @@ def parse_text_file(contents, encoding='utf-8'):
 def parse_markdown(contents):
     return parse_text_file(contents)
 
-def parse_csv(contents):
+def parse_csv(contents, delimiter=','):
     try:
         text_content = parse_text_file(contents)
-        csv_reader = csv.reader(StringIO(text_content))
+        csv_reader = csv.reader(StringIO(text_content), delimiter=delimiter)
         rows = list(csv_reader)
         text_parts = []
         for i, row in enumerate(rows):
@@ -115,7 +119,9 @@ def parse_html(contents):
         return parse_text_file(contents)
 
 def parse_pdf(contents):
-    if PdfReader is None:
+    try:
+        from PyPDF2 import PdfReader
+    except ImportError:
         raise ImportError("PyPDF2 is required for PDF parsing")
     with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
         tmp.write(contents)
@@ -129,7 +135,9 @@ def parse_pdf(contents):
         os.remove(tmp_path)
 
 def parse_docx(contents):
-    if Document is None:
+    try:
+        from docx import Document
+    except ImportError:
         raise ImportError("python-docx is required for DOCX parsing")
     with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp:
         tmp.write(contents)
@@ -146,7 +154,9 @@ def parse_docx(contents):
         os.remove(tmp_path)
 
 def parse_excel(contents, filename):
-    if openpyxl is None:
+    try:
+        import openpyxl
+    except ImportError:
         raise ImportError("openpyxl is required for Excel parsing")
     with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename)[1]) as tmp:
         tmp.write(contents)
@@ -166,7 +176,9 @@ def parse_excel(contents, filename):
         os.remove(tmp_path)
 
 def parse_powerpoint(contents, filename):
-    if Presentation is None:
+    try:
+        from pptx import Presentation
+    except ImportError:
         raise ImportError("python-pptx is required for PowerPoint parsing")
     with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename)[1]) as tmp:
         tmp.write(contents)
@@ -197,6 +209,7 @@ def parse_file(contents, filename):
         if ext == '.txt': return parse_text_file(contents)
         elif ext == '.md': return parse_markdown(contents)
         elif ext == '.csv': return parse_csv(contents)
+        elif ext == '.tsv': return parse_csv(contents, delimiter='\t')
         elif ext == '.json': return parse_json(contents)
         elif ext == '.xml': return parse_xml(contents)
         elif ext in ['.html', '.htm']: return parse_html(contents)
@@ -220,42 +233,195 @@ def chunk_text(text, chunk_size=300, overlap=50):
     words = text.split()
     return [" ".join(words[i:i + chunk_size]) for i in range(0, len(words), chunk_size - overlap)]
 
-def store_embeddings(user_id, filename, chunks):
+def store_embeddings(user_id, filename, chunks, content_hash=None, uploaded_at=None):
+    """
+    Embed and store chunks (a list or any iterable) in windows of
+    INGEST_WINDOW_CHUNKS, so a streamed file never holds more than one window
+    of chunks and embeddings at once. Returns the number of chunks stored.
+    With content_hash the chunks go to the shared content space instead of
+    the user's own (see ingestion.dedup). Every chunk records the file's
+    extension and upload time (default: now) for scoped queries.
+    """
     logging.info(f"Storing embeddings for {filename}, user {user_id}")
-    embed_model = GeminiEmbedding(api_key=GEMINI_API_KEY, model_name="models/embedding-001")
-    pinecone_index = get_pinecone_index()
-    for i, chunk in enumerate(chunks):
-        embedding = embed_model.get_text_embedding(chunk)
-        pinecone_index.upsert(vectors=[{
-            "id": f"{user_id}_{filename}_{i}",
-            "values": embedding,
-            "metadata": {
-                "text": chunk,
+    provider = get_embedding_provider()
+    # Epoch seconds, so the vector store can range-filter on it
+    uploaded_at = int((uploaded_at or datetime.datetime.now(datetime.timezone.utc)).timestamp())
+
+    # Ingestion is bulk work: it only gets the embedding slots chat queries leave over
+    def embed_remote(batch):
+        with span("ingest_embed"):
+            return get_upstream("gemini_embedding").call(
+                provider.embed_texts, batch,
+                max_wait=INGEST_MAX_WAIT_SECONDS, priority=BULK, user_id=user_id,
+            )
+
+    def embed(window):
+        if not provider.remote:
+            # Local models spread the window over their own threads
+            with span("ingest_embed"):
+                return provider.embed_texts(window)
+        batches = [window[start:start + provider.batch_size] for start in range(0, len(window), provider.batch_size)]
+        return [embedding for batch in pool.map(embed_remote, batches) for embedding in batch]
+
+    stored = 0
+    # Chunk ids that may have been written, including a window that failed halfway
+    attempted = 0
+    # Running sum of the chunk embeddings: the document's summary vector for two-level retrieval
+    embedding_sum = None
+
+    def store(window):
+        nonlocal stored, attempted, embedding_sum
+        embeddings = embed(window)
+        attempted = stored + len(window)
+        _store_window(user_id, filename, window, embeddings, stored, content_hash, uploaded_at)
+        window_sum = np.asarray(embeddings, dtype=np.float32).sum(axis=0)
+        embedding_sum = window_sum if embedding_sum is None else embedding_sum + window_sum
+        stored += len(window)
+
+    try:
+        # A pool per file (not a shared one) so a large upload cannot queue ahead of other users' files
+        with ThreadPoolExecutor(max_workers=INGEST_EMBED_CONCURRENCY, thread_name_prefix="ingest-embed") as pool:
+            window = []
+            for chunk in chunks:
+                window.append(chunk)
+                if len(window) >= INGEST_WINDOW_CHUNKS:
+                    store(window)
+                    window = []
+            if window:
+                store(window)
+    except Exception:
+        # A file that fails partway must not stay half searchable; shared content is purged with its last reference instead
+        if attempted and not content_hash:
+            prefix = catalog.file_id_prefix(user_id, filename)
+            try:
+                catalog.delete_vectors(user_id, [f"{prefix}{i}" for i in range(attempted)])
+            except Exception as cleanup_error:
+                logging.error(f"Error removing the {attempted} chunks stored for {filename} before it failed: {cleanup_error}")
+        raise
+    if stored:
+        with span("ingest_document_vector"):
+            record_document(user_id, content_hash or filename, embedding_sum, stored, shared=bool(content_hash))
+    return stored
+
+# Store one window of chunks whose ids start at chunk number offset
+def _store_window(user_id, filename, chunks, embeddings, offset, content_hash=None, uploaded_at=None):
+    from vectorstore.base import get_vector_store
+    from retrieval.bm25 import get_lexical_index
+    from retrieval.chunk_store import put_chunks
+    usage.record(user_id, embedding_tokens=sum(estimate_tokens(chunk) for chunk in chunks))
+
+    # Shared content is owned by nobody in particular; readers find it through their content refs
+    owner = dedup.SHARED_CONTENT_OWNER if content_hash else user_id
+    extension = os.path.splitext(filename)[1].lower()
+    vectors, lexical_metadata = [], []
+    for i, embedding in enumerate(embeddings, start=offset):
+        if content_hash:
+            # Shared chunks carry nothing user-specific; scopes select them through the user's references
+            vector_id = f"{dedup.shared_chunk_prefix(content_hash)}{i}"
+            metadata = {"user_id": owner, "content_hash": content_hash, "extension": extension, "chunk_id": i}
+        else:
+            vector_id = f"{user_id}_{filename}_{i}"
+            metadata = {
                 "user_id": user_id,
                 "filename": filename,
+                "extension": extension,
+                "uploaded_at": uploaded_at,
                 "chunk_id": i
             }
-        }])
+        # Chunk text goes to the chunk store, not into vector metadata
+        vectors.append({"id": vector_id, "values": embedding, "metadata": metadata})
+        lexical_metadata.append({key: value for key, value in metadata.items() if key != "user_id"})
+    ids = [vector["id"] for vector in vectors]
+    # Write the text first so no searchable vector points at a missing chunk
+    with span("ingest_chunk_store"):
+        put_chunks(owner, ids, chunks)
+    # One batched write instead of a round-trip per chunk
+    with span("ingest_upsert"):
+        get_upstream("vector_store").call(
+            get_vector_store().upsert, owner, vectors,
+            max_wait=INGEST_MAX_WAIT_SECONDS, priority=BULK, user_id=user_id,
+        )
+    # Keep the owner's BM25 index in step so exact identifiers stay searchable
+    with span("ingest_lexical"):
+        get_lexical_index(owner).add_documents(ids, chunks, lexical_metadata)
 
-def process_file(contents, filename, user_id):
+# Yield chunks from a streaming parser; if it fails before producing anything, chunk the raw text instead
+def _with_text_fallback(chunks, contents, filename):
+    produced = False
+    try:
+        for chunk in chunks:
+            produced = True
+            yield chunk
+    except Exception as e:
+        if produced:
+            raise
+        logging.error(f"Error parsing file {filename}, indexing it as text: {e}")
+        yield from chunk_text(parse_text_file(contents))
+
+def process_file(contents, filename, user_id, notify=True, uploaded_at=None):
+    """
+    Parse, chunk, embed and store one file; returns the number of chunks stored.
+    notify=False leaves user notifications to the caller (bulk uploads send one summary).
+    uploaded_at (the time saved with the upload record) is stored on every chunk.
+    """
+    def notify_user(message):
+        if notify:
+            send_notification(user_id, message)
+
+    digest = None
     try:
         logging.info(f"Processing file {filename} for user {user_id}")
-        text = parse_file(contents, filename)
-        if not text.strip():
-            send_notification(user_id, f"Failed to extract text from '{filename}'.")
-            return
-        chunks = chunk_text(text)
-        if not chunks:
-            send_notification(user_id, f"No content could be extracted from '{filename}'.")
-            return
-        store_embeddings(user_id, filename, chunks)
-        send_notification(user_id, f"Your file '{filename}' has been processed successfully with {len(chunks)} chunks.")
+        catalog.ingest_started(user_id, filename, len(contents))
+        if dedup.CONTENT_DEDUP:
+            # Identical bytes uploaded before (by anyone) are already parsed, chunked and embedded
+            digest = dedup.content_hash(contents, filename)
+            existing = dedup.reference_content(user_id, filename, digest, len(contents))
+            if existing is not None:
+                catalog.ingest_finished(user_id, filename, existing, digest)
+                notify_user(f"Your file '{filename}' has been processed successfully with {existing} chunks.")
+                return existing
+        ext = os.path.splitext(filename)[1].lower()
+        if ext in TABULAR_EXTENSIONS:
+            # Tables stream straight into row-block chunks, falling back to plain text if they do not parse
+            chunks = _with_text_fallback(iter_table_chunks(contents, filename), contents, filename)
+        elif ext in STRUCTURED_EXTENSIONS:
+            # Data files stream as path-annotated records, falling back to plain text if they do not parse
+            chunks = _with_text_fallback(iter_structured_chunks(contents, filename), contents, filename)
+        else:
+            with span("ingest_parse"):
+                text = parse_file(contents, filename)
+            if not text.strip():
+                if digest:
+                    dedup.release_file(user_id, filename)
+                catalog.ingest_failed(user_id, filename)
+                notify_user(f"Failed to extract text from '{filename}'.")
+                return 0
+            with span("ingest_chunk"):
+                chunks = chunk_text(text)
+        # Two first uploads of the same content racing here write the same ids, so either may win
+        count = store_embeddings(user_id, filename, chunks, content_hash=digest, uploaded_at=uploaded_at)
+        if not count:
+            if digest:
+                dedup.release_file(user_id, filename)
+            catalog.ingest_failed(user_id, filename)
+            notify_user(f"No content could be extracted from '{filename}'.")
+            return 0
+        if digest:
+            dedup.content_ingested(digest, count, len(contents))
+        catalog.ingest_finished(user_id, filename, count, digest)
+        notify_user(f"Your file '{filename}' has been processed successfully with {count} chunks.")
+        return count
     except Exception as e:
         logging.error(f"Error processing file {filename}: {e}")
-        send_notification(user_id, f"Error processing file '{filename}': {str(e)}")
+        if digest:
+            # Do not leave a reference to content that never became searchable
+            try:
+                dedup.release_file(user_id, filename)
+            except Exception as release_error:
+                logging.error(f"Error releasing content reference for {filename}: {release_error}")
+        try:
+            catalog.ingest_failed(user_id, filename)
+        except Exception as catalog_error:
+            logging.error(f"Error recording failed ingest of {filename}: {catalog_error}")
+        notify_user(f"Error processing file '{filename}': {str(e)}")
         raise
-
-from llama_index.embeddings.gemini import GeminiEmbedding
-
-embed_model = GeminiEmbedding(api_key=GEMINI_API_KEY, model_name="models/embedding-001")
-pinecone_index = get_pinecone_index()
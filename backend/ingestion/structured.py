@@ -0,0 +1,273 @@
+"""
+Streaming ingestion for structured data files (.json, .xml, .yaml, .yml).
+
+Documents are walked as a stream of parse events instead of being loaded and
+re-serialized, and every scalar becomes one path-annotated record:
+
+    orders[12].customer.name: Alice
+    catalog.book[3].@id: bk103
+
+Records are packed into chunks of about STRUCTURED_CHUNK_WORDS words. Each
+line names its own position in the document, so a chunk needs no indentation
+or closing brackets to be understood, which makes for far fewer and denser
+chunks than pretty-printed JSON or serialized XML.
+
+- JSON streams through ijson when it is installed, otherwise the document is
+  decoded with json.loads and the resulting tree is walked
+- XML streams through ElementTree.iterparse, freeing each element once read;
+  text between child elements (mixed content) becomes parent.#text records
+- YAML streams through the PyYAML event parser (no objects are constructed);
+  the documents of a multi-document stream are read in order, each with
+  paths relative to its own root
+"""
+import io
+import json
+import logging
+import os
+import re
+import xml.etree.ElementTree as ET
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+STRUCTURED_EXTENSIONS = ('.json', '.xml', '.yaml', '.yml')
+# Target words per chunk of records
+STRUCTURED_CHUNK_WORDS = int(os.getenv("STRUCTURED_CHUNK_WORDS", "300"))
+
+_PLAIN_KEY_RE = re.compile(r"^[A-Za-z_@$][\w\-@$]*$")
+
+# Parse events shared by the JSON and YAML readers
+START_MAP, KEY, END_MAP, START_ARRAY, END_ARRAY, VALUE = "start_map", "key", "end_map", "start_array", "end_array", "value"
+
+
+def _key_segment(key):
+    return f".{key}" if _PLAIN_KEY_RE.match(key) else f"[{json.dumps(key, ensure_ascii=False)}]"
+
+
+def records_from_events(events, prefix=""):
+    """Turn a JSON-like event stream into (path, value) records, tracking keys and array indexes."""
+    path = [prefix] if prefix else []
+    # One frame per open container: [is_array, next_index]
+    containers = []
+
+    def enter_value():
+        # A value inside an array takes the next index as its path segment
+        if containers and containers[-1][0]:
+            path.append(f"[{containers[-1][1]}]")
+            containers[-1][1] += 1
+
+    def leave_value():
+        # Drop the key or index segment that led to the finished value
+        if containers:
+            path.pop()
+
+    for event, value in events:
+        if event == KEY:
+            path.append(_key_segment(str(value)))
+        elif event in (START_MAP, START_ARRAY):
+            enter_value()
+            containers.append([event == START_ARRAY, 0])
+        elif event in (END_MAP, END_ARRAY):
+            containers.pop()
+            leave_value()
+        else:
+            enter_value()
+            yield "".join(path).lstrip("."), value
+            leave_value()
+
+
+def _scalar(value):
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _tree_events(node):
+    if isinstance(node, dict):
+        yield START_MAP, None
+        for key, value in node.items():
+            yield KEY, key
+            yield from _tree_events(value)
+        yield END_MAP, None
+    elif isinstance(node, list):
+        yield START_ARRAY, None
+        for value in node:
+            yield from _tree_events(value)
+        yield END_ARRAY, None
+    else:
+        yield VALUE, _scalar(node)
+
+
+_IJSON_EVENTS = {"start_map": START_MAP, "map_key": KEY, "end_map": END_MAP,
+                 "start_array": START_ARRAY, "end_array": END_ARRAY}
+
+
+def json_records(contents):
+    if ijson is None:
+        events = _tree_events(json.loads(contents.decode('utf-8-sig')))
+    else:
+        events = (
+            (_IJSON_EVENTS[event], value) if event in _IJSON_EVENTS else (VALUE, _scalar(value))
+            for _, event, value in ijson.parse(io.BytesIO(contents), use_float=True)
+        )
+    return records_from_events(events)
+
+
+def _yaml_document_events(parser_events):
+    """Events of one YAML document; scalars inside a mapping alternate between key and value."""
+    # One flag per open container: True while a mapping expects its next key, False while it
+    # expects a value, "complex" inside a non-scalar key, None for sequences
+    expecting_key = []
+    for event in parser_events:
+        if isinstance(event, yaml.DocumentEndEvent):
+            return
+        in_key = bool(expecting_key) and expecting_key[-1] is True
+        if in_key and isinstance(event, (yaml.ScalarEvent, yaml.AliasEvent)):
+            yield KEY, event.value if isinstance(event, yaml.ScalarEvent) else f"*{event.anchor}"
+            expecting_key[-1] = False
+            continue
+        if in_key and isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+            # Complex (non-scalar) mapping key: index it, and then its value, under "?"
+            yield KEY, "?"
+            expecting_key[-1] = "complex"
+        if isinstance(event, yaml.MappingStartEvent):
+            yield START_MAP, None
+            expecting_key.append(True)
+            continue
+        if isinstance(event, yaml.SequenceStartEvent):
+            yield START_ARRAY, None
+            expecting_key.append(None)
+            continue
+        if isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+            expecting_key.pop()
+            yield (END_MAP if isinstance(event, yaml.MappingEndEvent) else END_ARRAY), None
+            if expecting_key and expecting_key[-1] == "complex":
+                yield KEY, "?"
+                expecting_key[-1] = False
+                continue
+        elif isinstance(event, yaml.ScalarEvent):
+            yield VALUE, event.value
+        elif isinstance(event, yaml.AliasEvent):
+            yield VALUE, f"*{event.anchor}"
+        # A finished value hands its mapping back to reading keys
+        if expecting_key and expecting_key[-1] is False:
+            expecting_key[-1] = True
+
+
+def yaml_records(contents):
+    if yaml is None:
+        raise ImportError("PyYAML is required for YAML parsing")
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    parser_events = iter(yaml.parse(io.BytesIO(contents), Loader=loader))
+    for event in parser_events:
+        if isinstance(event, yaml.DocumentStartEvent):
+            # No document prefix: whether another document follows is only known once this one is streamed
+            yield from records_from_events(_yaml_document_events(parser_events))
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else str(tag)
+
+
+def xml_records(contents):
+    """
+    Records for an XML document. Containers are indexed among same-named
+    siblings (catalog.book[3].title); attributes are @name records, or are
+    folded into the line of a leaf element ("price: 5 (currency=USD)").
+    Text after a child element (mixed content) is a parent.#text record.
+    """
+    # One frame per open element: [element, path, sibling counts, has children, last closed child]
+    stack = []
+
+    def settle(frame):
+        # The last closed child's tail is only parsed by the next event; emit it, then free the child
+        child = frame[4]
+        if child is None:
+            return
+        frame[4] = None
+        tail = (child.tail or "").strip()
+        if tail:
+            yield f"{frame[1]}.#text", tail
+        child.clear()
+        frame[0].remove(child)
+
+    for event, elem in ET.iterparse(io.BytesIO(contents), events=("start", "end")):
+        tag = _local_name(elem.tag)
+        if event == "start":
+            if not stack:
+                stack.append([elem, tag, {}, False, None])
+                continue
+            parent = stack[-1]
+            if not parent[3]:
+                # First child: the parent is a container, so its own attributes and text come first
+                parent[3] = True
+                for name, value in parent[0].attrib.items():
+                    yield f"{parent[1]}.@{_local_name(name)}", value
+                if parent[0].text and parent[0].text.strip():
+                    yield parent[1], parent[0].text.strip()
+            yield from settle(parent)
+            index = parent[2].get(tag, 0)
+            parent[2][tag] = index + 1
+            stack.append([elem, f"{parent[1]}.{tag}[{index}]", {}, False, None])
+            continue
+
+        frame = stack.pop()
+        yield from settle(frame)
+        _, path, _, has_children, _ = frame
+        if not has_children:
+            # Leaf: one line, without the index when it is the first of its name
+            leaf_path = path[:-3] if path.endswith("[0]") else path
+            text = (elem.text or "").strip()
+            attributes = ", ".join(f"{_local_name(name)}={value}" for name, value in elem.attrib.items())
+            if text or attributes:
+                yield leaf_path, f"{text} ({attributes})" if attributes and text else text or f"({attributes})"
+        if stack:
+            # Freed once its tail is known; parsed XML would otherwise accumulate under the root
+            stack[-1][4] = elem
+        else:
+            elem.clear()
+
+
+def pack_records(records, chunk_words=STRUCTURED_CHUNK_WORDS):
+    """Pack "path: value" lines into chunks of about chunk_words words; long values are split."""
+    block, words = [], 0
+    for path, value in records:
+        value = " ".join(str(value).split())
+        if not value:
+            continue
+        label = f"{path}: " if path else ""
+        value_words = value.split(" ")
+        budget = max(1, chunk_words - len(label.split()))
+        # A value too long for one chunk is cut into pieces that each repeat its path
+        for start in range(0, len(value_words), budget):
+            line = label + " ".join(value_words[start:start + budget])
+            line_words = len(line.split())
+            if block and words + line_words > chunk_words:
+                yield "\n".join(block)
+                block, words = [], 0
+            block.append(line)
+            words += line_words
+    if block:
+        yield "\n".join(block)
+
+
+def iter_structured_chunks(contents, filename, chunk_words=STRUCTURED_CHUNK_WORDS):
+    """Chunks of path-annotated records for a structured file, produced lazily."""
+    ext = os.path.splitext(filename)[1].lower()
+    logging.info(f"Streaming structured ingestion for {filename}")
+    if ext == '.json':
+        records = json_records(contents)
+    elif ext == '.xml':
+        records = xml_records(contents)
+    else:
+        records = yaml_records(contents)
+    return pack_records(records, chunk_words)
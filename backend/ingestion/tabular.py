@@ -0,0 +1,125 @@
+"""
+Streaming ingestion for tabular files (.csv, .tsv, .xlsx).
+
+Rows are read one at a time (csv iterator over the decoded bytes, openpyxl
+in read-only mode) and grouped into row blocks of about TABLE_CHUNK_WORDS
+words. Every block starts with its sheet name and column header, so a chunk
+retrieved on its own still says what its values mean, and a row is never
+split across chunks. Empty rows are skipped. Memory stays flat in the
+number of rows: nothing holds more than the current block. A file that does
+not parse as a table is indexed as plain text by the ingestion pipeline.
+"""
+import csv
+import io
+import logging
+import os
+import tempfile
+
+TABULAR_EXTENSIONS = ('.csv', '.tsv', '.xlsx')
+# Target words per row block (same scale as chunk_text's 300-word chunks)
+TABLE_CHUNK_WORDS = int(os.getenv("TABLE_CHUNK_WORDS", "300"))
+# Bytes inspected to pick the text encoding and the CSV delimiter
+_SNIFF_BYTES = 64 * 1024
+# Longest single CSV field, in characters (the csv module's default of 131072 rejects long text cells)
+CSV_FIELD_SIZE_LIMIT = int(os.getenv("CSV_FIELD_SIZE_LIMIT", str(64 * 1024 * 1024)))
+
+# Process-wide setting; only ever raised
+csv.field_size_limit(max(csv.field_size_limit(), CSV_FIELD_SIZE_LIMIT))
+
+
+def _cell(value):
+    return "" if value is None else str(value).strip()
+
+
+def _is_empty(row):
+    return not any(row)
+
+
+def _row_blocks(rows, title=None, chunk_words=TABLE_CHUNK_WORDS):
+    """
+    Group (row_number, cells) into text blocks, each starting with the title
+    and column header. The first non-empty row is taken as the header.
+    """
+    header_line = None
+    block, words = [], 0
+    for number, cells in rows:
+        if _is_empty(cells):
+            continue
+        if header_line is None:
+            header_line = (f"{title}\n" if title else "") + "Columns: " + " | ".join(cells)
+            words = header_words = len(header_line.split())
+            continue
+        line = f"Row {number}: " + " | ".join(cells)
+        line_words = len(line.split())
+        if block and words + line_words > chunk_words:
+            yield header_line + "\n" + "\n".join(block)
+            block, words = [], header_words
+        block.append(line)
+        words += line_words
+    if block:
+        yield header_line + "\n" + "\n".join(block)
+    elif header_line is not None:
+        # Header-only table: still index the column names
+        yield header_line
+
+
+def _text_stream(contents):
+    """Decode bytes lazily, picking the encoding from a sample like parse_text_file does."""
+    sample = contents[:_SNIFF_BYTES]
+    encoding = 'utf-8-sig'
+    try:
+        # A multi-byte character cut at the sample boundary is not an encoding error
+        sample.decode('utf-8-sig')
+    except UnicodeDecodeError as e:
+        if e.start < len(sample) - 3:
+            encoding = 'cp1252'
+    return io.TextIOWrapper(io.BytesIO(contents), encoding=encoding, errors='replace', newline='')
+
+
+def iter_delimited_chunks(contents, filename, chunk_words=TABLE_CHUNK_WORDS):
+    """Row blocks from a .csv/.tsv file; .csv delimiters other than ',' are sniffed."""
+    stream = _text_stream(contents)
+    delimiter = '\t' if filename.lower().endswith('.tsv') else ','
+    if delimiter == ',':
+        sample = stream.read(_SNIFF_BYTES)
+        stream.seek(0)
+        try:
+            delimiter = csv.Sniffer().sniff(sample, delimiters=',;\t|').delimiter
+        except csv.Error:
+            pass
+    reader = csv.reader(stream, delimiter=delimiter)
+    rows = ((i, [_cell(value) for value in row]) for i, row in enumerate(reader, start=1))
+    yield from _row_blocks(rows, chunk_words=chunk_words)
+
+
+def iter_excel_chunks(contents, filename, chunk_words=TABLE_CHUNK_WORDS):
+    """Row blocks from every sheet of an .xlsx workbook, read in read-only (streaming) mode."""
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportError("openpyxl is required for Excel parsing")
+    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename)[1]) as tmp:
+        tmp.write(contents)
+        tmp_path = tmp.name
+    workbook = None
+    try:
+        workbook = openpyxl.load_workbook(tmp_path, read_only=True, data_only=True)
+        for sheet in workbook.worksheets:
+            rows = (
+                (i, [_cell(value) for value in row])
+                for i, row in enumerate(sheet.iter_rows(values_only=True), start=1)
+            )
+            yield from _row_blocks(rows, title=f"Sheet: {sheet.title}", chunk_words=chunk_words)
+    finally:
+        if workbook is not None:
+            workbook.close()
+        os.remove(tmp_path)
+
+
+def iter_table_chunks(contents, filename, chunk_words=TABLE_CHUNK_WORDS):
+    """Chunks for a tabular file, produced lazily one row block at a time."""
+    ext = os.path.splitext(filename)[1].lower()
+    logging.info(f"Streaming tabular ingestion for {filename}")
+    if ext == '.xlsx':
+        return iter_excel_chunks(contents, filename, chunk_words)
+    return iter_delimited_chunks(contents, filename, chunk_words)
@@ -1,7 +1,11 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+import time
 # Import routers using absolute imports
-from api import upload, query, auth, notifications, conversations
+from api import upload, query, auth, notifications, conversations, metrics, documents
+from scheduler.cleanup import start_cleanup_scheduler, stop_cleanup_scheduler
+from monitoring.usage import usage
+from monitoring.metrics import REQUEST_SECONDS, start_request_timing, end_request_timing, format_server_timing
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -27,9 +31,50 @@ app.include_router(upload.router)
 app.include_router(query.router)
 app.include_router(notifications.router)
 app.include_router(conversations.router)
+app.include_router(documents.router)
+app.include_router(metrics.router)
+
+# Time every request and report per-stage spans back to the client
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    spans, token = start_request_timing()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        elapsed = time.perf_counter() - start
+        response.headers["Server-Timing"] = format_server_timing(spans, total=elapsed)
+        response.headers["X-Response-Time-Ms"] = f"{elapsed * 1000:.1f}"
+        return response
+    finally:
+        # Label by route template, not raw path, to keep series cardinality bounded
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
+        end_request_timing(token)
+
 # Add startup event to configure logging
 @app.on_event("startup")
 async def startup_event():
     import logging
     logging.basicConfig(level=logging.INFO)
-    logging.info("RAG Bot API started") 
\ No newline at end of file
+    logging.info("RAG Bot API started")
+    # Bind the notification dispatcher to the server's event loop so
+    # background workers can hand it messages from their own threads
+    # (it is per process: notifications need a single API worker, see api.notifications)
+    notifications.dispatcher.start()
+    # Nightly retention job (expired files, their vectors and old search history)
+    start_cleanup_scheduler()
+    # Periodic bulk flush of per-user token accounting
+    usage.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    stop_cleanup_scheduler()
+    usage.stop()
+    await notifications.dispatcher.stop() 
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+Per-user accounting of embedding and LLM tokens.
+
+Calls are counted in memory and flushed to the usage_daily table every
+USAGE_FLUSH_SECONDS as one multi-row upsert, so accounting never adds a
+database round-trip to a request. A failed flush keeps its totals for the
+next attempt.
+
+Token counts are estimates (about four characters per token); they are
+meant for spotting heavy users and budgeting quota, not for billing.
+A request that waited for another user's identical call is charged the
+same tokens (upstream=False), but rag_tokens_total counts them only once.
+"""
+import datetime
+import logging
+import os
+import threading
+
+from monitoring.metrics import counter
+
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "30"))
+
+TOKENS_USED = counter("rag_tokens_total", "Estimated tokens sent to and received from Gemini", ["kind"])
+
+_FIELDS = ("embedding_tokens", "llm_input_tokens", "llm_output_tokens", "requests")
+
+
+def estimate_tokens(text):
+    return (len(text) + 3) // 4 if text else 0
+
+
+class UsageRecorder:
+    def __init__(self, flush_seconds=USAGE_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._table_ready = False
+
+    def record(self, user_id, embedding_tokens=0, llm_input_tokens=0, llm_output_tokens=0, requests=0, upstream=True):
+        """Add to a user's totals for today. upstream=False: the tokens were already sent (and counted) by another call."""
+        if user_id is None:
+            return
+        deltas = (embedding_tokens, llm_input_tokens, llm_output_tokens, requests)
+        key = (user_id, datetime.datetime.utcnow().date())
+        with self._lock:
+            totals = self._pending.setdefault(key, [0, 0, 0, 0])
+            for i, delta in enumerate(deltas):
+                totals[i] += delta
+        if not upstream:
+            return
+        for field, delta in zip(_FIELDS[:3], deltas):
+            if delta:
+                TOKENS_USED.inc(delta, kind=field.replace("_tokens", ""))
+
+    def flush(self):
+        """Write pending totals in one statement. Returns the number of rows written."""
+        from db.models import add_usage, create_usage_table
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = [(user_id, day, *totals) for (user_id, day), totals in pending.items()]
+        try:
+            if not self._table_ready:
+                create_usage_table()
+                self._table_ready = True
+            add_usage(rows)
+        except Exception as e:
+            logging.error(f"[USAGE] Flush of {len(rows)} rows failed, will retry: {e}")
+            # Put the totals back so nothing is lost
+            with self._lock:
+                for key, totals in pending.items():
+                    current = self._pending.setdefault(key, [0, 0, 0, 0])
+                    for i, value in enumerate(totals):
+                        current[i] += value
+            return 0
+        return len(rows)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_seconds):
+            self.flush()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="usage-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+
+usage = UsageRecorder()
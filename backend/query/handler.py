@@ -1,104 +1,378 @@
 # Import save_search_history function to log user queries
-from db.models import save_search_history, add_messages_to_conversation
+from db.models import save_search_history, save_search_history_bulk, add_messages_to_conversation
+from monitoring.metrics import span  # Per-stage latency spans
+from query.embedding_cache import query_embedding_cache
+from embedding.base import get_embedding_provider  # Gemini or a local CPU model, per deployment
+from upstream.client import get_upstream, is_overload, UpstreamUnavailable
+from upstream.singleflight import SingleFlight  # Shares one run between identical concurrent calls
+from upstream.scheduler import BULK, INTERACTIVE
+from monitoring.usage import usage, estimate_tokens
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import datetime
+import logging
+import os
+import threading
 import time
 
-# Main function to handle a user's query using Pinecone + Gemini + LlamaIndex
-def handle_query(query, user_id, conversation_id=None):
-    print("Connecting to Pinecone...")
+# Number of chunks retrieved per query
+SIMILARITY_TOP_K = 5
+# "hybrid" fuses BM25 and vector results; "vector" uses embeddings only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+# Candidates taken from each retriever before fusion
+FUSION_CANDIDATES = 20
+# Multi-query retrieval: "heuristic" (local rewrites), "llm" (one rewrite call) or "off"
+MULTI_QUERY_MODE = os.getenv("MULTI_QUERY_MODE", "heuristic").lower()
+# Total queries searched per question, including the original
+MULTI_QUERY_VARIANTS = int(os.getenv("MULTI_QUERY_VARIANTS", "3"))
+# Threads shared by all requests for concurrent embedding and search calls
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "16"))
 
-    # Lazy import: importing only when function is called to avoid unnecessary global loads
-    from ingestion.pipeline import pinecone_index, embed_model, GEMINI_API_KEY
-    from llama_index.vector_stores.pinecone import PineconeVectorStore  # Interface to connect with Pinecone
-    from llama_index.core.indices.vector_store import VectorStoreIndex  # High-level index built on vector store
-    from llama_index.llms.gemini import Gemini  # LLM wrapper for Gemini
-
-    # Create Pinecone vector store instance using the existing index
-    vector_store = PineconeVectorStore(pinecone_index=pinecone_index)
-    print("Vector store created.")
-
-    # Load index using embedding model and vector store
-    index = VectorStoreIndex.from_vector_store(vector_store, embed_model=embed_model)
-    print("Index loaded.")
-
-    # Instantiate Gemini as the LLM with provided API key
-    llm = Gemini(api_key=GEMINI_API_KEY, model_name="models/gemini-2.0-flash")
-
-    # Create metadata filters to only search user's documents
-    from llama_index.core.vector_stores import MetadataFilters, MetadataFilter, FilterOperator
-
-    metadata_filters = MetadataFilters(
-        filters=[
-            MetadataFilter(
-                key="user_id",
-                value=float(user_id),  # Use float to match stored data type
-                operator=FilterOperator.EQ
+# Batch evaluation: max questions per request, and concurrent retrievals / generations within one batch
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_RETRIEVAL_PARALLELISM = int(os.getenv("BATCH_RETRIEVAL_PARALLELISM", "8"))
+BATCH_GENERATION_PARALLELISM = int(os.getenv("BATCH_GENERATION_PARALLELISM", "4"))
+
+_retrieval_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+# A query text being embedded by another request right now is waited for, not embedded again
+_embedding_flight = SingleFlight("embedding")
+
+# Run fn(item) for every item on the retrieval pool, keeping the request's span context
+def _fan_out(fn, items):
+    futures = [_retrieval_pool.submit(contextvars.copy_context().run, fn, item) for item in items]
+    return [future.result() for future in futures]
+
+# Embed each query variant concurrently, reusing cached embeddings
+def embed_queries(queries, provider=None, user_id=None):
+    provider = provider or get_embedding_provider()
+
+    def fetch(text, ran):
+        # Coalesced callers wait on this call, so it queues for a slot under the leader's user_id
+        embedding = get_upstream("gemini_embedding").call(provider.embed_query, text, user_id=user_id)
+        query_embedding_cache.put(text, embedding)
+        usage.record(user_id, embedding_tokens=estimate_tokens(text))
+        ran.append(True)
+        return embedding
+
+    def embed(text):
+        embedding = query_embedding_cache.get(text)
+        if embedding is None:
+            ran = []
+            embedding = _embedding_flight.do(text, fetch, text, ran)
+            if not ran:
+                # Another request's identical embedding was used: still this user's usage, but no second upstream call
+                usage.record(user_id, embedding_tokens=estimate_tokens(text), upstream=False)
+        return embedding
+
+    with span("query_embedding"):
+        if not provider.remote:
+            # A local model embeds all uncached variants in one batch on this thread
+            embedded = {text: query_embedding_cache.get(text) for text in queries}
+            missing = [text for text, embedding in embedded.items() if embedding is None]
+            for text, embedding in zip(missing, provider.embed_texts(missing)):
+                embedded[text] = embedding
+                query_embedding_cache.put(text, embedding)
+            if missing:
+                usage.record(user_id, embedding_tokens=sum(estimate_tokens(text) for text in missing))
+            return [embedded[text] for text in queries]
+        if len(queries) == 1:
+            return [embed(queries[0])]
+        return _fan_out(embed, queries)
+
+# Retrieve the top chunks for a query from the vector store, fused with BM25 in hybrid mode
+def retrieve_chunks(user_id, query, embedding, vector_store, top_k=SIMILARITY_TOP_K, scope=None):
+    return retrieve_multi(user_id, [query], [embedding], vector_store, top_k, scope=scope)
+
+# The user's shared (deduplicated) documents inside the scope, as {content_hash: filename}
+def _shared_in_scope(user_id, scope):
+    from ingestion.dedup import user_content
+    from retrieval.scope import scoped_content, has_dates, epoch_to_datetime
+    from db.models import get_user_filenames_uploaded_between
+
+    refs = user_content(user_id)
+    if not refs or not scope:
+        return refs
+    uploaded = None
+    if has_dates(scope):
+        uploaded = get_user_filenames_uploaded_between(
+            user_id, epoch_to_datetime(scope.get("uploaded_after")), epoch_to_datetime(scope.get("uploaded_before"))
+        )
+    return {content_hash: refs[content_hash] for content_hash in scoped_content(scope, refs, uploaded)}
+
+# Search every query variant concurrently (vector, plus BM25 in hybrid mode) and fuse all lists by rank.
+# scope (see retrieval.scope) narrows every search to some of the user's files.
+def retrieve_multi(user_id, queries, embeddings, vector_store, top_k=SIMILARITY_TOP_K, priority=INTERACTIVE, scope=None):
+    from retrieval.bm25 import get_lexical_index
+    from retrieval.fusion import reciprocal_rank_fusion
+    from retrieval.scope import vector_filter
+    from retrieval.two_level import select_documents, restrict_filter
+    from ingestion.dedup import SHARED_CONTENT_OWNER
+
+    # The scope is pushed down as a metadata filter, so only chunks of the selected files are ranked
+    own_filter = vector_filter(scope)
+    # Deduplicated uploads live in the shared space; search the parts this user references too
+    shared = _shared_in_scope(user_id, scope)
+    shared_filter = {"content_hash": {"$in": sorted(shared)}} if shared else None
+    hybrid = RETRIEVAL_MODE == "hybrid"
+    fusing = hybrid or len(queries) > 1 or bool(shared)
+    candidates = FUSION_CANDIDATES if fusing else top_k
+
+    # Large corpora: pick the best documents by summary vector first, then vector-search only their chunks
+    own_vector_filter, shared_vector_filter = own_filter, shared_filter
+    search_own, search_shared = True, bool(shared)
+    with span("document_selection"):
+        selection = select_documents(user_id, embeddings, shared, scope)
+    if selection is not None:
+        own_documents, shared_documents = selection
+        own_vector_filter = restrict_filter(own_filter, own_documents)
+        shared_vector_filter = {"content_hash": {"$in": sorted(shared_documents)}}
+        search_own, search_shared = bool(own_vector_filter["filename"]["$in"]), bool(shared_documents)
+
+    def vector_search(embedding):
+        if not search_own:
+            return []
+        with span("vector_search"):
+            # Queries are idempotent, so a slow one can be hedged with a duplicate
+            return get_upstream("vector_store").hedged(
+                vector_store.query, user_id, embedding, top_k=candidates, filters=own_vector_filter,
+                user_id=user_id, priority=priority,
             )
-        ]
-    )
 
-    # Convert the index into a query engine using the Gemini LLM with user filtering
-    query_engine = index.as_query_engine(
-        llm=llm,
-        filters=metadata_filters,
-        similarity_top_k=5  # Return top 5 most relevant chunks
+    def lexical_search(text):
+        with span("lexical_search"):
+            return get_lexical_index(user_id).search(text, top_k=candidates, filters=own_filter)
+
+    def shared_vector_search(embedding):
+        if not search_shared:
+            return []
+        with span("vector_search"):
+            return get_upstream("vector_store").hedged(
+                vector_store.query, SHARED_CONTENT_OWNER, embedding, top_k=candidates, filters=shared_vector_filter,
+                user_id=user_id, priority=priority,
+            )
+
+    def shared_lexical_search(text):
+        with span("lexical_search"):
+            return get_lexical_index(SHARED_CONTENT_OWNER).search(text, top_k=candidates, filters=shared_filter)
+
+    tasks = [(vector_search, embedding) for embedding in embeddings]
+    if hybrid:
+        tasks += [(lexical_search, text) for text in queries]
+    if shared:
+        tasks += [(shared_vector_search, embedding) for embedding in embeddings]
+        if hybrid:
+            tasks += [(shared_lexical_search, text) for text in queries]
+    with span("retrieval"):
+        if len(tasks) == 1:
+            result_lists = [tasks[0][0](tasks[0][1])]
+        else:
+            result_lists = _fan_out(lambda task: task[0](task[1]), tasks)
+
+    if fusing:
+        matches = reciprocal_rank_fusion(result_lists, top_k=top_k)
+    else:
+        matches = result_lists[0][:top_k]
+
+    # Shared chunks are shown under the name this user gave the file
+    for match in matches:
+        content = match["metadata"].get("content_hash")
+        if content in shared:
+            match["metadata"] = dict(match["metadata"], filename=shared[content])
+    attach_chunk_text(user_id, matches, vector_store)
+    return matches
+
+# Fill in metadata["text"] for the winning matches with one bulk chunk store lookup
+def attach_chunk_text(user_id, matches, vector_store):
+    from retrieval.chunk_store import get_chunk_texts
+
+    missing = [match["id"] for match in matches if "text" not in match["metadata"]]
+    if not missing:
+        return
+    with span("chunk_fetch"):
+        texts = get_chunk_texts(missing)
+        # Vectors ingested before the chunk store still carry their text in metadata
+        legacy = [chunk_id for chunk_id in missing if chunk_id not in texts]
+        fetched = vector_store.fetch(user_id, legacy) if legacy else {}
+    for match in matches:
+        if match["id"] in texts:
+            match["metadata"] = dict(match["metadata"], text=texts[match["id"]])
+        elif match["id"] in fetched:
+            match["metadata"] = fetched[match["id"]]
+
+# Convert vector store matches into LlamaIndex nodes for response synthesis
+def matches_to_nodes(matches):
+    from llama_index.core.schema import NodeWithScore, TextNode
+    nodes = []
+    for match in matches:
+        metadata = {key: value for key, value in match["metadata"].items() if key != "text"}
+        node = TextNode(text=match["metadata"].get("text", ""), id_=match["id"], metadata=metadata)
+        nodes.append(NodeWithScore(node=node, score=match["score"]))
+    return nodes
+
+_llm = None
+_llm_lock = threading.Lock()
+
+# Process-wide Gemini LLM client, created (and llama_index imported) on first use
+def get_llm():
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                from ingestion.pipeline import GEMINI_API_KEY
+                from llama_index.llms.gemini import Gemini  # LLM wrapper for Gemini
+                _llm = Gemini(api_key=GEMINI_API_KEY, model_name="models/gemini-2.0-flash")
+    return _llm
+
+# Build the pipeline objects shared by every question in a request
+def _query_pipeline():
+    from vectorstore.base import get_vector_store  # Pinecone or local backend, per VECTOR_STORE_BACKEND
+    from llama_index.core import get_response_synthesizer  # Turns retrieved chunks into an answer
+
+    llm = get_llm()
+    return get_vector_store(), llm, get_response_synthesizer(llm=llm)
+
+# Generate one answer from retrieved nodes and account for its tokens
+def generate_answer(synthesizer, query, embedding, nodes, user_id, priority=INTERACTIVE):
+    from llama_index.core.schema import QueryBundle  # Query text with a precomputed embedding
+    with span("llm_generation"):
+        results = get_upstream("gemini_llm").call(
+            synthesizer.synthesize, QueryBundle(query_str=query, embedding=embedding), nodes,
+            user_id=user_id, priority=priority,
+        )
+    result_text = str(results)
+    usage.record(
+        user_id,
+        llm_input_tokens=estimate_tokens(query) + sum(estimate_tokens(node.node.get_content()) for node in nodes),
+        llm_output_tokens=estimate_tokens(result_text),
     )
-    print(f"Query engine ready with user filter for user_id: {user_id}")
+    return result_text
+
+# User-facing message for a failed query; upstream failures are classified once, in upstream.client
+def error_message(e):
+    if isinstance(e, UpstreamUnavailable):
+        return "The AI service is temporarily unavailable. Please try again later."
+    if is_overload(e):
+        return "I'm currently experiencing high demand. Please try again in a few moments. The service should be available shortly."
+    return "I'm sorry, I encountered an error while processing your request. Please try again."
 
-    # Warm up the query engine with a simple test (for new users)
+# Main function to handle a user's query using the configured vector store + Gemini + LlamaIndex
+def handle_query(query, user_id, conversation_id=None, scope=None):
+    # Lazy import: importing only when function is called to avoid unnecessary global loads
+    from retrieval.rewrite import query_variants  # Rephrasings searched alongside the original query
+    from query.memory import load_context  # Bounded summary + recent turns of the conversation
+
+    # Searches are always scoped to this user's vectors by the store
+    vector_store, llm, synthesizer = _query_pipeline()
+    print(f"Query pipeline ready for user_id: {user_id}")
+
+    context = None
     try:
-        # Quick warm-up query to ensure everything is initialized
-        _ = query_engine.query("test")
-        print("Query engine warmed up successfully.")
-    except Exception as warmup_error:
-        print(f"Query engine warmup warning: {warmup_error}")
-        # Continue anyway, as this is just a warmup
-
-    # Try the query with a retry mechanism for better initialization
-    max_retries = 2
-    retry_delay = 1  # seconds
-
-    for attempt in range(max_retries + 1):
-        try:
-            # Add a small delay for the first retry to allow proper initialization
-            if attempt > 0:
-                print(f"Retrying query (attempt {attempt + 1})...")
-                time.sleep(retry_delay)
+        # Follow-ups see a bounded view of the conversation, not its full history
+        if conversation_id:
+            with span("conversation_memory"):
+                context = load_context(user_id, conversation_id, llm)
 
-            # Perform the actual query
-            results = query_engine.query(query)
-            print("Query executed. Results:", results)
+        # Widen recall up front instead of re-running the same query: search a few
+        # rewrites of the question at once, fuse the results, then generate once
+        with span("query_rewrite"):
+            queries = query_variants(query, MULTI_QUERY_VARIANTS, MULTI_QUERY_MODE, llm, user_id)
+            if context:
+                queries += context.retrieval_queries(query)
+        embeddings = embed_queries(queries, user_id=user_id)
+        matches = retrieve_multi(user_id, queries, embeddings, vector_store, scope=scope)
+        nodes = matches_to_nodes(matches)
+        prompt = context.prompt(query) if context else query
+        result_text = generate_answer(synthesizer, prompt, embeddings[0], nodes, user_id)
+        print(f"Query executed over {len(queries)} variants. Results:", result_text)
 
-            result_text = str(results)
+    except Exception as e:
+        print(f"Error during query execution: {e}")
+        result_text = error_message(e)
 
-            # If we get a meaningful response (not the generic "cannot answer" message), break
-            if result_text and not result_text.startswith("I am sorry, I cannot answer") and not result_text.startswith("This query cannot be answered"):
-                break
-            elif attempt < max_retries:
-                # If it's a generic response and we have retries left, continue to retry
-                print("Got generic response, retrying...")
-                continue
+    usage.record(user_id, requests=1)
 
-        except Exception as e:
-            print(f"Error during query execution (attempt {attempt + 1}): {e}")
-            # Handle specific API errors
-            if "ResourceExhausted" in str(e) or "429" in str(e):
-                result_text = "I'm currently experiencing high demand. Please try again in a few moments. The service should be available shortly."
-                break
-            elif "quota" in str(e).lower():
-                result_text = "The AI service is temporarily unavailable due to quota limits. Please try again later."
-                break
-            elif attempt == max_retries:
-                # Last attempt failed
-                result_text = "I'm sorry, I encountered an error while processing your request. Please try again."
-                break
-
-    # Save the query and results to user's search history in the database
-    save_search_history(user_id, query, result_text)
-
-    # If conversation_id is provided, save the messages to the conversation
-    if conversation_id:
-        add_messages_to_conversation(str(user_id), conversation_id, query, result_text)
+    with span("history_persistence"):
+        # Save the query and results to user's search history in the database
+        save_search_history(user_id, query, result_text)
+
+        # If conversation_id is provided, save the messages to the conversation
+        if conversation_id:
+            # A folded summary is saved in the same write as the new turn
+            memory = context.memory if context and context.changed else None
+            add_messages_to_conversation(str(user_id), conversation_id, query, result_text, memory)
 
     # Return the results as a string (you could also return a structured response if preferred)
     return result_text
+
+# Answer many questions for one user with shared setup: one batched embedding call,
+# concurrent retrieval and bounded-parallel generation. Results keep the input order.
+def handle_query_batch(questions, user_id, save_history=False, scope=None):
+    from retrieval.rewrite import query_variants
+
+    batch_start = time.perf_counter()
+    vector_store, llm, synthesizer = _query_pipeline()
+
+    with span("query_rewrite"):
+        variants = [query_variants(question, MULTI_QUERY_VARIANTS, MULTI_QUERY_MODE, llm, user_id) for question in questions]
+
+    # Every distinct variant across the batch, embedded in as few API calls as possible
+    with span("query_embedding"):
+        texts = list(dict.fromkeys(text for group in variants for text in group))
+        embedded = {text: query_embedding_cache.get(text) for text in texts}
+        missing = [text for text, embedding in embedded.items() if embedding is None]
+        if missing:
+            provider = get_embedding_provider()
+            if provider.remote:
+                vectors = get_upstream("gemini_embedding").call(provider.embed_texts, missing, user_id=user_id, priority=BULK)
+            else:
+                vectors = provider.embed_texts(missing)
+            for text, embedding in zip(missing, vectors):
+                embedded[text] = embedding
+                query_embedding_cache.put(text, embedding)
+            usage.record(user_id, embedding_tokens=sum(estimate_tokens(text) for text in missing))
+
+    results = [{"question": question, "answer": None, "error": None, "timings_ms": {}} for question in questions]
+
+    def retrieve(i):
+        start = time.perf_counter()
+        matches = retrieve_multi(user_id, variants[i], [embedded[text] for text in variants[i]], vector_store, priority=BULK, scope=scope)
+        results[i]["timings_ms"]["retrieval"] = round((time.perf_counter() - start) * 1000, 1)
+        return matches
+
+    def answer(i, retrieval):
+        try:
+            nodes = matches_to_nodes(retrieval.result())
+            start = time.perf_counter()
+            results[i]["answer"] = generate_answer(
+                synthesizer, questions[i], embedded[variants[i][0]], nodes, user_id, priority=BULK
+            )
+            results[i]["timings_ms"]["generation"] = round((time.perf_counter() - start) * 1000, 1)
+            results[i]["sources"] = [node.node.metadata.get("filename") for node in nodes]
+        except Exception as e:
+            logging.error(f"[QUERY] Batch question {i} failed for user {user_id}: {e}")
+            results[i]["answer"] = error_message(e)
+            results[i]["error"] = str(e)
+
+    # Retrieval runs ahead of generation; generation is capped because it is the expensive, rate-limited step
+    with ThreadPoolExecutor(BATCH_RETRIEVAL_PARALLELISM, thread_name_prefix="batch-retrieval") as retrieval_pool, \
+            ThreadPoolExecutor(BATCH_GENERATION_PARALLELISM, thread_name_prefix="batch-generation") as generation_pool:
+        retrievals = [retrieval_pool.submit(contextvars.copy_context().run, retrieve, i) for i in range(len(questions))]
+        generations = [
+            generation_pool.submit(contextvars.copy_context().run, answer, i, retrieval)
+            for i, retrieval in enumerate(retrievals)
+        ]
+        for generation in generations:
+            generation.result()
+
+    usage.record(user_id, requests=len(questions))
+    if save_history:
+        with span("history_persistence"):
+            save_search_history_bulk([(user_id, item["question"], item["answer"]) for item in results])
+
+    return {
+        "results": results,
+        "count": len(results),
+        "failed": sum(1 for item in results if item["error"]),
+        "total_ms": round((time.perf_counter() - batch_start) * 1000, 1),
+    }
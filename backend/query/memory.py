@@ -0,0 +1,157 @@
+"""
+Conversation memory for follow-up questions.
+
+A question asked inside a conversation is answered with:
+- the most recent chat turns, up to MEMORY_WINDOW_TOKENS
+- a running summary of everything older, stored in the conversation's
+  metadata["memory"] next to its messages in chat_history
+
+When the recent turns outgrow the window, the oldest ones are folded into
+the summary with one LLM call and the window is trimmed to half its budget.
+The summary is therefore rewritten every few turns rather than on every
+question, and the prompt never grows past window + summary however long the
+conversation gets.
+"""
+import logging
+import os
+
+from monitoring.usage import usage, estimate_tokens
+
+# Token budget for verbatim recent turns, and the cap on the running summary
+MEMORY_WINDOW_TOKENS = int(os.getenv("MEMORY_WINDOW_TOKENS", "1200"))
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+# A single long message (e.g. a long answer) is clipped to this many tokens in the window
+MEMORY_MESSAGE_TOKENS = int(os.getenv("MEMORY_MESSAGE_TOKENS", "400"))
+# Max turn text sent to one summary update (only reached by conversations older than the memory)
+MEMORY_FOLD_INPUT_TOKENS = int(os.getenv("MEMORY_FOLD_INPUT_TOKENS", "4000"))
+
+SUMMARY_PROMPT = (
+    "Update the running summary of a conversation between a user and a document assistant. "
+    "Keep the facts, names, documents and open questions a later follow-up might refer to, "
+    "in at most {words} words. Return only the summary.\n\n"
+    "Current summary:\n{summary}\n\nNew turns:\n{turns}"
+)
+
+
+def _clip(text, tokens):
+    limit = tokens * 4
+    return text if len(text) <= limit else text[:limit].rstrip() + "..."
+
+
+def _turns(messages):
+    """(index, speaker, text) for the plain chat messages; upload cards and other typed messages are skipped."""
+    turns = []
+    for i, msg in enumerate(messages):
+        if msg.get("type"):
+            continue
+        text = (msg.get("content") or msg.get("text") or "").strip()
+        if not text:
+            continue
+        is_user = msg.get("role") == "user" or msg.get("isUser", False)
+        turns.append((i, "User" if is_user else "Assistant", _clip(text, MEMORY_MESSAGE_TOKENS)))
+    return turns
+
+
+def _format(turns):
+    return "\n".join(f"{speaker}: {text}" for _, speaker, text in turns)
+
+
+def _newest_within(turns, budget):
+    """The longest suffix of turns whose estimated size fits in budget tokens."""
+    total, start = 0, len(turns)
+    while start > 0:
+        cost = estimate_tokens(turns[start - 1][2]) + 2
+        if total + cost > budget:
+            break
+        total += cost
+        start -= 1
+    return turns[start:]
+
+
+class ConversationContext:
+    """Summary plus recent turns for one question; memory is the state to persist if changed."""
+
+    def __init__(self, summary, recent, memory, changed):
+        self.summary = summary
+        self.recent = recent
+        self.memory = memory
+        self.changed = changed
+
+    @property
+    def last_question(self):
+        for _, speaker, text in reversed(self.recent):
+            if speaker == "User":
+                return text
+        return None
+
+    def prompt(self, query):
+        """The question with its conversation context, for answer generation."""
+        if not self.summary and not self.recent:
+            return query
+        parts = ["This question is part of an ongoing conversation."]
+        if self.summary:
+            parts.append(f"Summary of the earlier conversation:\n{self.summary}")
+        if self.recent:
+            parts.append(f"Most recent turns:\n{_format(self.recent)}")
+        parts.append(
+            "Use the conversation only to work out what the question refers to; "
+            f"answer from the context documents.\n\nQuestion: {query}"
+        )
+        return "\n\n".join(parts)
+
+    def retrieval_queries(self, query):
+        """Extra search queries that resolve a follow-up against the previous question."""
+        previous = self.last_question
+        return [f"{previous} {query}"] if previous and previous.strip().lower() != query.strip().lower() else []
+
+
+def fold_summary(summary, turns, llm, user_id=None):
+    """Fold turns into the running summary with one LLM call."""
+    from upstream.client import get_upstream
+    prompt = SUMMARY_PROMPT.format(
+        words=int(MEMORY_SUMMARY_TOKENS * 0.75), summary=summary or "(none)", turns=_format(turns)
+    )
+    response = get_upstream("gemini_llm").call(llm.complete, prompt, user_id=user_id)
+    usage.record(user_id, llm_input_tokens=estimate_tokens(prompt), llm_output_tokens=estimate_tokens(str(response)))
+    return _clip(str(response).strip(), MEMORY_SUMMARY_TOKENS)
+
+
+def build_context(conversation, llm, user_id=None):
+    """
+    Bounded context for the next question in a stored conversation
+    ({"messages": [...], "metadata": {...}}), folding overflowing turns into the summary.
+    """
+    memory = dict((conversation or {}).get("metadata", {}).get("memory") or {})
+    summary = memory.get("summary", "")
+    through = memory.get("summarized_through", 0)
+    turns = [turn for turn in _turns((conversation or {}).get("messages", [])) if turn[0] >= through]
+
+    recent = _newest_within(turns, MEMORY_WINDOW_TOKENS)
+    if len(recent) == len(turns):
+        return ConversationContext(summary, recent, memory, False)
+
+    # Window overflowed: keep half of it verbatim and summarize the rest
+    recent = _newest_within(turns, MEMORY_WINDOW_TOKENS // 2)
+    folded = _newest_within(turns[:len(turns) - len(recent)], MEMORY_FOLD_INPUT_TOKENS)
+    next_through = recent[0][0] if recent else turns[-1][0] + 1
+    try:
+        summary = fold_summary(summary, folded, llm, user_id)
+    except Exception as e:
+        # Keep the old summary; the overflow is retried on the next question
+        logging.warning(f"[MEMORY] Summary update failed, answering with the recent window only: {e}")
+        return ConversationContext(summary, recent, memory, False)
+    memory = {"summary": summary, "summarized_through": next_through}
+    return ConversationContext(summary, recent, memory, True)
+
+
+def load_context(user_id, chat_id, llm):
+    """Conversation context for a question in chat_id, or None if there is no usable history."""
+    from db.models import get_conversation_data
+    try:
+        conversation = get_conversation_data(str(user_id), chat_id)
+    except Exception as e:
+        logging.warning(f"[MEMORY] Could not load conversation {chat_id}: {e}")
+        return None
+    if not conversation:
+        return None
+    return build_context(conversation, llm, user_id)
@@ -0,0 +1,379 @@
+"""
+Per-user BM25 inverted index, built incrementally at ingest time.
+
+Each user's index lives under LEXICAL_INDEX_DIR/<user_id>/:
+- docs.json:     chunk ids, token lengths, small metadata and tombstones (a snapshot)
+- docs.log:      adds and deletes since the snapshot, one JSON line each
+- seg-NNNNN.npz: immutable posting segments (sorted term array, offsets,
+                 doc numbers as int32 and term frequencies as uint16)
+
+Every ingested file appends one segment; once there are more than
+MAX_SEGMENTS the smallest half are merged into one (size-tiered), so
+merge work stays proportional to new data rather than the whole index.
+Once deleted docs pass COMPACT_DEAD_FRACTION of the index, everything is
+rewritten without them. Lookups binary-search the sorted term arrays, so
+no per-term Python objects are kept in memory.
+
+Tokens are lower-cased words; identifiers such as getUserName or
+order_total are indexed whole and as their parts, so both exact symbol
+lookups and natural-language queries match. Words are cut to
+MAX_TOKEN_CHARS: term arrays are fixed-width, so one huge "word" (a
+base64 blob) would otherwise widen every term of its segment.
+"""
+import json
+import math
+import os
+import re
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+from vectorstore.base import matches_filter
+
+LEXICAL_INDEX_DIR = os.getenv(
+    "LEXICAL_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lexical_data"),
+)
+MAX_SEGMENTS = 8
+MAX_TOKEN_CHARS = 64
+COMPACT_DEAD_FRACTION = 0.25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+@lru_cache(maxsize=65536)
+def _word_tokens(word):
+    word = word[:MAX_TOKEN_CHARS]
+    lowered = word.lower()
+    if word == lowered and "_" not in word and not any(c.isdigit() for c in word):
+        return (lowered,)
+    parts = [part for piece in word.split("_") for part in _CAMEL_RE.findall(piece)]
+    if len(parts) > 1:
+        return (lowered,) + tuple(part.lower() for part in parts)
+    return (lowered,)
+
+
+def tokenize(text):
+    tokens = []
+    for word in _WORD_RE.findall(text):
+        tokens.extend(_word_tokens(word))
+    return tokens
+
+
+def _build_segment(doc_numbers, token_lists):
+    postings = {}
+    for doc, tokens in zip(doc_numbers, token_lists):
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            postings.setdefault(token, []).append((doc, tf))
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    docs, tfs = [], []
+    for i, term in enumerate(terms):
+        entries = postings[term]
+        docs.extend(entry[0] for entry in entries)
+        tfs.extend(min(entry[1], 65535) for entry in entries)
+        offsets[i + 1] = len(docs)
+    return {
+        # Tokens are ASCII, so one byte per character
+        "terms": np.asarray(terms, dtype=bytes),
+        "offsets": offsets,
+        "docs": np.asarray(docs, dtype=np.int32),
+        "tfs": np.asarray(tfs, dtype=np.uint16),
+    }
+
+
+class LexicalIndex:
+    def __init__(self, directory):
+        self.directory = directory
+        self.docs_path = os.path.join(directory, "docs.json")
+        self.log_path = os.path.join(directory, "docs.log")
+        self.lock = threading.RLock()
+        self.ids = []
+        self.lengths = np.zeros(0, dtype=np.int32)
+        self.metadata = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.positions = {}
+        self.segments = []
+        self.next_segment = 1
+        # Snapshot version; log lines of an older snapshot are ignored
+        self.version = 0
+        self._log_docs = 0
+        self._load()
+
+    # docs.json is only rewritten by merges, compaction and once the log
+    # outgrows the index; adds and deletes append a line to docs.log. A
+    # segment is written before the log line that lists it.
+
+    def _load(self):
+        if os.path.exists(self.docs_path):
+            with open(self.docs_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.ids = data["ids"]
+            self.lengths = np.asarray(data["lengths"], dtype=np.int32)
+            self.metadata = data["metadata"]
+            self.alive = np.ones(len(self.ids), dtype=bool)
+            if data.get("deleted"):
+                self.alive[np.asarray(data["deleted"], dtype=np.int64)] = False
+            self.next_segment = data.get("next_segment", 1)
+            self.version = data.get("version", 0)
+            for name in data.get("segments", []):
+                self.segments.append((name, self._read_segment(name)))
+        self.positions = {doc_id: i for i, doc_id in enumerate(self.ids) if self.alive[i]}
+        self._replay_log()
+        # Segments written by an add or merge that never made it into docs.json / docs.log
+        listed = {name for name, _ in self.segments}
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.startswith("seg-") and name not in listed:
+                    os.remove(os.path.join(self.directory, name))
+
+    def _read_segment(self, name):
+        with np.load(os.path.join(self.directory, name)) as segment:
+            data = {key: segment[key] for key in segment.files}
+        # Segments written before terms were stored as bytes
+        data["terms"] = data["terms"].astype(bytes)
+        return data
+
+    def _replay_log(self):
+        if not os.path.exists(self.log_path):
+            return
+        good = 0
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash, and nothing valid after it
+                    break
+                good += len(line)
+                if entry.get("v") != self.version:
+                    continue
+                if "add" in entry:
+                    ids, lengths, metadatas = zip(*entry["add"])
+                    self._add_docs(list(ids), list(lengths), list(metadatas))
+                    self.segments.append((entry["segment"], self._read_segment(entry["segment"])))
+                    self.next_segment = max(self.next_segment, int(entry["segment"][4:-4]) + 1)
+                    self._log_docs += len(ids)
+                else:
+                    self._remove_docs(entry["delete"])
+                    self._log_docs += len(entry["delete"])
+        if good < os.path.getsize(self.log_path):
+            with open(self.log_path, "r+b") as f:
+                f.truncate(good)
+
+    def _save(self):
+        """Write docs.json in full and start a new, empty log."""
+        self.version += 1
+        data = {
+            "ids": self.ids,
+            "lengths": self.lengths.tolist(),
+            "metadata": self.metadata,
+            "deleted": np.nonzero(~self.alive)[0].tolist(),
+            "segments": [name for name, _ in self.segments],
+            "next_segment": self.next_segment,
+            "version": self.version,
+        }
+        tmp_path = self.docs_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            # json.dumps uses the C encoder; json.dump to a file does not
+            f.write(json.dumps(data))
+        os.replace(tmp_path, self.docs_path)
+        open(self.log_path, "w").close()
+        self._log_docs = 0
+
+    def _log(self, entry, docs):
+        """Append one change to docs.log, or rewrite docs.json once the log outgrows the index."""
+        self._log_docs += docs
+        if self._log_docs > max(1000, len(self.ids)) or not os.path.exists(self.docs_path):
+            self._save()
+            return
+        entry["v"] = self.version
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def _write_segment(self, segment):
+        name = f"seg-{self.next_segment:05d}.npz"
+        self.next_segment += 1
+        np.savez_compressed(os.path.join(self.directory, name), **segment)
+        return name
+
+    def _add_docs(self, ids, lengths, metadatas):
+        for doc_id in ids:
+            previous = self.positions.get(doc_id)
+            if previous is not None:
+                self.alive[previous] = False
+        base = len(self.ids)
+        self.ids.extend(ids)
+        self.lengths = np.concatenate([self.lengths, np.asarray(lengths, dtype=np.int32)])
+        self.metadata.extend(dict(metadata) for metadata in metadatas)
+        self.alive = np.concatenate([self.alive, np.ones(len(ids), dtype=bool)])
+        for offset, doc_id in enumerate(ids):
+            self.positions[doc_id] = base + offset
+        return list(range(base, base + len(ids)))
+
+    def _remove_docs(self, ids):
+        removed = []
+        for doc_id in ids:
+            position = self.positions.pop(doc_id, None)
+            if position is not None:
+                self.alive[position] = False
+                removed.append(doc_id)
+        return removed
+
+    def _merged(self, segments, renumber=None):
+        """One segment holding the live postings of segments, doc numbers mapped through renumber."""
+        terms, docs, tfs = [], [], []
+        for _, segment in segments:
+            terms.append(np.repeat(segment["terms"], np.diff(segment["offsets"])))
+            docs.append(segment["docs"])
+            tfs.append(segment["tfs"])
+        terms, docs, tfs = np.concatenate(terms), np.concatenate(docs), np.concatenate(tfs)
+        keep = self.alive[docs]
+        terms, docs, tfs = terms[keep], docs[keep], tfs[keep]
+        if renumber is not None:
+            docs = renumber[docs]
+        order = np.argsort(terms, kind="stable")
+        terms, docs, tfs = terms[order], docs[order], tfs[order]
+        unique_terms, starts = np.unique(terms, return_index=True)
+        return {
+            "terms": unique_terms,
+            "offsets": np.append(starts, len(terms)).astype(np.int64),
+            "docs": docs.astype(np.int32),
+            "tfs": tfs.astype(np.uint16),
+        }
+
+    def _replace_segments(self, chosen_names, merged):
+        self.segments = [item for item in self.segments if item[0] not in chosen_names]
+        if len(merged["docs"]):
+            self.segments.append((self._write_segment(merged), merged))
+        self._save()
+        for name in chosen_names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def _merge_segments(self):
+        """Merge the smallest half of the segments into one, dropping postings of deleted docs."""
+        by_size = sorted(self.segments, key=lambda item: len(item[1]["docs"]))
+        chosen = by_size[:len(self.segments) // 2 + 1]
+        self._replace_segments({name for name, _ in chosen}, self._merged(chosen))
+
+    def _compact(self):
+        """Rewrite every segment and the doc table without deleted docs."""
+        keep = np.nonzero(self.alive)[0]
+        renumber = np.full(len(self.ids), -1, dtype=np.int64)
+        renumber[keep] = np.arange(len(keep))
+        merged = self._merged(self.segments, renumber) if self.segments else {"docs": []}
+        self.ids = [self.ids[i] for i in keep]
+        self.lengths = self.lengths[keep]
+        self.metadata = [self.metadata[i] for i in keep]
+        self.alive = np.ones(len(keep), dtype=bool)
+        self.positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self._replace_segments({name for name, _ in self.segments}, merged)
+
+    def _maintain(self):
+        """Merge or compact as needed. True if that rewrote docs.json."""
+        if len(self.ids) and (len(self.ids) - len(self.positions)) / len(self.ids) > COMPACT_DEAD_FRACTION:
+            self._compact()
+            return True
+        if len(self.segments) > MAX_SEGMENTS:
+            self._merge_segments()
+            return True
+        return False
+
+    def add_documents(self, ids, texts, metadatas=None):
+        """Index chunks; re-adding an existing id replaces it."""
+        if not ids:
+            return
+        metadatas = [dict(metadata) for metadata in (metadatas or [{} for _ in ids])]
+        # The same id twice in one call: the last one wins
+        latest = {doc_id: i for i, doc_id in enumerate(ids)}
+        if len(latest) < len(ids):
+            chosen = sorted(latest.values())
+            ids, texts, metadatas = [ids[i] for i in chosen], [texts[i] for i in chosen], [metadatas[i] for i in chosen]
+        token_lists = [tokenize(text) for text in texts]
+        lengths = [len(tokens) for tokens in token_lists]
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            doc_numbers = self._add_docs(ids, lengths, metadatas)
+            segment = _build_segment(doc_numbers, token_lists)
+            name = self._write_segment(segment)
+            self.segments.append((name, segment))
+            if not self._maintain():
+                self._log({"add": [list(item) for item in zip(ids, lengths, metadatas)], "segment": name}, len(ids))
+
+    def delete(self, ids):
+        with self.lock:
+            removed = self._remove_docs(ids)
+            if removed and not self._maintain():
+                self._log({"delete": removed}, len(removed))
+            return len(removed)
+
+    def search(self, query, top_k=5, filters=None):
+        """Return [{"id", "score", "metadata"}] ranked by BM25."""
+        terms = sorted(set(tokenize(query)))
+        with self.lock:
+            live = int(self.alive.sum())
+            if not terms or live == 0:
+                return []
+            average_length = float(self.lengths[self.alive].mean()) or 1.0
+            norms = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / average_length)
+            scores = np.zeros(len(self.ids), dtype=np.float32)
+            for term in terms:
+                hits = []
+                term = term.encode("ascii")
+                for _, segment in self.segments:
+                    position = np.searchsorted(segment["terms"], term)
+                    if position < len(segment["terms"]) and segment["terms"][position] == term:
+                        start, end = segment["offsets"][position], segment["offsets"][position + 1]
+                        hits.append((segment["docs"][start:end], segment["tfs"][start:end]))
+                if not hits:
+                    continue
+                docs = np.concatenate([hit[0] for hit in hits])
+                tfs = np.concatenate([hit[1] for hit in hits]).astype(np.float32)
+                df = int(self.alive[docs].sum())
+                if df == 0:
+                    continue
+                idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+                np.add.at(scores, docs, idf * tfs * (BM25_K1 + 1) / (tfs + norms[docs]))
+            scores[~self.alive] = 0
+            candidates = np.nonzero(scores)[0]
+            if filters:
+                candidates = np.asarray([doc for doc in candidates if matches_filter(self.metadata[doc], filters)], dtype=np.int64)
+            if len(candidates) == 0:
+                return []
+            k = min(top_k, len(candidates))
+            best = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            best = best[np.argsort(-scores[best])]
+            return [{"id": self.ids[doc], "score": float(scores[doc]), "metadata": dict(self.metadata[doc])} for doc in best]
+
+    def size_on_disk(self):
+        total = 0
+        for name in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+            total += os.path.getsize(os.path.join(self.directory, name))
+        return total
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_lexical_index(user_id, root=None):
+    """Return the (cached) BM25 index for a user."""
+    directory = os.path.join(root or LEXICAL_INDEX_DIR, str(user_id))
+    with _indexes_lock:
+        index = _indexes.get(directory)
+        if index is None:
+            index = _indexes[directory] = LexicalIndex(directory)
+        return index
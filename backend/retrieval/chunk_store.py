@@ -0,0 +1,57 @@
+"""
+Chunk text store, addressed by vector ID.
+
+Vectors only carry small metadata (user_id, filename, chunk_id); the chunk
+text itself is zlib-compressed into the MySQL `chunks` table at ingest and
+looked up in bulk once retrieval has picked the winning ids. This keeps
+query responses from the vector store small and lifts the vector
+metadata size limit off the chunk size.
+"""
+import threading
+import zlib
+
+from db import models
+
+# Ids per SELECT ... IN (...) / DELETE ... IN (...) statement
+LOOKUP_BATCH_SIZE = 500
+COMPRESSION_LEVEL = 6
+
+_table_ready = False
+_table_lock = threading.Lock()
+
+
+def _ensure_table():
+    global _table_ready
+    if not _table_ready:
+        with _table_lock:
+            if not _table_ready:
+                models.create_chunks_table()
+                _table_ready = True
+
+
+def put_chunks(user_id, ids, texts):
+    """Store (or replace) the text of each chunk under its vector id."""
+    _ensure_table()
+    rows = [(chunk_id, user_id, zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL)) for chunk_id, text in zip(ids, texts)]
+    for start in range(0, len(rows), LOOKUP_BATCH_SIZE):
+        models.save_chunks(rows[start:start + LOOKUP_BATCH_SIZE])
+
+
+def get_chunk_texts(ids):
+    """Return {id: text} for the ids that are in the store."""
+    _ensure_table()
+    ids = list(ids)
+    texts = {}
+    for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+        for chunk_id, body in models.get_chunks(ids[start:start + LOOKUP_BATCH_SIZE]).items():
+            texts[chunk_id] = zlib.decompress(body).decode("utf-8")
+    return texts
+
+
+def delete_chunk_texts(ids):
+    _ensure_table()
+    ids = list(ids)
+    deleted = 0
+    for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+        deleted += models.delete_chunks(ids[start:start + LOOKUP_BATCH_SIZE])
+    return deleted
@@ -0,0 +1,22 @@
+"""
+Rank fusion for combining result lists from different retrievers.
+"""
+
+# Standard RRF damping constant; larger values flatten the rank curve
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(result_lists, top_k=5, k=RRF_K):
+    """
+    Fuse ranked lists of {"id", "score", "metadata"} dicts by reciprocal rank.
+    Returns fused dicts (metadata taken from the first list that had the id),
+    with "score" replaced by the RRF score.
+    """
+    fused = {}
+    for results in result_lists:
+        for rank, match in enumerate(results):
+            entry = fused.get(match["id"])
+            if entry is None:
+                entry = fused[match["id"]] = {"id": match["id"], "score": 0.0, "metadata": match["metadata"]}
+            entry["score"] += 1.0 / (k + rank + 1)
+    return sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)[:top_k]
@@ -0,0 +1,76 @@
+"""
+Query variants for multi-query retrieval.
+
+Each variant is searched separately and the result lists are fused, so a
+chunk that matches the question under any phrasing can be retrieved.
+
+- "heuristic": free local rewrites of the original query (content words
+  only, and exact identifiers / quoted phrases on their own)
+- "llm":       one completion call asking the LLM for paraphrases, falling
+  back to the heuristics if the call fails
+"""
+import logging
+import re
+
+_STOPWORDS = frozenset("""
+a an and are as at be but by can could did do does for from had has have how i if in into is it its
+me my of on or our please should so tell than that the their them then there these they this to
+was we were what when where which who whom why will with would you your about any all explain
+""".split())
+_WORD_RE = re.compile(r"[A-Za-z0-9_.\-]+")
+_QUOTED_RE = re.compile(r"\"([^\"]+)\"|'([^']+)'")
+# Tokens that look like identifiers: contain a digit, an underscore, a dot or inner capitals
+_IDENTIFIER_RE = re.compile(r"^(?=.*(\d|_|\.\w|[a-z][A-Z]))[\w.\-]+$")
+
+REWRITE_PROMPT = (
+    "Rewrite the following search question {count} different ways so that together they "
+    "cover other wordings a document might use. Return one rewrite per line with no "
+    "numbering or extra text.\n\nQuestion: {query}"
+)
+
+
+def heuristic_variants(query):
+    """Keyword-only and identifier-only forms of the query (possibly empty)."""
+    variants = []
+    words = _WORD_RE.findall(query)
+    keywords = [word.strip(".-") for word in words if word.lower().strip(".-") not in _STOPWORDS]
+    keywords = [word for word in keywords if word]
+    if keywords:
+        variants.append(" ".join(keywords))
+    exact = [a or b for a, b in _QUOTED_RE.findall(query)]
+    exact += [word for word in words if _IDENTIFIER_RE.match(word) and word not in exact]
+    if exact:
+        variants.append(" ".join(exact))
+    return variants
+
+
+def llm_variants(query, llm, count, user_id=None):
+    from monitoring.usage import usage, estimate_tokens
+    from upstream.client import get_upstream
+    prompt = REWRITE_PROMPT.format(count=count, query=query)
+    response = get_upstream("gemini_llm").call(llm.complete, prompt, user_id=user_id)
+    usage.record(user_id, llm_input_tokens=estimate_tokens(prompt), llm_output_tokens=estimate_tokens(str(response)))
+    lines = [re.sub(r"^\s*(?:[-*]|\d+[.)])\s*", "", line).strip() for line in str(response).splitlines()]
+    return [line for line in lines if line]
+
+
+def query_variants(query, max_variants=3, mode="heuristic", llm=None, user_id=None):
+    """The original query first, then up to max_variants - 1 distinct rewrites."""
+    candidates = []
+    if mode == "llm" and llm is not None and max_variants > 1:
+        try:
+            candidates = llm_variants(query, llm, max_variants - 1, user_id)
+        except Exception as e:
+            logging.warning(f"[QUERY] Query rewrite failed, using heuristics: {e}")
+    if mode != "off" and not candidates:
+        candidates = heuristic_variants(query)
+
+    variants, seen = [query], {query.strip().lower()}
+    for candidate in candidates:
+        key = candidate.strip().lower()
+        if key and key not in seen:
+            seen.add(key)
+            variants.append(candidate.strip())
+        if len(variants) >= max_variants:
+            break
+    return variants
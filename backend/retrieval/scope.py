@@ -0,0 +1,94 @@
+"""
+Query scopes: restrict a search to some of the user's files.
+
+A scope is a dict with any of
+    files            exact filenames
+    extensions       ".pdf", "md", ... (case-insensitive, dot optional)
+    uploaded_after   upload time bounds, as UTC epoch seconds
+    uploaded_before
+
+It is pushed down into the searches as a metadata filter on the filename,
+extension and uploaded_at fields every chunk carries, so the vector store and
+the BM25 index only rank chunks of the selected files. Chunks ingested before
+extension and uploaded_at were recorded only match file scopes.
+
+Deduplicated files have no per-user fields on their shared chunks, so the
+scope picks which of the user's content references to search instead.
+"""
+import datetime
+import os
+
+
+def normalize_extension(extension):
+    extension = extension.strip().lower()
+    return extension if extension.startswith(".") else f".{extension}"
+
+
+def _epoch(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if value.tzinfo is None:
+        # Naive times are taken as UTC, like every timestamp the API returns
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return int(value.timestamp())
+
+
+def build_scope(files=None, extensions=None, uploaded_after=None, uploaded_before=None):
+    """Scope dict from API parameters (datetimes or epoch seconds), or None when nothing is restricted."""
+    scope = {}
+    if files:
+        scope["files"] = list(dict.fromkeys(files))
+    if extensions:
+        scope["extensions"] = list(dict.fromkeys(normalize_extension(extension) for extension in extensions))
+    if uploaded_after is not None:
+        scope["uploaded_after"] = _epoch(uploaded_after)
+    if uploaded_before is not None:
+        scope["uploaded_before"] = _epoch(uploaded_before)
+    return scope or None
+
+
+def vector_filter(scope):
+    """Metadata filter for the user's own chunks (None when unscoped)."""
+    if not scope:
+        return None
+    condition = {}
+    if "files" in scope:
+        condition["filename"] = {"$in": scope["files"]}
+    if "extensions" in scope:
+        condition["extension"] = {"$in": scope["extensions"]}
+    uploaded = {}
+    if "uploaded_after" in scope:
+        uploaded["$gte"] = scope["uploaded_after"]
+    if "uploaded_before" in scope:
+        uploaded["$lte"] = scope["uploaded_before"]
+    if uploaded:
+        condition["uploaded_at"] = uploaded
+    return condition
+
+
+def scoped_content(scope, refs, uploaded_filenames=None):
+    """
+    The content hashes of refs ({hash: filename}) inside the scope.
+    uploaded_filenames is the set of the user's filenames uploaded within the
+    scope's dates (needed only when it has date bounds).
+    """
+    if not scope:
+        return sorted(refs)
+    selected = []
+    for content_hash, filename in refs.items():
+        if "files" in scope and filename not in scope["files"]:
+            continue
+        if "extensions" in scope and os.path.splitext(filename)[1].lower() not in scope["extensions"]:
+            continue
+        if uploaded_filenames is not None and filename not in uploaded_filenames:
+            continue
+        selected.append(content_hash)
+    return sorted(selected)
+
+
+def has_dates(scope):
+    return bool(scope) and ("uploaded_after" in scope or "uploaded_before" in scope)
+
+
+def epoch_to_datetime(seconds):
+    return None if seconds is None else datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc)
@@ -0,0 +1,197 @@
+"""
+Two-level retrieval for users with many documents.
+
+Ingestion stores one summary vector per document: the normalised mean of
+its chunk embeddings (document_vectors table). At query time the user's
+summary vectors are ranked in process (one matrix product) and only the
+chunks of the best TWO_LEVEL_DOCUMENTS documents are searched in the vector
+store, through a filename / content-hash filter. BM25 searches stay
+corpus-wide, so an exact identifier is still found in any document.
+
+RETRIEVAL_STRATEGY:
+- "auto" (default): two-level once a user has TWO_LEVEL_MIN_DOCUMENTS documents
+- "two_level": always (for users with any documents)
+- "flat": never
+
+Documents without a summary vector (ingested before this existed) are
+always searched; in "auto" mode too many of them fall back to flat search.
+Each worker caches a user's summary matrix for DOCUMENT_INDEX_CACHE_SECONDS;
+its own ingests and deletions refresh it at once.
+"""
+import collections
+import os
+import threading
+import time
+
+import numpy as np
+
+from db import models
+from retrieval.scope import epoch_to_datetime, has_dates
+
+RETRIEVAL_STRATEGY = os.getenv("RETRIEVAL_STRATEGY", "auto").lower()
+TWO_LEVEL_MIN_DOCUMENTS = int(os.getenv("TWO_LEVEL_MIN_DOCUMENTS", "500"))
+# Documents whose chunks are searched in the second stage
+TWO_LEVEL_DOCUMENTS = int(os.getenv("TWO_LEVEL_DOCUMENTS", "20"))
+DOCUMENT_INDEX_CACHE_SECONDS = float(os.getenv("DOCUMENT_INDEX_CACHE_SECONDS", "30"))
+# Users whose summary matrices are kept per worker (least recently used are dropped)
+DOCUMENT_INDEX_CACHE_USERS = int(os.getenv("DOCUMENT_INDEX_CACHE_USERS", "64"))
+
+_table_ready = False
+_table_lock = threading.Lock()
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _ensure_table():
+    global _table_ready
+    if not _table_ready:
+        with _table_lock:
+            if not _table_ready:
+                models.create_document_vectors_table()
+                _table_ready = True
+
+
+def _invalidate(user_id=None):
+    with _cache_lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+
+def record_document(user_id, doc_key, embedding_sum, chunk_count, shared=False):
+    """Store a document's summary vector from the sum of its chunk embeddings."""
+    from ingestion.dedup import SHARED_CONTENT_OWNER
+    _ensure_table()
+    vector = np.asarray(embedding_sum, dtype=np.float32) / max(chunk_count, 1)
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    owner = SHARED_CONTENT_OWNER if shared else user_id
+    models.save_document_vector(owner, doc_key, chunk_count, vector.tobytes())
+    _invalidate(user_id)
+
+
+def forget_documents(owner_id, doc_keys):
+    """Drop summary vectors (owner 0 for shared documents)."""
+    _ensure_table()
+    models.delete_document_vectors(owner_id, doc_keys)
+    # A shared document may be in any user's cached matrix
+    _invalidate(owner_id or None)
+
+
+class _DocumentIndex:
+    """One user's summary matrix: own documents by filename, shared ones by content hash."""
+
+    def __init__(self, user_id):
+        from ingestion.dedup import SHARED_CONTENT_OWNER, user_content
+        refs = user_content(user_id)
+        own = models.get_document_vectors(user_id)
+        shared = models.get_document_vectors(SHARED_CONTENT_OWNER, list(refs))
+        # (key, filename shown to the user, is shared)
+        self.documents = [(key, key, False) for key in own] + [(key, refs[key], True) for key in shared]
+        rows = [np.frombuffer(blob, dtype=np.float32) for blob in list(own.values()) + list(shared.values())]
+        self.dim = rows[0].shape[0] if rows else 0
+        # Summary vectors of another dimension (a different embedding model) cannot be compared
+        keep = [i for i, row in enumerate(rows) if row.shape[0] == self.dim]
+        self.documents = [self.documents[i] for i in keep]
+        self.matrix = np.vstack([rows[i] for i in keep]) if keep else np.zeros((0, self.dim), dtype=np.float32)
+        self.shared_keys = {key for key, _, is_shared in self.documents if is_shared}
+        filenames = models.get_user_filenames_uploaded_between(user_id)
+        self.unindexed = filenames - set(own) - set(refs.values())
+        self.expires = time.monotonic() + DOCUMENT_INDEX_CACHE_SECONDS
+
+    def __len__(self):
+        return len(self.documents) + len(self.unindexed)
+
+
+def _index_for(user_id):
+    now = time.monotonic()
+    with _cache_lock:
+        index = _cache.get(user_id)
+        if index is not None and index.expires > now:
+            _cache.move_to_end(user_id)
+            return index
+    _ensure_table()
+    index = _DocumentIndex(user_id)
+    with _cache_lock:
+        _cache[user_id] = index
+        _cache.move_to_end(user_id)
+        while len(_cache) > DOCUMENT_INDEX_CACHE_USERS:
+            _cache.popitem(last=False)
+    return index
+
+
+def _in_scope(scope, filename, uploaded=None):
+    if not scope:
+        return True
+    if "files" in scope and filename not in scope["files"]:
+        return False
+    if "extensions" in scope and os.path.splitext(filename)[1].lower() not in scope["extensions"]:
+        return False
+    if uploaded is not None and filename not in uploaded:
+        return False
+    return True
+
+
+def select_documents(user_id, embeddings, shared, scope=None, limit=None, strategy=None):
+    """
+    First stage: the documents whose chunks should be searched, as
+    (own filenames, shared content hashes), or None to search flat.
+    shared is the user's in-scope shared documents ({hash: filename}); own
+    documents are checked against the scope's files, extensions and dates.
+    limit and strategy default to TWO_LEVEL_DOCUMENTS and RETRIEVAL_STRATEGY.
+    """
+    limit = limit or TWO_LEVEL_DOCUMENTS
+    strategy = strategy or RETRIEVAL_STRATEGY
+    if strategy == "flat" or not embeddings:
+        return None
+    index = _index_for(user_id)
+    if strategy == "auto" and (len(index) < TWO_LEVEL_MIN_DOCUMENTS or len(index.unindexed) > limit):
+        return None
+    if not index.documents or len(embeddings[0]) != index.dim:
+        return None
+
+    uploaded = None
+    if has_dates(scope):
+        # Summary vectors carry no upload time: only files uploaded within the dates are candidates
+        uploaded = models.get_user_filenames_uploaded_between(
+            user_id, epoch_to_datetime(scope.get("uploaded_after")), epoch_to_datetime(scope.get("uploaded_before"))
+        )
+
+    def selectable(key, filename, is_shared):
+        return key in shared if is_shared else _in_scope(scope, filename, uploaded)
+
+    if not scope and index.shared_keys.issubset(shared):
+        # Unscoped: every summary vector is a candidate, no per-document check
+        candidates = list(range(len(index.documents)))
+    else:
+        candidates = [i for i, document in enumerate(index.documents) if selectable(*document)]
+    own = sorted(filename for filename in index.unindexed if _in_scope(scope, filename, uploaded))
+    shared_keys = []
+    if candidates:
+        # Best match of any query variant, per document
+        queries = np.asarray(embeddings, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        matrix = index.matrix if len(candidates) == len(index.documents) else index.matrix[candidates]
+        scores = (matrix @ queries.T).max(axis=1)
+        k = min(limit, len(candidates))
+        best = np.argpartition(-scores, k - 1)[:k]
+        for position in best:
+            key, filename, is_shared = index.documents[candidates[position]]
+            if is_shared:
+                shared_keys.append(key)
+            else:
+                own.append(filename)
+    return own, shared_keys
+
+
+def restrict_filter(condition, filenames):
+    """Add "filename in filenames" to a flat metadata filter, intersecting an existing filename condition."""
+    condition = dict(condition or {})
+    existing = condition.get("filename")
+    if existing is not None:
+        allowed = set(existing["$in"]) if isinstance(existing, dict) else {existing}
+        filenames = [filename for filename in filenames if filename in allowed]
+    condition["filename"] = {"$in": sorted(filenames)}
+    return condition
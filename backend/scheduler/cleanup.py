@@ -1,15 +1,165 @@
+"""
+Retention job: removes uploads and search history older than RETENTION_DAYS,
+together with the file's vectors, chunk text and lexical index entries (or,
+for a deduplicated file, the user's reference to the shared copy).
+
+Work is done in bounded batches so no statement holds row locks for long:
+- files are read CLEANUP_BATCH_SIZE at a time; their vectors are deleted
+  first and the rows last, so a run that dies half way is simply picked up
+  by the next one (vector deletes are idempotent)
+- search history is removed with DELETE ... LIMIT until nothing is left
+- the job sleeps CLEANUP_PAUSE_SECONDS between batches to leave room for
+  foreground traffic
+
+Only one process runs the job at a time (MySQL GET_LOCK), so it is safe to
+start the scheduler in every API worker.
+
+Run once by hand from the backend directory:
+    python -m scheduler.cleanup
+"""
 import datetime
-from ..db.models import delete_old_files_and_history
-
-# Example: Import your vector DB client
-# from vector_db_client import delete_old_embeddings
-
-def cleanup_old_data():
-    # Calculate cutoff datetime (30 days ago)
-    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=30)
-    # 1. Delete old embeddings from vector DB (placeholder logic)
-    # Example: delete_old_embeddings(cutoff)
-    print(f"[MOCK] Would delete embeddings older than {cutoff}")
-    # 2. Delete metadata and search history older than 30 days from MySQL
-    delete_old_files_and_history(cutoff)
-    print(f"Deleted metadata and search history older than {cutoff}") 
\ No newline at end of file
+import logging
+import os
+import threading
+import time
+
+from db.connection import get_connection
+from db.models import get_expired_files, delete_files_by_ids, delete_old_search_history
+from ingestion.catalog import remove_files
+from monitoring.metrics import counter
+from vectorstore.base import get_vector_store
+
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "30"))
+CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", "500"))
+CLEANUP_PAUSE_SECONDS = float(os.getenv("CLEANUP_PAUSE_SECONDS", "0.5"))
+# Hours between scheduled runs; 0 disables the scheduler
+CLEANUP_INTERVAL_HOURS = float(os.getenv("CLEANUP_INTERVAL_HOURS", "24"))
+
+CLEANUP_LOCK_NAME = "rag_bot_cleanup"
+
+CLEANUP_ROWS = counter("rag_cleanup_rows_deleted_total", "Rows removed by the retention job", ["table"])
+CLEANUP_VECTORS = counter("rag_cleanup_vectors_deleted_total", "Vectors removed by the retention job")
+
+_scheduler_thread = None
+_stop_event = threading.Event()
+
+
+def _delete_file_batch(rows, vector_store):
+    """Delete the vectors of one batch of expired files, then the rows. Returns vectors removed."""
+    by_user = {}
+    for row in rows:
+        # A newer upload of the same filename reuses the same vector ids; keep those
+        if not row["still_live"]:
+            by_user.setdefault(row["user_id"], set()).add(row["filename"])
+
+    vectors_removed = 0
+    for user_id, filenames in by_user.items():
+        # The document catalog names each file's vector ids, so no listing is needed
+        vectors_removed += remove_files(user_id, sorted(filenames), vector_store)
+    return vectors_removed
+
+
+def _acquire_lock():
+    """Take the cross-process job lock; returns the holding connection, or None if another worker runs the job."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT GET_LOCK(%s, 0)", (CLEANUP_LOCK_NAME,))
+    acquired = cur.fetchone()[0] == 1
+    cur.close()
+    if not acquired:
+        conn.close()
+        return None
+    return conn
+
+
+def _release_lock(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT RELEASE_LOCK(%s)", (CLEANUP_LOCK_NAME,))
+    cur.fetchone()
+    cur.close()
+    conn.close()
+
+
+def cleanup_old_data(retention_days=RETENTION_DAYS, batch_size=CLEANUP_BATCH_SIZE, pause=CLEANUP_PAUSE_SECONDS):
+    """
+    Run one retention pass and return a report:
+    {"cutoff", "files", "vectors", "search_history", "batches", "seconds"}.
+    Returns None when another process already holds the job lock.
+    """
+    lock_conn = _acquire_lock()
+    if lock_conn is None:
+        logging.info("[CLEANUP] Another worker is running the retention job, skipping")
+        return None
+
+    start = time.perf_counter()
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+    report = {"cutoff": cutoff.isoformat(), "files": 0, "vectors": 0, "search_history": 0, "batches": 0}
+    try:
+        vector_store = get_vector_store()
+
+        # 1. Expired files: vectors first, then rows, one bounded batch at a time
+        while not _stop_event.is_set():
+            rows = get_expired_files(cutoff, batch_size)
+            if not rows:
+                break
+            vectors = _delete_file_batch(rows, vector_store)
+            files = delete_files_by_ids([row["id"] for row in rows])
+            report["vectors"] += vectors
+            report["files"] += files
+            report["batches"] += 1
+            CLEANUP_VECTORS.inc(vectors)
+            CLEANUP_ROWS.inc(files, table="files")
+            if len(rows) < batch_size:
+                break
+            time.sleep(pause)
+
+        # 2. Search history: chunked DELETE ... LIMIT
+        while not _stop_event.is_set():
+            deleted = delete_old_search_history(cutoff, batch_size)
+            report["search_history"] += deleted
+            report["batches"] += 1
+            CLEANUP_ROWS.inc(deleted, table="search_history")
+            if deleted < batch_size:
+                break
+            time.sleep(pause)
+    finally:
+        _release_lock(lock_conn)
+
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    logging.info(
+        f"[CLEANUP] Removed {report['files']} files, {report['vectors']} vectors and "
+        f"{report['search_history']} search history rows older than {cutoff} "
+        f"in {report['batches']} batches ({report['seconds']}s)"
+    )
+    return report
+
+
+def _run_forever(interval_seconds):
+    while not _stop_event.wait(interval_seconds):
+        try:
+            cleanup_old_data()
+        except Exception as e:
+            # Keep the scheduler alive; the next run resumes where this one stopped
+            logging.error(f"[CLEANUP] Retention run failed: {e}")
+
+
+def start_cleanup_scheduler(interval_hours=CLEANUP_INTERVAL_HOURS):
+    """Run cleanup_old_data every interval_hours on a daemon thread."""
+    global _scheduler_thread
+    if interval_hours <= 0 or (_scheduler_thread is not None and _scheduler_thread.is_alive()):
+        return
+    _stop_event.clear()
+    _scheduler_thread = threading.Thread(
+        target=_run_forever, args=(interval_hours * 3600,), name="retention-cleanup", daemon=True
+    )
+    _scheduler_thread.start()
+
+
+def stop_cleanup_scheduler():
+    # Also makes a run in progress stop after its current batch
+    _stop_event.set()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(cleanup_old_data())
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# Tests import backend modules the way the app does (run from the backend directory)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def env(tmp_path):
+    """The app wired to the bench stand-ins (SQLite, fake Pinecone, hashing embeddings), with fresh data per test."""
+    from bench.harness import install_fakes
+    import ingestion.dedup
+    import retrieval.bm25
+    import retrieval.two_level
+
+    environment = install_fakes(db_path=str(tmp_path / "db.sqlite3"), dim=32, llm_latency_ms=0)
+    # Per-process caches would otherwise point at the previous test's data
+    retrieval.bm25._indexes.clear()
+    retrieval.two_level._cache.clear()
+    ingestion.dedup._refs_cache.clear()
+    return environment
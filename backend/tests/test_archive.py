@@ -0,0 +1,54 @@
+import io
+import tarfile
+import warnings
+import zipfile
+
+import pytest
+
+from ingestion.archive import clean_entry_name, list_entries, read_entries
+
+
+def make_zip(path, entries):
+    with warnings.catch_warnings():
+        # zipfile warns about the duplicate name we write on purpose
+        warnings.simplefilter("ignore")
+        with zipfile.ZipFile(path, "w") as archive:
+            for name, data in entries:
+                archive.writestr(name, data)
+
+
+def make_tar(path, entries):
+    with tarfile.open(path, "w:gz") as archive:
+        for name, data in entries:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+
+
+@pytest.mark.parametrize("suffix, make", [(".zip", make_zip), (".tar.gz", make_tar)])
+def test_duplicate_entry_is_read_once(tmp_path, suffix, make):
+    path = tmp_path / f"upload{suffix}"
+    make(path, [("docs/a.txt", b"first"), ("docs/b.txt", b"other"), ("docs/a.txt", b"second")])
+    filename = path.name
+    assert [name for name, _ in list_entries(path, filename)] == ["docs/a.txt", "docs/b.txt", "docs/a.txt"]
+    assert list(read_entries(path, filename, ["docs/a.txt", "docs/b.txt"], 100)) == [("docs/a.txt", b"first"), ("docs/b.txt", b"other")]
+
+
+@pytest.mark.parametrize("suffix, make", [(".zip", make_zip), (".tar.gz", make_tar)])
+def test_oversized_entry_yields_none(tmp_path, suffix, make):
+    path = tmp_path / f"upload{suffix}"
+    make(path, [("big.txt", b"x" * 101), ("small.txt", b"ok")])
+    assert list(read_entries(path, path.name, ["big.txt", "small.txt"], 100)) == [("big.txt", None), ("small.txt", b"ok")]
+
+
+@pytest.mark.parametrize("name, cleaned", [
+    ("docs/a.txt", "docs/a.txt"),
+    ("./docs//a.txt", "docs/a.txt"),
+    ("docs\\a.txt", "docs/a.txt"),
+    ("../etc/passwd", None),
+    ("__MACOSX/docs/a.txt", None),
+    ("docs/._a.txt", None),
+    ("/", None),
+])
+def test_clean_entry_name(name, cleaned):
+    assert clean_entry_name(name) == cleaned
@@ -0,0 +1,84 @@
+import os
+
+from retrieval.bm25 import LexicalIndex, MAX_TOKEN_CHARS, tokenize
+
+TEXTS = {
+    "a": "the invoice total for order 42",
+    "b": "shipping policy and refund rules",
+    "c": "call getUserName before order_total",
+}
+
+
+def ids(results):
+    return [result["id"] for result in results]
+
+
+def build(path):
+    index = LexicalIndex(str(path))
+    index.add_documents(list(TEXTS), list(TEXTS.values()), [{"filename": f"{doc}.txt"} for doc in TEXTS])
+    return index
+
+
+def test_tokenize_splits_identifiers_and_caps_length():
+    assert tokenize("getUserName order_total") == ["getusername", "get", "user", "name", "order_total", "order", "total"]
+    assert tokenize("x" * 20000) == ["x" * MAX_TOKEN_CHARS]
+
+
+def test_search_and_filters(tmp_path):
+    index = build(tmp_path)
+    assert ids(index.search("refund policy")) == ["b"]
+    assert ids(index.search("getUserName")) == ["c"]
+    assert ids(index.search("user name")) == ["c"]
+    assert set(ids(index.search("order"))) == {"a", "c"}
+    assert ids(index.search("order", filters={"filename": "a.txt"})) == ["a"]
+    assert index.search("nothing matches") == []
+
+
+def test_delete_and_replace_survive_reload(tmp_path):
+    index = build(tmp_path)
+    assert index.delete(["b", "missing"]) == 1
+    index.add_documents(["a"], ["refund for a damaged parcel"])
+    reloaded = LexicalIndex(str(tmp_path))
+    assert len(reloaded) == 2
+    assert ids(reloaded.search("refund")) == ["a"]
+    assert ids(reloaded.search("invoice")) == []
+
+
+def test_adds_append_to_the_log_until_a_snapshot(tmp_path):
+    index = build(tmp_path)
+    version = index.version
+    index.add_documents(["d"], ["warehouse audit"])
+    index.delete(["a"])
+    assert index.version == version
+    with open(index.log_path) as f:
+        assert len(f.readlines()) == 2
+    assert ids(LexicalIndex(str(tmp_path)).search("audit")) == ["d"]
+
+
+def test_torn_log_line_and_unlisted_segment_are_dropped(tmp_path):
+    index = build(tmp_path)
+    index.add_documents(["d"], ["warehouse audit"])
+    with open(index.log_path, "a") as f:
+        f.write('{"add": [["e", 1')
+    open(os.path.join(str(tmp_path), "seg-00099.npz"), "wb").close()
+    reloaded = LexicalIndex(str(tmp_path))
+    assert ids(reloaded.search("audit")) == ["d"]
+    assert not os.path.exists(os.path.join(str(tmp_path), "seg-00099.npz"))
+    reloaded.add_documents(["f"], ["quarterly forecast"])
+    assert ids(LexicalIndex(str(tmp_path)).search("forecast")) == ["f"]
+
+
+def test_merges_and_compaction_drop_deleted_docs(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    words = "alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima mike november oscar papa quebec romeo sierra tango".split()
+    for i, word in enumerate(words):
+        index.add_documents([f"d{i}"], [f"common {word}"])
+    assert len(index.segments) <= 9
+    index.delete([f"d{i}" for i in range(10)])
+    # More than a quarter of the docs were deleted: they are gone from the table and the postings
+    assert len(index.ids) == 10
+    assert len(index.segments) == 1
+    reloaded = LexicalIndex(str(tmp_path))
+    assert sorted(ids(reloaded.search("common", top_k=50))) == sorted(f"d{i}" for i in range(10, 20))
+    assert ids(reloaded.search("papa")) == ["d15"]
+    assert reloaded.search("delta") == []
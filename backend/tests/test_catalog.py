@@ -0,0 +1,69 @@
+import pytest
+
+import ingestion.catalog as catalog
+import ingestion.pipeline as pipeline
+from retrieval.bm25 import get_lexical_index
+from retrieval.chunk_store import get_chunk_texts
+from vectorstore.base import get_vector_store
+
+
+def failing_chunks(count):
+    def chunks(contents, filename):
+        for i in range(count):
+            yield f"record {i} of {filename} with some words"
+        raise ValueError("truncated document")
+    return chunks
+
+
+@pytest.fixture
+def streaming_failure(env, monkeypatch):
+    # Windows of two chunks; the parser dies after seven, i.e. with three windows stored and one pending
+    monkeypatch.setattr(pipeline, "INGEST_WINDOW_CHUNKS", 2)
+    monkeypatch.setattr(pipeline, "iter_structured_chunks", failing_chunks(7))
+    user_id, _ = env.create_user("catalog@test")
+    return user_id
+
+
+def unavailable(*args, **kwargs):
+    raise ConnectionError("vector store unavailable")
+
+
+def stored_ids(user_id, filename):
+    return get_vector_store().list_ids(user_id, catalog.file_id_prefix(user_id, filename))
+
+
+def test_ingest_failing_midway_leaves_nothing_searchable(streaming_failure):
+    user_id = streaming_failure
+    with pytest.raises(ValueError):
+        pipeline.process_file(b"{}", "data.json", user_id, notify=False)
+
+    assert stored_ids(user_id, "data.json") == []
+    assert len(get_lexical_index(user_id)) == 0
+    assert get_chunk_texts([f"{user_id}_data.json_{i}" for i in range(7)]) == {}
+    assert catalog.models.get_documents(user_id, ["data.json"])["data.json"]["status"] == "failed"
+
+
+def test_leftovers_of_a_failed_first_ingest_are_deleted_by_listing(streaming_failure, monkeypatch):
+    user_id = streaming_failure
+    # The cleanup itself fails too (say the vector store went away), so the windows stay behind
+    delete_vectors = catalog.delete_vectors
+    monkeypatch.setattr(catalog, "delete_vectors", unavailable)
+    with pytest.raises(ValueError):
+        pipeline.process_file(b"{}", "data.json", user_id, notify=False)
+    assert len(stored_ids(user_id, "data.json")) == 6
+    monkeypatch.setattr(catalog, "delete_vectors", delete_vectors)
+
+    # The catalog row has no recorded range (id_prefix NULL), so the ids come from a prefix listing
+    summary = catalog.delete_document(user_id, "data.json")
+    assert summary["vectors_deleted"] == 6
+    assert stored_ids(user_id, "data.json") == []
+    assert len(get_lexical_index(user_id)) == 0
+
+
+def test_delete_uses_the_recorded_range(env):
+    user_id, _ = env.create_user("catalog@test")
+    count = pipeline.process_file(b"word " * 2000, "notes.txt", user_id, notify=False)
+    assert count > 1
+    assert catalog.delete_document(user_id, "notes.txt")["vectors_deleted"] == count
+    assert stored_ids(user_id, "notes.txt") == []
+    assert catalog.delete_document(user_id, "notes.txt") is None
@@ -0,0 +1,108 @@
+import datetime
+
+import pytest
+
+import scheduler.cleanup as cleanup
+from db import models
+from ingestion.catalog import file_id_prefix
+from ingestion.pipeline import process_file
+from retrieval.bm25 import get_lexical_index
+from retrieval.chunk_store import get_chunk_texts
+from vectorstore.base import get_vector_store
+
+OLD = datetime.datetime.utcnow() - datetime.timedelta(days=90)
+RECENT = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+
+
+def upload(user_id, filename, body, uploaded_at):
+    models.save_file_metadata(user_id, filename, uploaded_at)
+    return process_file(body.encode("utf-8"), filename, user_id, notify=False, uploaded_at=uploaded_at)
+
+
+def stored_ids(user_id, filename):
+    return get_vector_store().list_ids(user_id, file_id_prefix(user_id, filename))
+
+
+def rows(env, sql, params=()):
+    conn = env.get_connection()
+    cur = conn.cursor()
+    cur.execute(sql, params)
+    result = cur.fetchall()
+    cur.close()
+    conn.close()
+    return result
+
+
+def add_history(env, user_id, query, created_at):
+    conn = env.get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO search_history (user_id, query, answer, created_at) VALUES (%s, %s, %s, %s)",
+        (user_id, query, "answer", created_at)
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+@pytest.fixture
+def expired(env):
+    """Two users with expired, recent and re-uploaded files, and old and new search history."""
+    alice, _ = env.create_user("alice@test")
+    bob, _ = env.create_user("bob@test")
+    counts = {
+        (alice, "old.txt"): upload(alice, "old.txt", "quarterly invoice totals " * 400, OLD),
+        (alice, "report.txt"): upload(alice, "report.txt", "annual report summary " * 200, OLD),
+        (bob, "old.txt"): upload(bob, "old.txt", "shipment tracking numbers " * 300, OLD),
+        (bob, "fresh.txt"): upload(bob, "fresh.txt", "new contract terms " * 200, RECENT),
+    }
+    # Re-uploaded after the cutoff: the old upload record expires, the vectors now belong to the new one
+    counts[(alice, "report.txt")] = upload(alice, "report.txt", "annual report revised " * 200, RECENT)
+    for i in range(5):
+        add_history(env, alice, f"old question {i}", OLD)
+    add_history(env, bob, "new question", RECENT)
+    return alice, bob, counts
+
+
+def test_retention_removes_expired_files_everywhere(env, expired):
+    alice, bob, counts = expired
+    old_ids = stored_ids(alice, "old.txt") + stored_ids(bob, "old.txt")
+
+    report = cleanup.cleanup_old_data(retention_days=30, batch_size=2, pause=0)
+
+    # Three expired upload records (alice's two and bob's one) in batches of two, then history in batches of two
+    assert report["files"] == 3
+    assert report["vectors"] == counts[(alice, "old.txt")] + counts[(bob, "old.txt")]
+    assert report["search_history"] == 5
+    assert report["batches"] == 2 + 3
+
+    for user_id in (alice, bob):
+        assert stored_ids(user_id, "old.txt") == []
+        assert models.get_documents(user_id, ["old.txt"]) == {}
+    assert get_chunk_texts(old_ids) == {}
+    assert get_lexical_index(alice).search("quarterly invoice totals", 10) == []
+    assert rows(env, "SELECT user_id, filename FROM files ORDER BY user_id, filename") == [
+        (alice, "report.txt"), (bob, "fresh.txt"),
+    ]
+    assert rows(env, "SELECT query FROM search_history") == [("new question",)]
+
+    # The files that are still live keep all of their vectors
+    assert len(stored_ids(alice, "report.txt")) == counts[(alice, "report.txt")]
+    assert len(stored_ids(bob, "fresh.txt")) == counts[(bob, "fresh.txt")]
+
+
+def test_retention_run_is_idempotent(env, expired):
+    cleanup.cleanup_old_data(retention_days=30, batch_size=2, pause=0)
+    report = cleanup.cleanup_old_data(retention_days=30, batch_size=2, pause=0)
+    assert (report["files"], report["vectors"], report["search_history"]) == (0, 0, 0)
+
+
+def test_retention_skips_while_another_worker_holds_the_lock(env, expired):
+    alice, _, _ = expired
+    holder = cleanup._acquire_lock()
+    try:
+        assert cleanup.cleanup_old_data(retention_days=30, batch_size=2, pause=0) is None
+        assert stored_ids(alice, "old.txt")
+    finally:
+        cleanup._release_lock(holder)
+    assert cleanup.cleanup_old_data(retention_days=30, batch_size=2, pause=0)["files"] == 3
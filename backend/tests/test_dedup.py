@@ -0,0 +1,166 @@
+import datetime
+
+import pytest
+
+import ingestion.dedup as dedup
+import query.handler as handler
+import scheduler.cleanup as cleanup
+from db import models
+from embedding.base import get_embedding_provider
+from ingestion.catalog import delete_document, file_id_prefix
+from ingestion.pipeline import process_file
+from retrieval.bm25 import get_lexical_index
+from vectorstore.base import get_vector_store
+
+OLD = datetime.datetime.utcnow() - datetime.timedelta(days=90)
+RECENT = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+
+HANDBOOK = b"employee handbook vacation policy remote work " * 300
+REVISED = b"employee handbook revised parental leave policy " * 300
+
+
+@pytest.fixture
+def users(env, monkeypatch):
+    monkeypatch.setattr(dedup, "CONTENT_DEDUP", True)
+    alice, _ = env.create_user("alice@test")
+    bob, _ = env.create_user("bob@test")
+    return alice, bob
+
+
+def upload(user_id, filename, contents, uploaded_at=None):
+    models.save_file_metadata(user_id, filename, uploaded_at or RECENT)
+    return process_file(contents, filename, user_id, notify=False, uploaded_at=uploaded_at)
+
+
+def unavailable(*args, **kwargs):
+    raise ConnectionError("database unavailable")
+
+
+def shared_ids(contents, filename):
+    prefix = dedup.shared_chunk_prefix(dedup.content_hash(contents, filename))
+    return get_vector_store().list_ids(dedup.SHARED_CONTENT_OWNER, prefix)
+
+
+def refcount(contents, filename):
+    row = models.get_content_object(dedup.content_hash(contents, filename))
+    return row["refcount"] if row else None
+
+
+def found_files(user_id, question):
+    embedding = get_embedding_provider().embed_query(question)
+    matches = handler.retrieve_multi(user_id, [question], [embedding], get_vector_store())
+    return {match["metadata"]["filename"] for match in matches}
+
+
+def test_second_upload_references_the_first(users):
+    alice, bob = users
+    count = upload(alice, "handbook.txt", HANDBOOK)
+    assert upload(bob, "rules.txt", HANDBOOK) == count
+    assert len(shared_ids(HANDBOOK, "handbook.txt")) == count
+    assert refcount(HANDBOOK, "handbook.txt") == 2
+    # Nothing is stored under either user; each sees the shared chunks under their own filename
+    assert get_vector_store().list_ids(alice, file_id_prefix(alice, "handbook.txt")) == []
+    assert get_vector_store().list_ids(bob, file_id_prefix(bob, "rules.txt")) == []
+    assert found_files(alice, "vacation policy") == {"handbook.txt"}
+    assert found_files(bob, "vacation policy") == {"rules.txt"}
+
+
+def test_first_uploader_deleting_keeps_the_content_for_the_others(users):
+    alice, bob = users
+    count = upload(alice, "handbook.txt", HANDBOOK)
+    upload(bob, "rules.txt", HANDBOOK)
+
+    delete_document(alice, "handbook.txt")
+    assert refcount(HANDBOOK, "handbook.txt") == 1
+    assert len(shared_ids(HANDBOOK, "handbook.txt")) == count
+    assert dedup.user_content(alice) == {}
+    assert found_files(alice, "vacation policy") == set()
+    assert found_files(bob, "vacation policy") == {"rules.txt"}
+
+    # The last reference takes the vectors, chunk texts and lexical entries with it
+    delete_document(bob, "rules.txt")
+    assert refcount(HANDBOOK, "handbook.txt") is None
+    assert shared_ids(HANDBOOK, "handbook.txt") == []
+    assert len(get_lexical_index(dedup.SHARED_CONTENT_OWNER)) == 0
+    assert found_files(bob, "vacation policy") == set()
+
+
+def test_same_content_under_two_names_of_one_user(users):
+    alice, _ = users
+    upload(alice, "handbook.txt", HANDBOOK)
+    upload(alice, "copy.txt", HANDBOOK)
+    assert refcount(HANDBOOK, "handbook.txt") == 2
+    delete_document(alice, "handbook.txt")
+    assert shared_ids(HANDBOOK, "handbook.txt")
+    assert found_files(alice, "vacation policy") == {"copy.txt"}
+
+
+def test_retention_drops_references_and_purges_after_the_last(users):
+    alice, bob = users
+    count = upload(alice, "handbook.txt", HANDBOOK, uploaded_at=OLD)
+    upload(bob, "rules.txt", HANDBOOK, uploaded_at=RECENT)
+
+    # Only alice's upload has expired: her reference goes, bob keeps the content
+    report = cleanup.cleanup_old_data(retention_days=30, batch_size=10, pause=0)
+    assert report["files"] == 1
+    assert report["vectors"] == 0  # shared vectors are not the user's own
+    assert refcount(HANDBOOK, "handbook.txt") == 1
+    assert len(shared_ids(HANDBOOK, "handbook.txt")) == count
+    assert found_files(bob, "vacation policy") == {"rules.txt"}
+
+    # Bob's reference expires as well and the shared content is purged
+    report = cleanup.cleanup_old_data(retention_days=0, batch_size=10, pause=0)
+    assert report["files"] == 1
+    assert refcount(HANDBOOK, "handbook.txt") is None
+    assert shared_ids(HANDBOOK, "handbook.txt") == []
+    assert dedup.user_content(bob) == {}
+
+
+def test_reupload_with_different_bytes_releases_the_old_content(users):
+    alice, _ = users
+    upload(alice, "handbook.txt", HANDBOOK)
+    count = upload(alice, "handbook.txt", REVISED)
+
+    assert refcount(HANDBOOK, "handbook.txt") is None
+    assert shared_ids(HANDBOOK, "handbook.txt") == []
+    assert refcount(REVISED, "handbook.txt") == 1
+    assert len(shared_ids(REVISED, "handbook.txt")) == count
+    assert list(dedup.user_content(alice)) == [dedup.content_hash(REVISED, "handbook.txt")]
+    assert found_files(alice, "parental leave") == {"handbook.txt"}
+
+
+def test_reupload_keeps_old_content_that_others_still_reference(users):
+    alice, bob = users
+    count = upload(alice, "handbook.txt", HANDBOOK)
+    upload(bob, "rules.txt", HANDBOOK)
+    upload(alice, "handbook.txt", REVISED)
+
+    assert refcount(HANDBOOK, "handbook.txt") == 1
+    assert len(shared_ids(HANDBOOK, "handbook.txt")) == count
+    assert refcount(REVISED, "handbook.txt") == 1
+    assert list(dedup.user_content(alice)) == [dedup.content_hash(REVISED, "handbook.txt")]
+    assert list(dedup.user_content(bob)) == [dedup.content_hash(HANDBOOK, "rules.txt")]
+
+
+def test_reupload_of_the_same_bytes_keeps_one_reference(users):
+    alice, _ = users
+    upload(alice, "handbook.txt", HANDBOOK)
+    upload(alice, "handbook.txt", HANDBOOK)
+    assert refcount(HANDBOOK, "handbook.txt") == 1
+    assert shared_ids(HANDBOOK, "handbook.txt")
+
+
+def test_failed_first_ingest_drops_its_reference(users, monkeypatch):
+    alice, bob = users
+    content_ingested = dedup.content_ingested
+    monkeypatch.setattr(dedup, "content_ingested", unavailable)
+    with pytest.raises(ConnectionError):
+        upload(alice, "handbook.txt", HANDBOOK)
+    monkeypatch.setattr(dedup, "content_ingested", content_ingested)
+
+    assert refcount(HANDBOOK, "handbook.txt") is None
+    assert shared_ids(HANDBOOK, "handbook.txt") == []
+    assert dedup.user_content(alice) == {}
+    # The next upload of the same bytes ingests them again instead of pointing at nothing
+    assert upload(bob, "rules.txt", HANDBOOK) > 0
+    assert found_files(bob, "vacation policy") == {"rules.txt"}
@@ -0,0 +1,45 @@
+import google.generativeai as genai
+
+from embedding.gemini import EMBED_BATCH_SIZE, GEMINI_EMBED_TIMEOUT, GEMINI_EMBEDDING_MODEL, GeminiProvider
+
+
+class StubClient:
+    """Stands in for google.generativeai.embed_content, one call per batch request."""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_content(self, model, content, **kwargs):
+        self.calls.append(dict(kwargs, model=model, content=list(content)))
+        return {"embedding": [[float(text.split()[-1])] for text in content]}
+
+
+def test_texts_are_embedded_in_batches(monkeypatch):
+    client = StubClient()
+    monkeypatch.setattr(genai, "embed_content", client.embed_content)
+    texts = [f"chunk {i}" for i in range(2 * EMBED_BATCH_SIZE + 50)]
+
+    embeddings = GeminiProvider().embed_texts(texts)
+
+    assert embeddings == [[float(i)] for i in range(len(texts))]
+    assert [len(call["content"]) for call in client.calls] == [EMBED_BATCH_SIZE, EMBED_BATCH_SIZE, 50]
+    assert all(call["model"] == GEMINI_EMBEDDING_MODEL for call in client.calls)
+    assert all(call["task_type"] == "retrieval_document" for call in client.calls)
+    assert all(call["request_options"] == {"timeout": GEMINI_EMBED_TIMEOUT} for call in client.calls)
+
+
+def test_no_texts_make_no_requests(monkeypatch):
+    client = StubClient()
+    monkeypatch.setattr(genai, "embed_content", client.embed_content)
+    assert GeminiProvider().embed_texts([]) == []
+    assert client.calls == []
+
+
+def test_a_model_passed_in_batches_itself(monkeypatch):
+    from bench.fakes import HashingEmbedding
+
+    client = StubClient()
+    monkeypatch.setattr(genai, "embed_content", client.embed_content)
+    embeddings = GeminiProvider(HashingEmbedding(dim=8)).embed_texts(["a", "b"])
+    assert len(embeddings) == 2 and len(embeddings[0]) == 8
+    assert client.calls == []
@@ -0,0 +1,115 @@
+import os
+
+import numpy as np
+import pytest
+
+import vectorstore.local_store as local_store
+from vectorstore.local_store import UserCollection
+
+DIM = 8
+
+
+def vectors(ids, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{"id": vector_id, "values": rng.normal(size=DIM).tolist(), "metadata": {"n": i}} for i, vector_id in enumerate(ids)]
+
+
+def top_id(collection, vector):
+    return collection.query(vector["values"], top_k=1)[0]["id"]
+
+
+@pytest.fixture(params=["float32", "int8"])
+def directory(tmp_path, request):
+    return str(tmp_path / request.param), request.param
+
+
+def test_upsert_query_reload(directory):
+    path, dtype = directory
+    batch = vectors([f"v{i}" for i in range(20)])
+    collection = UserCollection(path, dtype=dtype)
+    collection.upsert(batch[:10])
+    collection.upsert(batch[10:])
+    reloaded = UserCollection(path, dtype=dtype)
+    assert len(reloaded) == 20
+    assert all(top_id(reloaded, vector) == vector["id"] for vector in batch)
+    assert reloaded.fetch(["v3"]) == {"v3": {"n": 3}}
+
+
+def test_reupsert_and_delete_survive_reload(directory):
+    path, dtype = directory
+    collection = UserCollection(path, dtype=dtype)
+    collection.upsert(vectors(["a", "b", "c"]))
+    replacement = vectors(["b"], seed=1)
+    collection.upsert(replacement)
+    assert collection.delete(["c", "missing"]) == 1
+    reloaded = UserCollection(path, dtype=dtype)
+    assert sorted(reloaded.list_ids("")) == ["a", "b"]
+    assert top_id(reloaded, replacement[0]) == "b"
+    assert [match["id"] for match in reloaded.query(replacement[0]["values"], top_k=5)].count("b") == 1
+
+
+def test_duplicate_ids_in_one_batch_keep_the_last(tmp_path):
+    collection = UserCollection(str(tmp_path))
+    first, second = vectors(["x"], seed=1)[0], vectors(["x"], seed=2)[0]
+    collection.upsert([first, second])
+    assert len(collection) == 1
+    assert [match["id"] for match in collection.query(second["values"], top_k=5)] == ["x"]
+    assert UserCollection(str(tmp_path)).query(second["values"], top_k=1)[0]["score"] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_compaction_round_trip(tmp_path):
+    collection = UserCollection(str(tmp_path))
+    batch = vectors([f"v{i}" for i in range(40)])
+    collection.upsert(batch)
+    collection.delete([f"v{i}" for i in range(0, 40, 2)])
+    # More than a quarter of the rows were dead: the file now holds only live rows
+    assert len(collection.ids) == 20
+    assert collection.generation == 1
+    assert not os.path.exists(os.path.join(str(tmp_path), "vectors.f32"))
+    reloaded = UserCollection(str(tmp_path))
+    assert len(reloaded) == 20
+    assert all(top_id(reloaded, vector) == vector["id"] for vector in batch[1::2])
+
+
+def test_orphan_rows_after_crash_are_dropped(tmp_path):
+    collection = UserCollection(str(tmp_path))
+    collection.upsert(vectors(["a", "b"]))
+    # Rows appended without their log line, as if the process died in between
+    with open(collection.vectors_path, "ab") as f:
+        f.write(np.ones((3, DIM), dtype=np.float32).tobytes())
+    with open(collection.log_path, "a") as f:
+        f.write('{"add": [["half')
+    reloaded = UserCollection(str(tmp_path))
+    assert os.path.getsize(reloaded.vectors_path) == 2 * DIM * 4
+    later = vectors(["c", "d"], seed=5)
+    reloaded.upsert(later)
+    again = UserCollection(str(tmp_path))
+    assert all(top_id(again, vector) == vector["id"] for vector in later)
+    assert sorted(again.list_ids("")) == ["a", "b", "c", "d"]
+
+
+def test_ivf_tail_and_reload(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_store, "IVF_MIN_VECTORS", 64)
+    collection = UserCollection(str(tmp_path))
+    batch = vectors([f"v{i}" for i in range(200)])
+    collection.upsert(batch[:100])
+    assert collection.centroids is not None
+    listed = collection._listed
+    collection.upsert(batch[100:110])
+    # Small upserts are searched from the unsorted tail instead of re-sorting every list
+    assert collection._listed == listed
+    assert all(top_id(collection, vector) == vector["id"] for vector in batch[100:110])
+    reloaded = UserCollection(str(tmp_path))
+    assert reloaded.centroids is not None and len(reloaded.assignment) == 110
+    assert all(top_id(reloaded, vector) == vector["id"] for vector in batch[:110])
+
+
+def test_upserts_append_to_the_log(tmp_path):
+    collection = UserCollection(str(tmp_path))
+    collection.upsert(vectors([f"v{i}" for i in range(10)]))
+    version = collection.version
+    collection.upsert(vectors(["b"], seed=3))
+    collection.delete(["v0"])
+    assert collection.version == version
+    with open(collection.log_path) as f:
+        assert len(f.readlines()) == 2
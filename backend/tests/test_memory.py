@@ -0,0 +1,139 @@
+import pytest
+
+import query.memory as memory
+from query.memory import build_context
+
+
+class RecordingLLM:
+    def __init__(self, reply="Summary of the earlier turns."):
+        self.reply = reply
+        self.prompts = []
+
+    def complete(self, prompt):
+        self.prompts.append(prompt)
+        return self.reply
+
+
+class FailingLLM:
+    def complete(self, prompt):
+        raise ValueError("summary model rejected the request")
+
+
+def turn(i):
+    # 40 characters: 10 estimated tokens, 12 with the turn overhead
+    return f"turn {i:03d} " + "y" * 31
+
+
+def conversation(count, stored=None):
+    messages = [{"role": "user" if i % 2 == 0 else "assistant", "content": turn(i)} for i in range(count)]
+    return {"messages": messages, "metadata": {"memory": stored} if stored else {}}
+
+
+@pytest.fixture(autouse=True)
+def small_budgets(monkeypatch):
+    # Five turns fit the window, two fit half of it
+    monkeypatch.setattr(memory, "MEMORY_WINDOW_TOKENS", 60)
+    monkeypatch.setattr(memory, "MEMORY_SUMMARY_TOKENS", 10)
+    monkeypatch.setattr(memory, "MEMORY_MESSAGE_TOKENS", 400)
+    monkeypatch.setattr(memory, "MEMORY_FOLD_INPUT_TOKENS", 4000)
+
+
+def texts(context):
+    return [text for _, _, text in context.recent]
+
+
+def test_conversation_within_the_window_is_kept_verbatim():
+    llm = RecordingLLM()
+    context = build_context(conversation(5), llm)
+    assert texts(context) == [turn(i) for i in range(5)]
+    assert context.summary == ""
+    assert not context.changed
+    assert llm.prompts == []
+
+
+def test_overflow_folds_the_oldest_turns_and_keeps_half_the_window():
+    llm = RecordingLLM()
+    context = build_context(conversation(6), llm)
+    assert texts(context) == [turn(4), turn(5)]
+    assert context.changed
+    assert context.memory == {"summary": context.summary, "summarized_through": 4}
+    [prompt] = llm.prompts
+    assert all(turn(i) in prompt for i in range(4))
+    assert turn(4) not in prompt
+
+
+def test_summary_is_clipped_to_its_budget():
+    context = build_context(conversation(6), RecordingLLM("word " * 100))
+    assert len(context.summary) <= memory.MEMORY_SUMMARY_TOKENS * 4 + 3
+    assert context.summary.endswith("...")
+
+
+def test_stored_summary_is_carried_until_the_window_overflows_again():
+    stored = {"summary": "Earlier: the user asked about invoices.", "summarized_through": 4}
+    llm = RecordingLLM()
+    # Turns 4..8 fit the window again, nothing is folded
+    context = build_context(conversation(9, stored), llm)
+    assert texts(context) == [turn(i) for i in range(4, 9)]
+    assert context.summary == stored["summary"]
+    assert not context.changed
+    assert llm.prompts == []
+
+    # One more turn overflows: the old summary is part of the update and only unsummarized turns are folded
+    context = build_context(conversation(10, stored), llm)
+    assert context.memory["summarized_through"] == 8
+    [prompt] = llm.prompts
+    assert stored["summary"] in prompt
+    assert turn(3) not in prompt and turn(4) in prompt and turn(8) not in prompt
+
+
+def test_fold_input_is_capped_to_the_newest_turns(monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_FOLD_INPUT_TOKENS", 36)
+    llm = RecordingLLM()
+    context = build_context(conversation(20), llm)
+    assert texts(context) == [turn(18), turn(19)]
+    [prompt] = llm.prompts
+    # Three turns fit the fold budget: 15..17; older ones are left out rather than sent in one huge call
+    assert [i for i in range(18) if turn(i) in prompt] == [15, 16, 17]
+    assert context.memory["summarized_through"] == 18
+
+
+def test_long_messages_are_clipped_in_the_window(monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_MESSAGE_TOKENS", 5)
+    context = build_context({"messages": [{"role": "user", "content": "z" * 500}]}, RecordingLLM())
+    assert texts(context) == ["z" * 20 + "..."]
+
+
+def test_failed_summary_update_keeps_the_old_memory():
+    stored = {"summary": "Earlier summary.", "summarized_through": 0}
+    context = build_context(conversation(6, stored), FailingLLM())
+    assert context.summary == "Earlier summary."
+    assert texts(context) == [turn(4), turn(5)]
+    assert not context.changed
+    assert context.memory == stored
+
+
+def test_typed_and_empty_messages_are_not_turns():
+    messages = [
+        {"isUser": True, "text": "What is in the contract?"},
+        {"type": "upload", "content": "contract.pdf"},
+        {"role": "assistant", "content": "   "},
+        {"isUser": False, "text": "It covers payment terms."},
+        {"role": "user", "content": "And the penalties?"},
+    ]
+    context = build_context({"messages": messages}, RecordingLLM())
+    assert [(speaker, text) for _, speaker, text in context.recent] == [
+        ("User", "What is in the contract?"),
+        ("Assistant", "It covers payment terms."),
+        ("User", "And the penalties?"),
+    ]
+
+
+def test_prompt_and_follow_up_queries():
+    context = build_context(conversation(6), RecordingLLM("The user asked about turns."))
+    prompt = context.prompt("and the next one?")
+    assert "Summary of the earlier conversation:\nThe user asked about turns." in prompt
+    assert f"Most recent turns:\nUser: {turn(4)}\nAssistant: {turn(5)}" in prompt
+    assert prompt.endswith("Question: and the next one?")
+    assert context.retrieval_queries("and the next one?") == [f"{turn(4)} and the next one?"]
+    assert context.retrieval_queries(turn(4).upper()) == []
+    assert build_context(None, RecordingLLM()).prompt("hello") == "hello"
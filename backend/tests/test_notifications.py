@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import api.notifications as notifications
+from api.notifications import NotificationDispatcher
+
+
+def test_expired_offline_messages_and_empty_users_are_evicted():
+    dispatcher = NotificationDispatcher()
+    now = time.time()
+    stale = now - notifications.NOTIFICATION_OFFLINE_TTL - 1
+    dispatcher._buffer_offline(1, [(stale, "old"), (stale, "older")])
+    dispatcher._buffer_offline(2, [(stale, "old"), (now, "new")])
+    dispatcher._buffer_offline(3, [(now, "new")])
+
+    assert dispatcher.stats()["offline_buffered"] == {2: 1, 3: 1}
+    assert list(dispatcher._offline[2]) == [(now, "new")]
+    assert dispatcher._offline[2].maxlen == notifications.NOTIFICATION_OFFLINE_BUFFER
+
+
+def test_pump_sweeps_without_new_messages(monkeypatch):
+    monkeypatch.setattr(notifications, "NOTIFICATION_SWEEP_SECONDS", 0.01)
+    monkeypatch.setattr(notifications, "NOTIFICATION_OFFLINE_TTL", 0.05)
+
+    async def run():
+        dispatcher = NotificationDispatcher()
+        dispatcher.start()
+        dispatcher.send(1, "while you were away")
+        await asyncio.sleep(0.02)
+        assert 1 in dispatcher._offline
+        await asyncio.sleep(0.1)
+        offline = dict(dispatcher._offline)
+        await dispatcher.stop()
+        return offline
+
+    assert asyncio.run(run()) == {}
+
+
+class FakeSocket:
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.frames = []
+
+    async def send_text(self, text):
+        await asyncio.sleep(self.delay)
+        self.frames.append(text)
+
+    async def close(self, code=1000):
+        pass
+
+
+def test_stop_awaits_the_pump_and_delivers_what_is_queued():
+    async def run():
+        dispatcher = NotificationDispatcher()
+        dispatcher.start()
+        socket = FakeSocket()
+        await dispatcher.connect(1, socket)
+        pump = dispatcher._pump_task
+        # Sent by a worker thread just before shutdown, before the pump got to run
+        dispatcher.send(1, "first")
+        dispatcher.send(1, "last")
+        await dispatcher.stop()
+        return pump, socket, dispatcher
+
+    pump, socket, dispatcher = asyncio.run(run())
+    assert pump.cancelled()
+    assert "\n".join(socket.frames).split("\n") == ["first", "last"]
+    assert dispatcher._offline == {} and dispatcher._connections == {}
+
+
+def test_stop_buffers_what_a_stalled_socket_could_not_send():
+    async def run():
+        dispatcher = NotificationDispatcher()
+        dispatcher.start()
+        await dispatcher.connect(1, FakeSocket(delay=10))
+        dispatcher.send(1, "stuck")
+        await dispatcher.stop(grace=0.05)
+        return dispatcher
+
+    dispatcher = asyncio.run(run())
+    assert [message for _, message in dispatcher._offline[1]] == ["stuck"]
@@ -0,0 +1,60 @@
+import pytest
+
+from bench.fakes import FakeVectorIndex
+from vectorstore.pinecone_store import PineconeStore
+
+
+class ListRejected(Exception):
+    status = 400
+
+
+class PodIndex(FakeVectorIndex):
+    """A pod-based index: no Index.list."""
+
+    def list(self, prefix=None, namespace=None, limit=100, **kwargs):
+        raise ListRejected("list is not supported for pod-based indexes")
+        yield
+
+
+def vector(user_id, filename, chunk, dim=8):
+    values = [0.0] * dim
+    values[chunk % dim] = 1.0
+    return {"id": f"{user_id}_{filename}_{chunk}", "values": values, "metadata": {"user_id": user_id, "filename": filename}}
+
+
+def fill(store):
+    for user_id in (1, 12):
+        store.upsert(user_id, [vector(user_id, name, chunk) for name in ("a.txt", "b.txt") for chunk in range(3)])
+
+
+@pytest.mark.parametrize("index_class", [FakeVectorIndex, PodIndex])
+@pytest.mark.parametrize("layout", ["shared", "sharded", "namespace"])
+def test_list_ids(index_class, layout):
+    store = PineconeStore(index=index_class(dim=8), layout=layout)
+    fill(store)
+    assert sorted(store.list_ids(1, "1_a.txt_")) == ["1_a.txt_0", "1_a.txt_1", "1_a.txt_2"]
+    assert len(store.list_ids(12, "12_")) == 6
+    assert store._listable == (index_class is FakeVectorIndex)
+
+
+@pytest.mark.parametrize("index_class", [FakeVectorIndex, PodIndex])
+@pytest.mark.parametrize("layout", ["shared", "sharded", "namespace"])
+def test_delete_user_leaves_other_users(index_class, layout):
+    store = PineconeStore(index=index_class(dim=8), layout=layout)
+    fill(store)
+    store.delete_user(1)
+    assert store.list_ids(1, "1_") == []
+    assert len(store.list_ids(12, "12_")) == 6
+    assert [match["id"].split("_")[0] for match in store.query(12, vector(12, "a.txt", 0)["values"], top_k=10)] == ["12"] * 6
+
+
+def test_other_list_errors_propagate():
+    class BrokenIndex(FakeVectorIndex):
+        def list(self, prefix=None, namespace=None, limit=100, **kwargs):
+            raise ConnectionError("reset by peer")
+            yield
+
+    store = PineconeStore(index=BrokenIndex(dim=8), layout="shared")
+    with pytest.raises(ConnectionError):
+        store.list_ids(1, "1_")
+    assert store._listable
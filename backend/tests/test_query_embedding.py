@@ -0,0 +1,60 @@
+import threading
+import time
+
+import query.handler as handler
+import upstream.singleflight as singleflight
+from monitoring.usage import TOKENS_USED, UsageRecorder, estimate_tokens
+from query.embedding_cache import query_embedding_cache
+
+
+class SlowProvider:
+    remote = True
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+
+    def embed_query(self, text):
+        self.calls += 1
+        self.release.wait(5)
+        return [1.0, 0.0]
+
+
+def embedding_tokens(recorder):
+    return {user_id: totals[0] for (user_id, _), totals in recorder._pending.items()}
+
+
+def test_coalesced_embedding_is_charged_to_every_user(monkeypatch):
+    monkeypatch.setattr(singleflight, "COALESCING_ENABLED", True)
+    recorder = UsageRecorder()
+    monkeypatch.setattr(handler, "usage", recorder)
+    text = "what did the coalescing test ask?"
+    query_embedding_cache._entries.pop(text, None)
+    provider = SlowProvider()
+    sent_before = TOKENS_USED.value(kind="embedding")
+    coalesced_before = singleflight.COALESCED.value(kind="embedding")
+
+    results = {}
+
+    def ask(user_id):
+        results[user_id] = handler.embed_queries([text], provider, user_id)
+
+    threads = [threading.Thread(target=ask, args=(user_id,)) for user_id in (1, 2, 3)]
+    threads[0].start()
+    while not provider.calls:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    # Let the model answer once both other users are waiting on the first one's call
+    while singleflight.COALESCED.value(kind="embedding") - coalesced_before < 2:
+        time.sleep(0.001)
+    provider.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert provider.calls == 1
+    assert all(result == [[1.0, 0.0]] for result in results.values())
+    tokens = estimate_tokens(text)
+    assert embedding_tokens(recorder) == {1: tokens, 2: tokens, 3: tokens}
+    # Only the call that reached the model counts as tokens sent
+    assert TOKENS_USED.value(kind="embedding") - sent_before == tokens
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import api.rate_limit as rate_limit
+from api.rate_limit import MemoryTokenBuckets
+
+
+def test_take_spends_and_refuses_when_empty():
+    buckets = MemoryTokenBuckets()
+    assert all(buckets.take("query:1", 1.0, 3)[0] for _ in range(3))
+    allowed, retry_after = buckets.take("query:1", 1.0, 3)
+    assert not allowed
+    assert 0 < retry_after <= 1.0
+
+
+def test_cost_above_burst_needs_a_full_bucket_and_leaves_debt():
+    buckets = MemoryTokenBuckets()
+    assert buckets.take("query:1", 0.5, 10, cost=40)[0]
+    allowed, retry_after = buckets.take("query:1", 0.5, 10)
+    assert not allowed
+    # 30 tokens of debt plus one token to spend, at half a token per second
+    assert retry_after == pytest.approx(62, abs=0.5)
+
+
+def test_partial_bucket_cannot_pay_a_large_cost():
+    buckets = MemoryTokenBuckets()
+    assert buckets.take("query:1", 0.5, 10, cost=2)[0]
+    assert not buckets.take("query:1", 0.5, 10, cost=40)[0]
+
+
+def test_spend_raises_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(rate_limit, "buckets", MemoryTokenBuckets())
+    monkeypatch.setitem(rate_limit.RATE_LIMITS, "query", (60.0, 10))
+    rate_limit.spend("query", 7, 10)
+    with pytest.raises(HTTPException) as raised:
+        rate_limit.spend("query", 7, 1)
+    assert raised.value.status_code == 429
+    assert int(raised.value.headers["Retry-After"]) >= 1
+    # Other users have their own bucket
+    rate_limit.spend("query", 8, 10)
+
+
+def test_refund_gives_tokens_back_up_to_the_burst():
+    buckets = MemoryTokenBuckets()
+    assert all(buckets.take("query:1", 0.01, 3)[0] for _ in range(3))
+    buckets.refund("query:1", 3, 5)
+    assert all(buckets.take("query:1", 0.01, 3)[0] for _ in range(3))
+    assert not buckets.take("query:1", 0.01, 3)[0]
+    # A bucket that was never charged is full already
+    buckets.refund("query:2", 3)
+    assert buckets.take("query:2", 0.01, 3, cost=3)[0]
+
+
+def test_prune_uses_each_buckets_own_rate():
+    buckets = MemoryTokenBuckets()
+    # Two batches a minute: a debt of 198 tokens takes 99 minutes to pay off
+    buckets.take("query_batch:1", 2 / 60, 2, cost=200)
+    buckets.take("query:1", 1.0, 10)
+    buckets._prune(time.monotonic() + 4000)
+    assert "query_batch:1" in buckets._buckets
+    assert "query:1" not in buckets._buckets
+    buckets._prune(time.monotonic() + 6000)
+    assert buckets._buckets == {}
+
+
+@pytest.mark.parametrize("questions, status", [(["one"] * 5, 429), (["one"], 200)])
+def test_refused_batch_keeps_its_batch_token(env, monkeypatch, questions, status):
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(rate_limit, "buckets", MemoryTokenBuckets())
+    monkeypatch.setitem(rate_limit.RATE_LIMITS, "query", (1.0, 2))
+    monkeypatch.setitem(rate_limit.RATE_LIMITS, "query_batch", (1.0, 1))
+    user_id, token = env.create_user("batch@test")
+    # One query already asked: a batch larger than the burst now needs a full bucket it does not have
+    rate_limit.spend("query", user_id)
+    client = TestClient(env.app)
+    response = client.post("/query/batch", json={"questions": questions}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == status
+    # Batch tokens are only used by batches that ran
+    assert rate_limit.buckets.take(f"query_batch:{user_id}", 1 / 60, 1)[0] == (status == 429)
@@ -0,0 +1,141 @@
+import datetime
+
+import pytest
+
+import ingestion.dedup as dedup
+import query.handler as handler
+import retrieval.two_level as two_level
+from db import models
+from embedding.base import get_embedding_provider
+from ingestion.pipeline import process_file
+from retrieval.scope import build_scope, has_dates, scoped_content, vector_filter
+from vectorstore.base import get_vector_store
+
+OLD = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+NEW = datetime.datetime(2024, 6, 1, tzinfo=datetime.timezone.utc)
+SPLIT = datetime.datetime(2023, 1, 1)
+
+
+def test_build_scope_normalizes_parameters():
+    assert build_scope() is None
+    assert build_scope(files=[], extensions=[]) is None
+    assert build_scope(
+        files=["a.txt", "b.md", "a.txt"],
+        extensions=["PDF", ".md", " md "],
+        uploaded_after=datetime.datetime(2024, 1, 1),
+        uploaded_before=datetime.datetime(2024, 1, 1, 1, tzinfo=datetime.timezone(datetime.timedelta(hours=1))),
+    ) == {
+        "files": ["a.txt", "b.md"],
+        "extensions": [".pdf", ".md"],
+        # Naive datetimes are UTC
+        "uploaded_after": 1704067200,
+        "uploaded_before": 1704067200,
+    }
+    assert build_scope(uploaded_after=0) == {"uploaded_after": 0}
+
+
+@pytest.mark.parametrize("scope, expected", [
+    (None, None),
+    ({"files": ["a.txt"]}, {"filename": {"$in": ["a.txt"]}}),
+    ({"extensions": [".md"]}, {"extension": {"$in": [".md"]}}),
+    ({"uploaded_after": 10}, {"uploaded_at": {"$gte": 10}}),
+    ({"uploaded_before": 20}, {"uploaded_at": {"$lte": 20}}),
+    (
+        {"files": ["a.txt"], "extensions": [".txt"], "uploaded_after": 10, "uploaded_before": 20},
+        {"filename": {"$in": ["a.txt"]}, "extension": {"$in": [".txt"]}, "uploaded_at": {"$gte": 10, "$lte": 20}},
+    ),
+])
+def test_vector_filter(scope, expected):
+    assert vector_filter(scope) == expected
+    assert has_dates(scope) == ("uploaded_at" in (expected or {}))
+
+
+REFS = {"h1": "a.txt", "h2": "b.md", "h3": "c.TXT"}
+
+
+@pytest.mark.parametrize("scope, uploaded, expected", [
+    (None, None, ["h1", "h2", "h3"]),
+    ({"files": ["b.md", "missing.txt"]}, None, ["h2"]),
+    ({"extensions": [".txt"]}, None, ["h1", "h3"]),
+    ({"uploaded_after": 10}, {"a.txt", "b.md"}, ["h1", "h2"]),
+    ({"extensions": [".txt"], "uploaded_after": 10}, {"a.txt", "b.md"}, ["h1"]),
+    ({"files": ["b.md"], "extensions": [".txt"]}, None, []),
+])
+def test_scoped_content(scope, uploaded, expected):
+    assert scoped_content(scope, REFS, uploaded) == expected
+
+
+@pytest.fixture
+def corpus(env, monkeypatch):
+    """
+    Alice's own and shared files, old and new, all about apples. Bob uploaded
+    the bytes of her new shared file first, years before she did.
+    """
+    alice, _ = env.create_user("alice@test")
+    bob, _ = env.create_user("bob@test")
+
+    def upload(user_id, filename, body, uploaded_at, shared):
+        monkeypatch.setattr(dedup, "CONTENT_DEDUP", shared)
+        models.save_file_metadata(user_id, filename, uploaded_at)
+        process_file(body.encode("utf-8"), filename, user_id, notify=False, uploaded_at=uploaded_at)
+
+    upload(bob, "bob.txt", "apple pie recipe with cinnamon", OLD, True)
+    upload(alice, "own_old.txt", "apple orchard planting guide", OLD, False)
+    upload(alice, "own_new.md", "apple harvest schedule notes", NEW, False)
+    upload(alice, "shared_old.md", "apple varieties catalogue", OLD, True)
+    upload(alice, "shared_new.txt", "apple pie recipe with cinnamon", NEW, True)
+    monkeypatch.setattr(dedup, "CONTENT_DEDUP", False)
+    return alice
+
+
+ALL = {"own_old.txt", "own_new.md", "shared_old.md", "shared_new.txt"}
+
+
+def found_files(user_id, scope):
+    question = "apple"
+    embedding = get_embedding_provider().embed_query(question)
+    matches = handler.retrieve_multi(user_id, [question], [embedding], get_vector_store(), top_k=20, scope=scope)
+    return {match["metadata"]["filename"] for match in matches}
+
+
+SCOPES = [
+    (None, ALL),
+    (build_scope(files=["own_old.txt", "shared_new.txt"]), {"own_old.txt", "shared_new.txt"}),
+    (build_scope(extensions=["md"]), {"own_new.md", "shared_old.md"}),
+    # The shared file counts from alice's upload, not from bob's older one
+    (build_scope(uploaded_after=SPLIT), {"own_new.md", "shared_new.txt"}),
+    (build_scope(uploaded_before=SPLIT), {"own_old.txt", "shared_old.md"}),
+    (build_scope(uploaded_after=SPLIT, extensions=[".txt"]), {"shared_new.txt"}),
+    (build_scope(files=["own_old.txt"], extensions=["md"]), set()),
+    # Another user's name for the same content is not one of alice's files
+    (build_scope(files=["bob.txt"]), set()),
+]
+
+
+@pytest.mark.parametrize("mode", ["vector", "hybrid"])
+@pytest.mark.parametrize("scope, expected", SCOPES)
+def test_scope_applies_to_own_and_shared_files(corpus, monkeypatch, mode, scope, expected):
+    monkeypatch.setattr(handler, "RETRIEVAL_MODE", mode)
+    assert found_files(corpus, scope) == expected
+
+
+@pytest.mark.parametrize("scope, expected", SCOPES)
+def test_scope_applies_to_two_level_selection(corpus, monkeypatch, scope, expected):
+    monkeypatch.setattr(two_level, "RETRIEVAL_STRATEGY", "two_level")
+    monkeypatch.setattr(handler, "RETRIEVAL_MODE", "vector")
+    assert found_files(corpus, scope) == expected
+
+
+def test_shared_in_scope_names_the_users_references(corpus):
+    shared = handler._shared_in_scope(corpus, build_scope(uploaded_after=SPLIT))
+    assert list(shared.values()) == ["shared_new.txt"]
+    assert handler._shared_in_scope(corpus, None) == dedup.user_content(corpus)
+    assert handler._shared_in_scope(corpus, build_scope(files=["own_old.txt"])) == {}
+
+
+def test_two_level_limit_is_filled_from_the_scope(corpus, monkeypatch):
+    monkeypatch.setattr(two_level, "RETRIEVAL_STRATEGY", "two_level")
+    monkeypatch.setattr(two_level, "TWO_LEVEL_DOCUMENTS", 2)
+    monkeypatch.setattr(handler, "RETRIEVAL_MODE", "vector")
+    # Four documents, two selected: both must come from inside the dates, own or shared
+    assert found_files(corpus, build_scope(uploaded_before=SPLIT)) == {"own_old.txt", "shared_old.md"}
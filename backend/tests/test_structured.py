@@ -0,0 +1,80 @@
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from ingestion import structured
+from ingestion.structured import json_records, pack_records, xml_records, yaml_records
+
+
+@pytest.mark.parametrize("contents, expected", [
+    (b'{"a": 1}', [("a", "1")]),
+    (b'{"a": {"b": [1, 2]}}', [("a.b[0]", "1"), ("a.b[1]", "2")]),
+    (b'[{"id": 1}, {"id": 2, "tags": ["x"]}]', [("[0].id", "1"), ("[1].id", "2"), ("[1].tags[0]", "x")]),
+    (b'{"first name": "Ann", "$ref": "#/x", "k-1": true}', [('["first name"]', "Ann"), ("$ref", "#/x"), ("k-1", "true")]),
+    (b'{"a": null, "b": [], "c": {}, "d": 1.5}', [("a", "null"), ("d", "1.5")]),
+    (b'[[1, [2]], 3]', [("[0][0]", "1"), ("[0][1][0]", "2"), ("[1]", "3")]),
+    (b'"just a string"', [("", "just a string")]),
+])
+@pytest.mark.parametrize("use_ijson", [True, False])
+def test_json_records(monkeypatch, contents, expected, use_ijson):
+    if not use_ijson:
+        monkeypatch.setattr(structured, "ijson", None)
+    assert list(json_records(contents)) == expected
+
+
+@pytest.mark.parametrize("contents, expected", [
+    (b"<a><b>1</b><b>2</b><c>3</c></a>", [("a.b", "1"), ("a.b[1]", "2"), ("a.c", "3")]),
+    (b'<a v="1"><b x="2">t</b><c y="3"/></a>', [("a.@v", "1"), ("a.b", "t (x=2)"), ("a.c", "(y=3)")]),
+    (b"<a><b><c>1</c></b><b><c>2</c></b></a>", [("a.b[0].c", "1"), ("a.b[1].c", "2")]),
+    (b'<n:a xmlns:n="urn:x"><n:b n:k="v">1</n:b></n:a>', [("a.b", "1 (k=v)")]),
+    (b"<p>Hello <b>bold</b> and <i>it</i>.</p>", [("p", "Hello"), ("p.b", "bold"), ("p.#text", "and"), ("p.i", "it"), ("p.#text", ".")]),
+    (b"<a><p>x<b>y</b>z</p>after</a>", [("a.p[0]", "x"), ("a.p[0].b", "y"), ("a.p[0].#text", "z"), ("a.#text", "after")]),
+    (b"<a>\n  <b>1</b>\n  <c/>\n</a>", [("a.b", "1")]),
+])
+def test_xml_records(contents, expected):
+    assert list(xml_records(contents)) == expected
+
+
+@pytest.mark.parametrize("contents, expected", [
+    (b"a: 1\nb:\n  c: x\n", [("a", "1"), ("b.c", "x")]),
+    (b"items:\n  - name: a\n  - name: b\n    tags: [x, y]\n",
+     [("items[0].name", "a"), ("items[1].name", "b"), ("items[1].tags[0]", "x"), ("items[1].tags[1]", "y")]),
+    (b"base: &b {k: 1}\nref: *b\n", [("base.k", "1"), ("ref", "*b")]),
+    (b"? [x, y]\n: z\n", [('["?"][0]', "x"), ('["?"][1]', "y"), ('["?"]', "z")]),
+    (b"text: |\n  line one\n  line two\n", [("text", "line one\nline two\n")]),
+    # Every document of a stream is read with paths relative to its own root
+    (b"---\nkind: A\n---\nkind: B\nspec: {n: 2}\n", [("kind", "A"), ("kind", "B"), ("spec.n", "2")]),
+    (b"a: 1\n---\n- x\n", [("a", "1"), ("[0]", "x")]),
+])
+def test_yaml_records(contents, expected):
+    assert list(yaml_records(contents)) == expected
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_xml_elements_are_freed_while_streaming():
+    contents = b"<root>" + b"".join(b"<item><v>%d</v></item>tail" % i for i in range(10000)) + b"</root>"
+
+    def stream():
+        assert sum(1 for _ in xml_records(contents)) == 20000
+
+    # Streaming holds about one input buffer of elements, never the whole tree
+    assert peak_memory(stream) < peak_memory(lambda: ET.fromstring(contents)) / 4
+
+
+@pytest.mark.parametrize("records, chunk_words, expected", [
+    ([("a", "one two"), ("b", "three")], 10, ["a: one two\nb: three"]),
+    ([("a", "one two"), ("b", "three four")], 4, ["a: one two", "b: three four"]),
+    ([("a", "w1 w2 w3 w4 w5")], 3, ["a: w1 w2", "a: w3 w4", "a: w5"]),
+    ([("a", "  spaced\n\tout  "), ("b", "   "), ("", "bare")], 10, ["a: spaced out\nbare"]),
+])
+def test_pack_records(records, chunk_words, expected):
+    assert list(pack_records(records, chunk_words)) == expected
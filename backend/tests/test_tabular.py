@@ -0,0 +1,82 @@
+import io
+
+import pytest
+
+from ingestion.pipeline import _with_text_fallback, process_file
+from ingestion.tabular import iter_table_chunks
+from retrieval.chunk_store import get_chunk_texts
+
+
+def chunks(contents, filename, chunk_words=300):
+    return list(iter_table_chunks(contents, filename, chunk_words))
+
+
+def xlsx(sheets):
+    import openpyxl
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for title, rows in sheets.items():
+        sheet = workbook.create_sheet(title)
+        for row in rows:
+            sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def test_every_block_repeats_the_header():
+    contents = b"sku,name,price\n" + b"".join(b"A%d,widget number %d,%d\n" % (i, i, i) for i in range(1, 41))
+    blocks = chunks(contents, "prices.csv", chunk_words=40)
+    assert len(blocks) > 1
+    assert all(block.startswith("Columns: sku | name | price\n") for block in blocks)
+    rows = [line for block in blocks for line in block.split("\n")[1:]]
+    # No row is split or lost, and rows keep their line numbers (the header is row 1)
+    assert rows == [f"Row {i + 1}: A{i} | widget number {i} | {i}" for i in range(1, 41)]
+
+
+def test_empty_rows_are_skipped_and_the_first_non_empty_row_is_the_header():
+    contents = b",,\n\nid,city\n1,Oslo\n,\n , \n2,Lima\n"
+    assert chunks(contents, "cities.csv") == ["Columns: id | city\nRow 4: 1 | Oslo\nRow 7: 2 | Lima"]
+
+
+@pytest.mark.parametrize("contents, filename, expected", [
+    (b"a;b;c\n1;2;3\n4;5;6\n", "semi.csv", "Columns: a | b | c\nRow 2: 1 | 2 | 3\nRow 3: 4 | 5 | 6"),
+    (b"a|b\n1|2\n", "pipes.csv", "Columns: a | b\nRow 2: 1 | 2"),
+    (b"a\tb\n1\t2\n", "tabs.csv", "Columns: a | b\nRow 2: 1 | 2"),
+    # .tsv is always tab-separated, commas are part of the values
+    (b"name\tnote\nx\thello, world\n", "notes.tsv", "Columns: name | note\nRow 2: x | hello, world"),
+    (b'q,a\n"multi\nline",yes\n', "quoted.csv", "Columns: q | a\nRow 2: multi\nline | yes"),
+    ("ä,ö\n1,2\n".encode("cp1252"), "latin.csv", "Columns: ä | ö\nRow 2: 1 | 2"),
+])
+def test_delimiters_and_encodings(contents, filename, expected):
+    assert chunks(contents, filename) == [expected]
+
+
+def test_fields_longer_than_the_csv_default_limit_parse():
+    long_value = "word " * 40000
+    contents = b'id,text\n1,"' + long_value.encode() + b'"\n'
+    [block] = chunks(contents, "long.csv")
+    assert block.startswith("Columns: id | text\nRow 2: 1 | word word")
+
+
+def test_header_only_table_indexes_the_column_names():
+    assert chunks(b"id,name\n", "empty.csv") == ["Columns: id | name"]
+
+
+def test_excel_sheets_are_titled():
+    contents = xlsx({"Q1": [["region", "sales"], ["north", 10]], "Q2": [["region", "sales"], [None, None], ["south", 20]]})
+    assert chunks(contents, "sales.xlsx") == [
+        "Sheet: Q1\nColumns: region | sales\nRow 2: north | 10",
+        "Sheet: Q2\nColumns: region | sales\nRow 3: south | 20",
+    ]
+
+
+def test_corrupt_workbook_falls_back_to_text():
+    contents = b"quarterly numbers that are not a workbook"
+    assert list(_with_text_fallback(iter_table_chunks(contents, "broken.xlsx"), contents, "broken.xlsx")) == [contents.decode()]
+
+
+def test_process_file_indexes_an_unparseable_table_as_text(env):
+    user_id, _ = env.create_user("tabular@test")
+    assert process_file(b"plain text pretending to be a spreadsheet", "broken.xlsx", user_id, notify=False) == 1
+    assert get_chunk_texts([f"{user_id}_broken.xlsx_0"]) == {f"{user_id}_broken.xlsx_0": "plain text pretending to be a spreadsheet"}
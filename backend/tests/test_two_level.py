@@ -0,0 +1,74 @@
+import datetime
+
+import pytest
+
+import query.handler as handler
+import retrieval.two_level as two_level
+from db import models
+from embedding.base import get_embedding_provider
+from ingestion.pipeline import process_file
+from retrieval.scope import build_scope
+from retrieval.two_level import select_documents
+from vectorstore.base import get_vector_store
+
+OLD = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+NEW = datetime.datetime(2024, 6, 1, tzinfo=datetime.timezone.utc)
+
+
+def upload(user_id, filename, body, uploaded_at):
+    models.save_file_metadata(user_id, filename, uploaded_at)
+    process_file(body.encode("utf-8"), filename, user_id, notify=False, uploaded_at=uploaded_at)
+
+
+@pytest.fixture
+def corpus(env):
+    """Three old files that match the question best, one newer file that matches it less."""
+    user_id, _ = env.create_user("two-level@test")
+    for i in range(3):
+        upload(user_id, f"old{i}.txt", "apple banana orchard harvest " * 40, OLD)
+    upload(user_id, "new.txt", "apple cherry grape vineyard " * 40, NEW)
+    upload(user_id, "new.md", "apple banana orchard notes " * 40, NEW)
+    return user_id
+
+
+def embed(text):
+    return get_embedding_provider().embed_query(text)
+
+
+def own_selection(user_id, scope, limit=2):
+    selection = select_documents(user_id, [embed("apple banana orchard harvest")], {}, scope, limit=limit, strategy="two_level")
+    return sorted(selection[0])
+
+
+def test_unscoped_selection_takes_the_best_documents(corpus):
+    assert set(own_selection(corpus, None)) <= {"old0.txt", "old1.txt", "old2.txt", "new.md"}
+
+
+@pytest.mark.parametrize("scope, expected", [
+    (build_scope(uploaded_after=datetime.datetime(2023, 1, 1)), ["new.md", "new.txt"]),
+    (build_scope(uploaded_before=datetime.datetime(2021, 1, 1)), ["old0.txt", "old1.txt", "old2.txt"]),
+    (build_scope(uploaded_after=datetime.datetime(2023, 1, 1), extensions=["txt"]), ["new.txt"]),
+    (build_scope(files=["old1.txt", "new.txt"]), ["new.txt", "old1.txt"]),
+    (build_scope(extensions=[".md"]), ["new.md"]),
+    (build_scope(uploaded_after=datetime.datetime(2030, 1, 1)), []),
+])
+def test_scoped_selection_only_picks_documents_in_scope(corpus, scope, expected):
+    assert own_selection(corpus, scope, limit=5) == expected
+
+
+def test_date_scope_is_applied_before_the_top_documents_are_taken(corpus):
+    # The old files score higher, but a limit of 2 must still be filled from inside the dates
+    scope = build_scope(uploaded_after=datetime.datetime(2023, 1, 1))
+    assert own_selection(corpus, scope, limit=2) == ["new.md", "new.txt"]
+
+
+def test_date_scoped_query_finds_in_range_chunks(corpus, monkeypatch):
+    monkeypatch.setattr(two_level, "RETRIEVAL_STRATEGY", "two_level")
+    monkeypatch.setattr(two_level, "TWO_LEVEL_DOCUMENTS", 1)
+    # Vector search only: BM25 is corpus-wide and would find the in-range file without document selection
+    monkeypatch.setattr(handler, "RETRIEVAL_MODE", "vector")
+    question = "apple banana orchard harvest"
+    scope = build_scope(uploaded_after=datetime.datetime(2023, 1, 1), extensions=["txt"])
+    matches = handler.retrieve_multi(corpus, [question], [embed(question)], get_vector_store(), scope=scope)
+    assert matches
+    assert {match["metadata"]["filename"] for match in matches} == {"new.txt"}
@@ -0,0 +1,36 @@
+import pytest
+
+import api.upload as upload
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Notifications and conversation messages the upload endpoints send."""
+    messages = {"notifications": [], "conversation": []}
+    monkeypatch.setattr(upload, "send_notification", lambda user_id, message: messages["notifications"].append(message))
+    monkeypatch.setattr(upload, "add_message_objects_to_conversation", lambda chat_id, items: messages["conversation"].extend(items))
+    return messages
+
+
+def test_bulk_upload_counts_files_without_content_as_failed(env, sent):
+    from fastapi.testclient import TestClient
+
+    _, token = env.create_user("bulk@test")
+    files = [
+        ("files", ("notes.txt", b"meeting notes about the quarterly budget " * 20, "text/plain")),
+        ("files", ("blank.txt", b"   \n\n   ", "text/plain")),
+        ("files", ("summary.md", b"# Summary\n\nThe budget was approved.", "text/markdown")),
+    ]
+    response = TestClient(env.app).post(
+        "/upload/bulk", files=files, data={"conversation_id": "chat-1"}, headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    assert len(response.json()["accepted"]) == 3
+
+    # The background job runs once the response is sent
+    assert sent["notifications"] == ["Your bulk upload has been processed: 2 of 3 files are ready for queries. 1 failed."]
+    card = sent["conversation"][-1]
+    assert card["metadata"]["status"] == "partial"
+    assert card["metadata"]["failed"] == [{"filename": "blank.txt", "error": "No content could be extracted"}]
+    assert "**2** of **3** files" in card["text"]
+    assert "- blank.txt: No content could be extracted" in card["text"]
@@ -0,0 +1,120 @@
+import pytest
+from google.api_core import exceptions as google_errors
+
+from upstream.breaker import CLOSED, OPEN
+from upstream.client import UPSTREAM_FAILURE_THRESHOLD, Upstream, UpstreamOverloaded, is_overload, is_upstream_fault
+
+
+class StatusError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+
+
+class Response:
+    status_code = 502
+
+
+class HTTPStatusError(Exception):
+    response = Response()
+
+
+class ServiceUnavailable(Exception):
+    pass
+
+
+@pytest.mark.parametrize("error, fault", [
+    (ConnectionError("reset"), True),
+    (TimeoutError(), True),
+    (StatusError(500), True),
+    (StatusError(429), True),
+    (HTTPStatusError("bad gateway"), True),
+    (ServiceUnavailable("try later"), True),
+    (RuntimeError("502 Bad Gateway"), True),
+    (StatusError(400), False),
+    (StatusError(404), False),
+    (ValueError("Vector dimension 384 does not match the dimension of the index 768"), False),
+    (KeyError("values"), False),
+])
+def test_is_upstream_fault(error, fault):
+    assert is_upstream_fault(error) == fault
+
+
+@pytest.mark.parametrize("error, overload", [
+    (google_errors.ResourceExhausted("Quota exceeded for requests per minute"), True),
+    (google_errors.TooManyRequests("slow down"), True),
+    (google_errors.ServiceUnavailable("try later"), True),
+    (google_errors.DeadlineExceeded("deadline"), True),
+    (TimeoutError(), True),
+    (UpstreamOverloaded("test", "no capacity"), True),
+    (StatusError(429), True),
+    (StatusError(503), True),
+    (StatusError(504), True),
+    (StatusError(500), False),
+    # Rejected requests whose message happens to mention a quota, a timeout or a status
+    (google_errors.InvalidArgument("request timeout must be at most 600s"), False),
+    (google_errors.PermissionDenied("quota project is not set"), False),
+    (google_errors.InternalServerError("deadline"), False),
+    (ValueError("timeout must be positive"), False),
+    (KeyError("quota"), False),
+    # Untyped errors only have their text to go on
+    (RuntimeError("429 Too Many Requests"), True),
+    (Exception("Deadline exceeded while embedding"), True),
+    (RuntimeError("something else went wrong"), False),
+])
+def test_is_overload(error, overload):
+    assert is_overload(error) == overload
+
+
+def fail_with(error):
+    def fn():
+        raise error
+    return fn
+
+
+def test_client_errors_do_not_open_the_breaker():
+    upstream = Upstream("test")
+    for _ in range(UPSTREAM_FAILURE_THRESHOLD * 2):
+        with pytest.raises(ValueError):
+            upstream.call(fail_with(ValueError("dimension mismatch")))
+    assert upstream.breaker.state == CLOSED
+    assert upstream.limiter.in_flight == 0
+
+
+def test_faults_open_the_breaker():
+    upstream = Upstream("test")
+    for _ in range(UPSTREAM_FAILURE_THRESHOLD):
+        with pytest.raises(StatusError):
+            upstream.call(fail_with(StatusError(500)))
+    assert upstream.breaker.state == OPEN
+    assert upstream.limiter.in_flight == 0
+
+
+def test_client_error_resets_the_failure_count():
+    upstream = Upstream("test")
+    for _ in range(UPSTREAM_FAILURE_THRESHOLD - 1):
+        with pytest.raises(ConnectionError):
+            upstream.call(fail_with(ConnectionError()))
+    with pytest.raises(StatusError):
+        upstream.call(fail_with(StatusError(400)))
+    with pytest.raises(ConnectionError):
+        upstream.call(fail_with(ConnectionError()))
+    assert upstream.breaker.state == CLOSED
+
+
+def test_rejected_request_mentioning_a_quota_does_not_back_off():
+    upstream = Upstream("test")
+    limit = upstream.limiter.limit
+    for _ in range(UPSTREAM_FAILURE_THRESHOLD * 2):
+        with pytest.raises(google_errors.InvalidArgument):
+            upstream.call(fail_with(google_errors.InvalidArgument("quota project mismatch, timeout 30s")))
+    assert upstream.breaker.state == CLOSED
+    assert upstream.limiter.limit >= limit
+
+
+def test_quota_errors_back_off():
+    upstream = Upstream("test")
+    limit = upstream.limiter.limit
+    with pytest.raises(google_errors.ResourceExhausted):
+        upstream.call(fail_with(google_errors.ResourceExhausted("quota")))
+    assert upstream.limiter.limit < limit
@@ -0,0 +1 @@
+# Upstream package
\ No newline at end of file
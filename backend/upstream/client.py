@@ -0,0 +1,219 @@
+"""
+Shared protection for calls to Gemini and the vector store.
+
+Every call goes through an Upstream, which combines a circuit breaker
+(fail fast during an outage) with an AIMD concurrency limit (back off when
+the upstream signals overload) and records call latency. Only upstream
+faults (transport errors, timeouts, 5xx, overload) count against the
+breaker; a rejected request (4xx, validation) does not. Slots under the
+limit are handed out by a FairScheduler: chat traffic ahead of ingestion,
+round-robin across users. Vector queries can
+also be hedged: if the first attempt is slower than the recent p95, a
+second identical request is sent and whichever finishes first wins.
+
+    from upstream.client import get_upstream
+    embedding = get_upstream("gemini_embedding").call(embed_model.get_query_embedding, text)
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from monitoring.metrics import counter
+from upstream.breaker import CircuitBreaker
+from upstream.limiter import AIMDLimiter, FAILURE, OVERLOAD, SUCCESS
+from upstream.scheduler import FairScheduler, INTERACTIVE
+
+# Consecutive failures that open a breaker, and how long it stays open (seconds)
+UPSTREAM_FAILURE_THRESHOLD = int(os.getenv("UPSTREAM_FAILURE_THRESHOLD", "5"))
+UPSTREAM_RESET_SECONDS = float(os.getenv("UPSTREAM_RESET_SECONDS", "30"))
+# How long an interactive call may wait for a concurrency slot before it is shed
+UPSTREAM_MAX_WAIT_SECONDS = float(os.getenv("UPSTREAM_MAX_WAIT_SECONDS", "2"))
+# Hedge vector queries slower than the recent p95 (never sooner than this many ms)
+VECTOR_HEDGE_ENABLED = os.getenv("VECTOR_HEDGE_ENABLED", "true").lower() == "true"
+VECTOR_HEDGE_MIN_MS = float(os.getenv("VECTOR_HEDGE_MIN_MS", "20"))
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+
+# Starting, minimum and maximum concurrency per upstream
+UPSTREAM_LIMITS = {
+    "gemini_llm": (8, 1, 64),
+    "gemini_embedding": (16, 1, 128),
+    "vector_store": (32, 2, 256),
+}
+
+# SDK exception classes (matched by name, anywhere in the MRO) and HTTP statuses that mean "slow down" rather than "broken"
+_OVERLOAD_CLASSES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded", "GatewayTimeout", "RateLimitError", "APITimeoutError", "TimeoutException"}
+_OVERLOAD_STATUSES = {429, 503, 504}
+# Error text that means the same, consulted only for errors that carry nothing but a message
+_OVERLOAD_MARKERS = ("429", "resourceexhausted", "resource exhausted", "too many requests", "quota", "rate limit", "503", "timed out", "timeout", "deadline")
+# Exception types that wrappers raise with the SDK error flattened into the message
+_UNTYPED_ERRORS = (Exception, RuntimeError)
+# SDK exception classes (matched by name, anywhere in the MRO) and error text that mean the upstream itself failed
+_FAULT_CLASSES = {"TransportError", "ConnectError", "APIConnectionError", "ServerError", "InternalServerError", "ServiceUnavailable", "BadGateway", "GatewayTimeout"}
+_FAULT_MARKERS = ("internal server error", "bad gateway", "service unavailable", "gateway timeout", "connection reset", "connection refused", "connection aborted")
+
+UPSTREAM_REJECTIONS = counter("rag_upstream_rejections_total", "Calls rejected before reaching an upstream", ["upstream", "reason"])
+UPSTREAM_ERRORS = counter("rag_upstream_errors_total", "Upstream calls that raised", ["upstream", "kind"])
+UPSTREAM_HEDGES = counter("rag_upstream_hedges_total", "Hedged second requests sent", ["upstream"])
+
+
+class UpstreamError(Exception):
+    def __init__(self, upstream, message, retry_after=0.0):
+        super().__init__(f"{upstream}: {message}")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class UpstreamUnavailable(UpstreamError):
+    """The circuit breaker is open."""
+
+
+class UpstreamOverloaded(UpstreamError):
+    """No concurrency slot became free within the wait budget."""
+
+
+def _class_names(error):
+    return {cls.__name__ for cls in type(error).__mro__}
+
+
+def is_overload(error):
+    """
+    True if an exception means the upstream is overloaded or out of quota:
+    decided by its type, then by its HTTP status (429, 503, 504), and by its
+    text only when it is an untyped error without a status. A 4xx whose
+    message mentions a quota or a timeout is a rejected request, not overload.
+    """
+    if isinstance(error, (UpstreamOverloaded, TimeoutError)):
+        return True
+    if _OVERLOAD_CLASSES & _class_names(error):
+        return True
+    status = _status_code(error)
+    if status is not None:
+        return status in _OVERLOAD_STATUSES
+    if type(error) not in _UNTYPED_ERRORS:
+        return False
+    text = str(error).lower()
+    return any(marker in text for marker in _OVERLOAD_MARKERS)
+
+
+def _status_code(error):
+    """HTTP status carried by an SDK exception (status_code, status, code or response.status_code), if any."""
+    for holder in (error, getattr(error, "response", None)):
+        for attribute in ("status_code", "status", "code"):
+            value = getattr(holder, attribute, None)
+            # grpc's code() is a method returning an enum, not an HTTP status
+            if isinstance(value, int) and 100 <= value < 600:
+                return value
+    return None
+
+
+def is_upstream_fault(error):
+    """
+    True if an exception means the upstream failed: overload, timeout,
+    transport error or 5xx. Client errors (4xx, validation, a dimension
+    mismatch) mean the upstream answered and the request was bad.
+    """
+    if is_overload(error) or isinstance(error, (OSError, UpstreamError)):
+        return True
+    status = _status_code(error)
+    if status is not None:
+        return status >= 500
+    if _FAULT_CLASSES & _class_names(error):
+        return True
+    text = str(error).lower()
+    return any(marker in text for marker in _FAULT_MARKERS)
+
+
+_hedge_pool = ThreadPoolExecutor(max_workers=int(os.getenv("UPSTREAM_HEDGE_WORKERS", "32")), thread_name_prefix="hedge")
+
+
+class Upstream:
+    def __init__(self, name, initial=8, minimum=1, maximum=64):
+        self.name = name
+        self.breaker = CircuitBreaker(UPSTREAM_FAILURE_THRESHOLD, UPSTREAM_RESET_SECONDS)
+        self.limiter = AIMDLimiter(initial, minimum, maximum)
+        self.scheduler = FairScheduler(name, self.limiter)
+        self._latencies = deque(maxlen=256)
+        self._latency_lock = threading.Lock()
+
+    def call(self, fn, *args, max_wait=UPSTREAM_MAX_WAIT_SECONDS, priority=INTERACTIVE, user_id=None, **kwargs):
+        """
+        Run fn(*args, **kwargs) under the breaker and the concurrency limit.
+        priority ("interactive" or "bulk") and user_id decide queueing order for a slot.
+        """
+        if not self.breaker.allow():
+            UPSTREAM_REJECTIONS.inc(upstream=self.name, reason="circuit_open")
+            raise UpstreamUnavailable(self.name, "circuit open", self.breaker.retry_after())
+        if not self.scheduler.acquire(priority, user_id, max_wait):
+            self.breaker.cancel()
+            UPSTREAM_REJECTIONS.inc(upstream=self.name, reason="concurrency")
+            raise UpstreamOverloaded(self.name, f"no capacity within {max_wait}s", retry_after=1.0)
+
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if not is_upstream_fault(e):
+                # The upstream answered and rejected the request: a response, not a failure
+                self.scheduler.release(SUCCESS)
+                self.breaker.record_success()
+                UPSTREAM_ERRORS.inc(upstream=self.name, kind="client")
+                raise
+            overload = is_overload(e)
+            self.scheduler.release(OVERLOAD if overload else FAILURE)
+            self.breaker.record_failure()
+            UPSTREAM_ERRORS.inc(upstream=self.name, kind="overload" if overload else "error")
+            raise
+        self.scheduler.release(SUCCESS)
+        self.breaker.record_success()
+        with self._latency_lock:
+            self._latencies.append(time.perf_counter() - start)
+        return result
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None until enough latencies are known."""
+        with self._latency_lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        p = ordered[min(len(ordered) - 1, len(ordered) * HEDGE_PERCENTILE // 100)]
+        return max(p, VECTOR_HEDGE_MIN_MS / 1000)
+
+    def hedged(self, fn, *args, **kwargs):
+        """call(), plus a second identical request if the first is slower than usual. Only for idempotent calls."""
+        delay = self.hedge_delay() if VECTOR_HEDGE_ENABLED else None
+        if delay is None:
+            return self.call(fn, *args, **kwargs)
+
+        attempts = [_hedge_pool.submit(contextvars.copy_context().run, self.call, fn, *args, **kwargs)]
+        done, _ = wait(attempts, timeout=delay)
+        # Never hedge into an upstream that is already at its limit
+        if not done and self.limiter.has_capacity():
+            UPSTREAM_HEDGES.inc(upstream=self.name)
+            attempts.append(_hedge_pool.submit(contextvars.copy_context().run, self.call, fn, *args, **kwargs))
+
+        pending, error = set(attempts), None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for attempt in done:
+                try:
+                    return attempt.result()
+                except Exception as e:
+                    error = e
+        raise error
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+def get_upstream(name):
+    """Return the process-wide Upstream for a dependency name."""
+    with _upstreams_lock:
+        upstream = _upstreams.get(name)
+        if upstream is None:
+            upstream = _upstreams[name] = Upstream(name, *UPSTREAM_LIMITS.get(name, (8, 1, 64)))
+        return upstream
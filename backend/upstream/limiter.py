@@ -0,0 +1,63 @@
+"""
+Adaptive (AIMD) concurrency limit for one upstream dependency.
+
+Every successful call raises the limit by 1/limit (about +1 per round of
+calls); an overload signal (429, quota, timeout) halves it, at most once
+per cooldown so a burst of concurrent failures counts as one signal.
+Callers that cannot get a slot within their wait budget are shed instead
+of queueing behind a saturated upstream.
+"""
+import threading
+import time
+
+SUCCESS = "success"
+OVERLOAD = "overload"
+FAILURE = "failure"
+
+
+class AIMDLimiter:
+    def __init__(self, initial=8, minimum=1, maximum=64, backoff=0.5, cooldown=1.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        """Take a slot, waiting up to timeout seconds (None waits forever). Returns False if shed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def try_acquire(self):
+        """Take a slot only if one is free right now."""
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, outcome=SUCCESS):
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == SUCCESS:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            elif outcome == OVERLOAD:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._last_decrease = now
+            self._cond.notify_all()
+
+    def has_capacity(self):
+        with self._cond:
+            return self.in_flight < int(self.limit)
@@ -0,0 +1,108 @@
+"""
+Fair, prioritised admission to an upstream's concurrency slots.
+
+Callers queue by priority class ("interactive" for chat queries, "bulk"
+for ingestion) and by user. Whenever a slot is free the scheduler grants it:
+- across classes by stride scheduling, so each class with waiters gets
+  slots in proportion to its share (interactive 80% / bulk 20% by default;
+  a class with nobody waiting never holds slots back)
+- within a class round-robin across users, so one user's 50 MB upload
+  queues behind everyone else's next request instead of in front of it
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from monitoring.metrics import histogram
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+# Share of contended slots given to interactive work; bulk gets the rest
+SCHEDULER_INTERACTIVE_SHARE = float(os.getenv("SCHEDULER_INTERACTIVE_SHARE", "0.8"))
+
+SCHEDULER_WAIT_SECONDS = histogram(
+    "rag_scheduler_wait_seconds",
+    "Time spent queued for an upstream slot.",
+    ("upstream", "priority"),
+)
+
+
+class _Waiter:
+    __slots__ = ("user_id", "granted")
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.granted = False
+
+
+class FairScheduler:
+    def __init__(self, name, limiter, interactive_share=SCHEDULER_INTERACTIVE_SHARE):
+        self.name = name
+        self.limiter = limiter
+        self.shares = {INTERACTIVE: interactive_share, BULK: 1.0 - interactive_share}
+        # priority -> user_id -> deque of waiters; OrderedDict order is the round-robin order
+        self._queues = {priority: OrderedDict() for priority in self.shares}
+        self._passes = {priority: 0.0 for priority in self.shares}
+        self._cond = threading.Condition()
+
+    def _next_waiter(self):
+        ready = [priority for priority, users in self._queues.items() if users]
+        if not ready:
+            return None
+        priority = min(ready, key=lambda p: self._passes[p])
+        # Advance the chosen class; a class coming back from idle starts level with the others
+        floor = min(self._passes[p] for p in ready)
+        self._passes[priority] = max(self._passes[priority], floor) + 1.0 / max(self.shares[priority], 1e-6)
+        users = self._queues[priority]
+        user_id, waiters = next(iter(users.items()))
+        waiter = waiters.popleft()
+        if waiters:
+            users.move_to_end(user_id)
+        else:
+            del users[user_id]
+        return waiter
+
+    def _dispatch(self):
+        granted = False
+        while any(self._queues.values()) and self.limiter.try_acquire():
+            self._next_waiter().granted = True
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def acquire(self, priority=INTERACTIVE, user_id=None, timeout=None):
+        """Wait for a slot; returns False if none was granted within timeout seconds."""
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority {priority!r}")
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        waiter = _Waiter(user_id)
+        with self._cond:
+            self._queues[priority].setdefault(user_id, deque()).append(waiter)
+            self._dispatch()
+            while not waiter.granted:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._remove(priority, waiter)
+                    break
+                self._cond.wait(remaining)
+        SCHEDULER_WAIT_SECONDS.observe(time.monotonic() - start, upstream=self.name, priority=priority)
+        return waiter.granted
+
+    def _remove(self, priority, waiter):
+        waiters = self._queues[priority].get(waiter.user_id)
+        if waiters is not None:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._queues[priority][waiter.user_id]
+
+    def release(self, outcome):
+        self.limiter.release(outcome)
+        with self._cond:
+            self._dispatch()
+
+    def queued(self):
+        with self._cond:
+            return {priority: sum(len(w) for w in users.values()) for priority, users in self._queues.items()}
@@ -0,0 +1,80 @@
+"""
+Single-flight: concurrent calls with the same key share one execution.
+
+The first caller of a key (the leader) runs the function; callers that
+arrive with the same key while it is running wait for it and get the same
+result or exception instead of repeating the work. Nothing is cached: once
+the leader finishes, the next call with that key runs again.
+
+    embedding = flight.do(text, embed, text)                   # threads
+    answer = await flight.run(key, run_in_threadpool, fn, x)   # event loop
+
+run() is for endpoints: waiting callers only hold an await, not a thread,
+and the shared work finishes even if the leader's client disconnects.
+Used to collapse double-clicks and client retries of /query and identical
+query embeddings into one upstream call. Set COALESCING_ENABLED=false to
+run every call on its own.
+"""
+import asyncio
+import os
+import threading
+
+from monitoring.metrics import counter
+
+COALESCING_ENABLED = os.getenv("COALESCING_ENABLED", "true").lower() == "true"
+
+COALESCED = counter("rag_coalesced_requests_total", "Calls that waited for an identical in-flight call instead of running", ["kind"])
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, kind):
+        # Metric label for calls coalesced by this group
+        self.kind = kind
+        self._calls = {}
+        self._lock = threading.Lock()
+        # Coroutine runs by key; only touched from the event loop
+        self._tasks = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        if not COALESCING_ENABLED:
+            return fn(*args, **kwargs)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            COALESCED.inc(kind=self.kind)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def run(self, key, coroutine_fn, *args):
+        if not COALESCING_ENABLED:
+            return await coroutine_fn(*args)
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(coroutine_fn(*args))
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            COALESCED.inc(kind=self.kind)
+        # A cancelled caller (client gone) must not cancel the run the others are waiting for
+        return await asyncio.shield(task)
@@ -0,0 +1 @@
+# Vector store package
\ No newline at end of file
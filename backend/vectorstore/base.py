@@ -0,0 +1,101 @@
+"""
+Vector store interface shared by ingestion and querying.
+
+Every operation is scoped to one user. Vectors are dicts of the form
+{"id": str, "values": list[float], "metadata": dict}; query results are
+dicts of the form {"id": str, "score": float, "metadata": dict}.
+
+Filters are Pinecone-style metadata conditions, e.g.
+{"filename": "report.pdf"} or {"filename": {"$in": ["a.txt", "b.txt"]}}.
+The backend is chosen with the VECTOR_STORE_BACKEND environment variable.
+"""
+import os
+import threading
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# "pinecone" (default) or "local"
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone").lower()
+
+
+class VectorStore:
+    def upsert(self, user_id, vectors):
+        raise NotImplementedError
+
+    def query(self, user_id, embedding, top_k=5, filters=None):
+        raise NotImplementedError
+
+    def fetch(self, user_id, ids):
+        """Return {id: metadata} for the ids that exist."""
+        raise NotImplementedError
+
+    def list_ids(self, user_id, prefix):
+        """Return the ids of a user's vectors that start with prefix."""
+        raise NotImplementedError
+
+    def delete(self, user_id, ids):
+        raise NotImplementedError
+
+    def delete_user(self, user_id):
+        raise NotImplementedError
+
+
+def matches_filter(metadata, condition):
+    """Evaluate a Pinecone-style metadata filter against one vector's metadata."""
+    if not condition:
+        return True
+    for key, expected in condition.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in expected):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in expected):
+                return False
+            continue
+        value = metadata.get(key)
+        if not isinstance(expected, dict):
+            expected = {"$eq": expected}
+        for op, operand in expected.items():
+            if op == "$eq" and value != operand:
+                return False
+            if op == "$ne" and value == operand:
+                return False
+            if op == "$in" and value not in operand:
+                return False
+            if op == "$nin" and value in operand:
+                return False
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                if op == "$gt" and not value > operand:
+                    return False
+                if op == "$gte" and not value >= operand:
+                    return False
+                if op == "$lt" and not value < operand:
+                    return False
+                if op == "$lte" and not value <= operand:
+                    return False
+    return True
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_vector_store():
+    """Return the process-wide vector store for the configured backend."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if VECTOR_STORE_BACKEND == "local":
+                    from vectorstore.local_store import LocalVectorStore
+                    _store = LocalVectorStore()
+                elif VECTOR_STORE_BACKEND == "pinecone":
+                    from vectorstore.pinecone_store import PineconeStore
+                    _store = PineconeStore()
+                else:
+                    raise ValueError(f"Unknown VECTOR_STORE_BACKEND: {VECTOR_STORE_BACKEND}")
+    return _store
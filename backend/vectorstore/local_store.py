@@ -0,0 +1,519 @@
+"""
+Embedded on-disk vector store, an alternative to Pinecone that avoids a
+network round-trip per retrieval.
+
+Each user gets a directory under LOCAL_VECTOR_DIR holding:
+- vectors.f32: append-only matrix of L2-normalised rows, memory-mapped
+               (vectors.f16 / vectors.i8 + scales.f32 when LOCAL_VECTOR_DTYPE
+               is float16 / int8, see vectorstore.quantization)
+- meta.json:   vector ids, metadata and tombstones for deleted rows (a snapshot)
+- meta.log:    changes since the snapshot, one JSON line per upsert / delete
+- ivf.npz:     IVF index (k-means centroids and row assignments)
+
+Small collections are searched exactly; once a user has IVF_MIN_VECTORS
+rows an IVF index is trained and queries probe the LOCAL_VECTOR_NPROBE
+nearest lists. Re-upserting an id tombstones the old row and appends a new
+one; tombstoned rows are compacted away once they pass 25% of the file.
+
+The files are not shared safely between processes, so run a single worker
+per LOCAL_VECTOR_DIR when this backend is selected.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from vectorstore.base import VectorStore, matches_filter
+from vectorstore.quantization import DTYPES, FILE_SUFFIXES, QuantizedMatrix, check_dtype, encode
+
+LOCAL_VECTOR_DIR = os.getenv(
+    "LOCAL_VECTOR_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "vector_data"),
+)
+# IVF lists probed per query; higher is slower but closer to exact
+LOCAL_VECTOR_NPROBE = int(os.getenv("LOCAL_VECTOR_NPROBE", "16"))
+# Below this many rows an exact scan is faster than an IVF probe
+IVF_MIN_VECTORS = int(os.getenv("LOCAL_VECTOR_IVF_MIN", "4096"))
+# Filters matching at most this many rows are answered by an exact scan of just those rows
+EXACT_FILTER_MAX_ROWS = IVF_MIN_VECTORS * 4
+# Storage format for new collections: float32, float16 or int8 (existing collections keep theirs)
+LOCAL_VECTOR_DTYPE = check_dtype(os.getenv("LOCAL_VECTOR_DTYPE", "float32").lower())
+KMEANS_ITERATIONS = 10
+COMPACT_DEAD_FRACTION = 0.25
+
+
+def _normalise(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def train_ivf(data, nlist, iterations=KMEANS_ITERATIONS, seed=0):
+    """Spherical k-means over (a sample of) normalised rows. Returns centroids."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(data), nlist * 64)
+    sample = np.asarray(data[np.sort(rng.choice(len(data), sample_size, replace=False))])
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        counts = np.bincount(assignment, minlength=nlist)
+        filled = counts > 0
+        centroids[filled] = _normalise(sums[filled])
+    return centroids
+
+
+def assign_ivf(matrix, centroids, batch_size=65536):
+    assignment = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), batch_size):
+        block = np.asarray(matrix[start:start + batch_size])
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+
+class UserCollection:
+    def __init__(self, directory, dtype=LOCAL_VECTOR_DTYPE):
+        self.directory = directory
+        self.dtype = check_dtype(dtype)
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.log_path = os.path.join(directory, "meta.log")
+        self.ivf_path = os.path.join(directory, "ivf.npz")
+        self.lock = threading.RLock()
+        self.dim = None
+        self.ids = []
+        self.metadata = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.positions = {}
+        self.centroids = None
+        self.assignment = None
+        self.trained_size = 0
+        # Snapshot version (log entries and ivf.npz belong to one) and data file generation
+        self.version = 0
+        self.generation = 0
+        self._log_rows = 0
+        self._lists = None
+        # Rows [_listed:] were assigned after the lists were last built
+        self._listed = 0
+        self._matrix = None
+        # metadata key -> {value: rows}, built lazily for equality filters
+        self._key_indexes = {}
+        self._load()
+
+    # ---- persistence -------------------------------------------------
+    #
+    # meta.json is a snapshot; every later upsert / delete appends one line to
+    # meta.log (tagged with the snapshot version, so lines left over from before
+    # a snapshot are ignored) instead of rewriting it. Vector rows are appended
+    # before their log line, and loading truncates the data files to the rows
+    # the metadata accounts for, so a crash in between leaves no orphan rows.
+    # Compaction writes the next generation of data files and switches to them
+    # with the snapshot.
+
+    def _data_paths(self, generation):
+        suffix = FILE_SUFFIXES[self.dtype]
+        if generation == 0:
+            return os.path.join(self.directory, f"vectors.{suffix}"), os.path.join(self.directory, "scales.f32")
+        return (os.path.join(self.directory, f"vectors.{generation}.{suffix}"),
+                os.path.join(self.directory, f"scales.{generation}.f32"))
+
+    def _load(self):
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.dim = data["dim"]
+            # Collections written before quantization support are float32
+            self.dtype = data.get("dtype", "float32")
+            self.ids = data["ids"]
+            self.metadata = data["metadata"]
+            self.alive = np.ones(len(self.ids), dtype=bool)
+            if data.get("deleted"):
+                self.alive[np.asarray(data["deleted"], dtype=np.int64)] = False
+            self.trained_size = data.get("trained_size", 0)
+            self.version = data.get("version", 0)
+            self.generation = data.get("generation", 0)
+        self.positions = {vector_id: i for i, vector_id in enumerate(self.ids) if self.alive[i]}
+        self.vectors_path, self.scales_path = self._data_paths(self.generation)
+        self._replay_log()
+        self._truncate_data()
+        if os.path.exists(self.ivf_path):
+            with np.load(self.ivf_path) as ivf:
+                version = int(ivf["version"]) if "version" in ivf.files else 0
+                if version == self.version and len(ivf["assignment"]) <= len(self.ids):
+                    self.centroids = ivf["centroids"]
+                    self.assignment = ivf["assignment"]
+        self._remap()
+        if self.centroids is not None:
+            # Rows logged after the snapshot are assigned here
+            missing = self._matrix[np.arange(len(self.assignment), len(self.ids))]
+            self.assignment = np.concatenate([self.assignment, assign_ivf(missing, self.centroids)])
+            self._build_lists()
+        elif self.trained_size:
+            # The IVF index belongs to another snapshot (a crash between writing the two): rebuild it
+            self.trained_size = 0
+            self._maintain()
+        self._remove_stale_files()
+
+    def _replay_log(self):
+        if not os.path.exists(self.log_path):
+            return
+        good = 0
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash, and nothing valid after it
+                    break
+                good += len(line)
+                if entry.get("v") != self.version:
+                    continue
+                if "add" in entry:
+                    self._add_rows([item[0] for item in entry["add"]], [item[1] for item in entry["add"]])
+                else:
+                    self._remove_ids(entry["delete"])
+                self._log_rows += len(entry.get("add") or entry.get("delete"))
+        if good < os.path.getsize(self.log_path):
+            with open(self.log_path, "r+b") as f:
+                f.truncate(good)
+
+    def _truncate_data(self):
+        if not self.dim:
+            return
+        rows = len(self.ids)
+        files = [(self.vectors_path, self.dim * np.dtype(DTYPES[self.dtype]).itemsize)]
+        if self.dtype == "int8":
+            files.append((self.scales_path, 4))
+        for path, row_bytes in files:
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size > rows * row_bytes:
+                logging.warning(f"[VECTORS] Dropping {size // row_bytes - rows} unrecorded rows from {path}")
+                with open(path, "r+b") as f:
+                    f.truncate(rows * row_bytes)
+            elif size < rows * row_bytes:
+                # Metadata for rows whose vectors never reached the disk
+                rows = size // row_bytes
+                logging.warning(f"[VECTORS] {path} holds only {rows} of {len(self.ids)} recorded rows")
+                for vector_id in self.ids[rows:]:
+                    self.positions.pop(vector_id, None)
+                self.ids, self.metadata, self.alive = self.ids[:rows], self.metadata[:rows], self.alive[:rows]
+                self.positions = {vector_id: i for i, vector_id in enumerate(self.ids) if self.alive[i]}
+
+    def _remove_stale_files(self):
+        if not os.path.isdir(self.directory):
+            return
+        current = {os.path.basename(self.vectors_path), os.path.basename(self.scales_path)}
+        for name in os.listdir(self.directory):
+            if name.startswith(("vectors.", "scales.")) and name not in current:
+                os.remove(os.path.join(self.directory, name))
+
+    def _snapshot(self):
+        """Write meta.json (and ivf.npz) in full and start a new, empty log."""
+        os.makedirs(self.directory, exist_ok=True)
+        self.version += 1
+        if self.centroids is not None:
+            tmp_path = self.ivf_path + ".tmp.npz"
+            np.savez(tmp_path, centroids=self.centroids, assignment=self.assignment, version=self.version)
+            os.replace(tmp_path, self.ivf_path)
+        elif os.path.exists(self.ivf_path):
+            os.remove(self.ivf_path)
+        data = {
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "ids": self.ids,
+            "metadata": self.metadata,
+            "deleted": np.nonzero(~self.alive)[0].tolist(),
+            "trained_size": self.trained_size,
+            "version": self.version,
+            "generation": self.generation,
+        }
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            # json.dumps uses the C encoder; json.dump to a file does not
+            f.write(json.dumps(data))
+        os.replace(tmp_path, self.meta_path)
+        # Entries still in the log carry the old version and are ignored from now on
+        open(self.log_path, "w").close()
+        self._log_rows = 0
+
+    def _log(self, entry, rows):
+        """Append one change to meta.log, or snapshot once the log outgrows the collection."""
+        self._log_rows += rows
+        # A new collection starts with a snapshot, so the log never has to carry dim and dtype
+        if self._log_rows > max(IVF_MIN_VECTORS, len(self.ids)) or not os.path.exists(self.meta_path):
+            self._snapshot()
+            return
+        entry["v"] = self.version
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def _remap(self):
+        self._key_indexes = {}
+        rows = len(self.ids)
+        if rows and self.dim:
+            codes = np.memmap(self.vectors_path, dtype=DTYPES[self.dtype], mode="r", shape=(rows, self.dim))
+            scales = np.memmap(self.scales_path, dtype=np.float32, mode="r", shape=(rows,)) if self.dtype == "int8" else None
+        else:
+            codes = np.zeros((0, self.dim or 0), dtype=DTYPES[self.dtype])
+            scales = np.zeros(0, dtype=np.float32) if self.dtype == "int8" else None
+        self._matrix = QuantizedMatrix(codes, scales)
+
+    # ---- index maintenance -------------------------------------------
+
+    def _add_rows(self, ids, metadata):
+        base = len(self.ids)
+        for vector_id in ids:
+            previous = self.positions.get(vector_id)
+            if previous is not None:
+                self.alive[previous] = False
+        for offset, vector_id in enumerate(ids):
+            self.positions[vector_id] = base + offset
+        self.ids.extend(ids)
+        self.metadata.extend(metadata)
+        self.alive = np.concatenate([self.alive, np.ones(len(ids), dtype=bool)])
+
+    def _remove_ids(self, ids):
+        removed = []
+        for vector_id in ids:
+            position = self.positions.pop(vector_id, None)
+            if position is not None:
+                self.alive[position] = False
+                removed.append(vector_id)
+        return removed
+
+    def _build_lists(self):
+        order = np.argsort(self.assignment, kind="stable")
+        counts = np.bincount(self.assignment, minlength=len(self.centroids))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        self._lists = (order, offsets)
+        self._listed = len(self.assignment)
+
+    def _train(self):
+        live_rows = np.nonzero(self.alive)[0]
+        nlist = int(np.clip(np.sqrt(len(live_rows)), 16, 1024))
+        self.centroids = train_ivf(self._matrix[live_rows], nlist)
+        self.assignment = assign_ivf(self._matrix, self.centroids)
+        self.trained_size = len(live_rows)
+        self._build_lists()
+        logging.info(f"[VECTORS] Trained IVF with {nlist} lists over {len(live_rows)} vectors in {self.directory}")
+
+    def _compact(self):
+        keep = np.nonzero(self.alive)[0]
+        old_paths = (self.vectors_path, self.scales_path)
+        vectors_path, scales_path = self._data_paths(self.generation + 1)
+        # Copy the stored codes as they are; re-encoding would compound int8 rounding
+        sources = [(self._matrix.codes, vectors_path)]
+        if self._matrix.scales is not None:
+            sources.append((self._matrix.scales, scales_path))
+        for array, path in sources:
+            with open(path, "wb") as f:
+                for start in range(0, len(keep), 65536):
+                    f.write(np.ascontiguousarray(array[keep[start:start + 65536]]).tobytes())
+        self._matrix = None
+        self.ids = [self.ids[i] for i in keep]
+        self.metadata = [self.metadata[i] for i in keep]
+        self.alive = np.ones(len(keep), dtype=bool)
+        self.positions = {vector_id: i for i, vector_id in enumerate(self.ids)}
+        if self.assignment is not None:
+            self.assignment = self.assignment[keep]
+            self._build_lists()
+        # The snapshot switches to the new files; until then a crash leaves the old ones in use
+        self.generation += 1
+        self.vectors_path, self.scales_path = vectors_path, scales_path
+        self._snapshot()
+        for path in old_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        self._remap()
+
+    def _maintain(self):
+        """Retrain or drop the IVF index and compact as needed. True if that wrote a snapshot."""
+        live = int(self.alive.sum())
+        changed = False
+        if live >= IVF_MIN_VECTORS and (self.centroids is None or live >= 2 * self.trained_size):
+            self._train()
+            changed = True
+        elif live < IVF_MIN_VECTORS and self.centroids is not None:
+            self.centroids = self.assignment = self._lists = None
+            self.trained_size = 0
+            changed = True
+        if len(self.ids) and (len(self.ids) - live) / len(self.ids) > COMPACT_DEAD_FRACTION:
+            self._compact()
+            return True
+        if changed:
+            self._snapshot()
+        return changed
+
+    # ---- operations --------------------------------------------------
+
+    def upsert(self, vectors):
+        if not vectors:
+            return
+        # The same id twice in one batch: the last one wins
+        latest = {vector["id"]: i for i, vector in enumerate(vectors)}
+        if len(latest) < len(vectors):
+            vectors = [vector for i, vector in enumerate(vectors) if latest[vector["id"]] == i]
+        rows = _normalise([vector["values"] for vector in vectors])
+        with self.lock:
+            if self.dim is None:
+                self.dim = rows.shape[1]
+            elif rows.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {rows.shape[1]} does not match collection dimension {self.dim}")
+            os.makedirs(self.directory, exist_ok=True)
+
+            codes, scales = encode(rows, self.dtype)
+            with open(self.vectors_path, "ab") as f:
+                f.write(codes.tobytes())
+            if scales is not None:
+                with open(self.scales_path, "ab") as f:
+                    f.write(scales.tobytes())
+            ids = [vector["id"] for vector in vectors]
+            metadata = [dict(vector.get("metadata", {})) for vector in vectors]
+            self._add_rows(ids, metadata)
+            if self.centroids is not None:
+                self.assignment = np.concatenate([self.assignment, np.argmax(rows @ self.centroids.T, axis=1).astype(np.int32)])
+                # New rows are scanned from the tail until it is worth re-sorting the lists
+                if len(self.assignment) - self._listed > max(IVF_MIN_VECTORS, len(self.assignment) // 4):
+                    self._build_lists()
+            self._remap()
+            if not self._maintain():
+                self._log({"add": [[vector_id, item] for vector_id, item in zip(ids, metadata)]}, len(ids))
+
+    def delete(self, ids):
+        with self.lock:
+            removed = self._remove_ids(ids)
+            if removed and not self._maintain():
+                self._log({"delete": removed}, len(removed))
+            return len(removed)
+
+    def _key_index(self, key):
+        index = self._key_indexes.get(key)
+        if index is None:
+            grouped = {}
+            for row, metadata in enumerate(self.metadata):
+                grouped.setdefault(metadata.get(key), []).append(row)
+            index = self._key_indexes[key] = {value: np.asarray(rows, dtype=np.int64) for value, rows in grouped.items()}
+        return index
+
+    def _indexed_rows(self, filters):
+        """
+        Rows matching a flat filter of equality / $in conditions, looked up
+        through per-key indexes. Returns None for filters it cannot answer.
+        """
+        rows = None
+        for key, condition in filters.items():
+            if key.startswith("$"):
+                return None
+            if not isinstance(condition, dict):
+                values = [condition]
+            elif set(condition) == {"$eq"}:
+                values = [condition["$eq"]]
+            elif set(condition) == {"$in"}:
+                values = list(condition["$in"])
+            else:
+                return None
+            index = self._key_index(key)
+            try:
+                parts = [index[value] for value in values if value in index]
+            except TypeError:
+                return None
+            matched = np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return rows[self.alive[rows]] if rows is not None else None
+
+    def fetch(self, ids):
+        with self.lock:
+            return {vector_id: dict(self.metadata[self.positions[vector_id]]) for vector_id in ids if vector_id in self.positions}
+
+    def list_ids(self, prefix):
+        with self.lock:
+            return [vector_id for vector_id in self.positions if vector_id.startswith(prefix)]
+
+    def _filtered(self, rows, filters):
+        rows = rows[self.alive[rows]]
+        if filters:
+            rows = np.fromiter((row for row in rows if matches_filter(self.metadata[row], filters)), dtype=np.int64)
+        return rows
+
+    def query(self, embedding, top_k=5, filters=None, nprobe=None, exact=False):
+        query = _normalise(embedding)
+        with self.lock:
+            if not self.ids:
+                return []
+            allowed = self._indexed_rows(filters) if filters else None
+            if allowed is not None and (exact or self.centroids is None or len(allowed) <= EXACT_FILTER_MAX_ROWS):
+                # Selective filter: scanning just the matching rows is exact and cheap
+                candidates = allowed
+            elif self.centroids is not None and not exact:
+                probe = np.argsort(-(self.centroids @ query))[:nprobe or LOCAL_VECTOR_NPROBE]
+                order, offsets = self._lists
+                candidates = np.concatenate([order[offsets[p]:offsets[p + 1]] for p in probe])
+                tail = self.assignment[self._listed:]
+                if len(tail):
+                    candidates = np.concatenate([candidates, np.nonzero(np.isin(tail, probe))[0] + self._listed])
+                if allowed is not None:
+                    candidates = candidates[np.isin(candidates, allowed)]
+                else:
+                    candidates = self._filtered(candidates, filters)
+                if filters and len(candidates) < top_k:
+                    # The probed lists hold too few matches; scan every matching row exactly
+                    candidates = allowed if allowed is not None else self._filtered(np.arange(len(self.ids)), filters)
+            else:
+                candidates = self._filtered(np.arange(len(self.ids)), filters)
+            if len(candidates) == 0:
+                return []
+            candidates = np.sort(candidates)
+            scores = self._matrix.dot(candidates, query)
+            k = min(top_k, len(candidates))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [
+                {"id": self.ids[candidates[i]], "score": float(scores[i]), "metadata": dict(self.metadata[candidates[i]])}
+                for i in best
+            ]
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+
+class LocalVectorStore(VectorStore):
+    def __init__(self, root=LOCAL_VECTOR_DIR):
+        self.root = root
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def collection(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            collection = self._collections.get(key)
+            if collection is None:
+                collection = self._collections[key] = UserCollection(os.path.join(self.root, key))
+            return collection
+
+    def upsert(self, user_id, vectors):
+        self.collection(user_id).upsert(vectors)
+
+    def query(self, user_id, embedding, top_k=5, filters=None):
+        return self.collection(user_id).query(embedding, top_k=top_k, filters=filters)
+
+    def fetch(self, user_id, ids):
+        return self.collection(user_id).fetch(ids)
+
+    def list_ids(self, user_id, prefix):
+        return self.collection(user_id).list_ids(prefix)
+
+    def delete(self, user_id, ids):
+        return self.collection(user_id).delete(ids)
+
+    def delete_user(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            collection = self._collections.pop(key, None)
+        if collection is not None:
+            with collection.lock:
+                collection._matrix = None
+        shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Re-home existing Pinecone vectors from one PINECONE_LAYOUT to another,
+e.g. from the legacy shared namespace into one namespace per user.
+
+Vector ids are "{user_id}_{filename}_{chunk}", so each user's vectors are
+found with a prefix listing (serverless indexes), fetched and upserted into
+the target namespace in batches, and optionally deleted from the source.
+Finished users are recorded in a checkpoint file so an interrupted run can
+be restarted safely.
+
+Run from the backend directory:
+    python -m vectorstore.migrate_namespaces --from shared --to namespace --delete-source
+"""
+import argparse
+import json
+import logging
+import os
+
+from vectorstore.pinecone_store import namespace_for
+
+# Pinecone fetch/upsert batch size
+MIGRATION_BATCH_SIZE = 100
+
+
+def migrate_user(index, user_id, source_layout, target_layout, delete_source=False, batch_size=MIGRATION_BATCH_SIZE):
+    """Move one user's vectors between layouts. Returns the number of vectors moved."""
+    source_ns = namespace_for(user_id, source_layout)
+    target_ns = namespace_for(user_id, target_layout)
+    if source_ns == target_ns:
+        return 0
+
+    ids = [vector_id for page in index.list(prefix=f"{user_id}_", namespace=source_ns) for vector_id in page]
+    moved = 0
+    for start in range(0, len(ids), batch_size):
+        fetched = index.fetch(ids=ids[start:start + batch_size], namespace=source_ns).vectors
+        vectors = [
+            {"id": vector.id, "values": list(vector.values), "metadata": dict(vector.metadata or {})}
+            for vector in fetched.values()
+            # Guard against another user's ids sharing the prefix
+            if float((vector.metadata or {}).get("user_id", user_id)) == float(user_id)
+        ]
+        if not vectors:
+            continue
+        index.upsert(vectors=vectors, namespace=target_ns)
+        if delete_source:
+            index.delete(ids=[vector["id"] for vector in vectors], namespace=source_ns)
+        moved += len(vectors)
+    return moved
+
+
+def migrate(index, user_ids, source_layout, target_layout, delete_source=False, checkpoint_path=None):
+    done = set()
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r") as f:
+            done = set(json.load(f))
+
+    total = 0
+    for user_id in user_ids:
+        if str(user_id) in done:
+            continue
+        moved = migrate_user(index, user_id, source_layout, target_layout, delete_source)
+        total += moved
+        logging.info(f"[MIGRATE] user {user_id}: moved {moved} vectors to '{namespace_for(user_id, target_layout)}'")
+        done.add(str(user_id))
+        if checkpoint_path:
+            with open(checkpoint_path, "w") as f:
+                json.dump(sorted(done), f)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from", dest="source", default="shared", choices=["shared", "sharded", "namespace"])
+    parser.add_argument("--to", dest="target", default="namespace", choices=["shared", "sharded", "namespace"])
+    parser.add_argument("--user-id", action="append", help="migrate only these users (default: all users in the database)")
+    parser.add_argument("--delete-source", action="store_true", help="delete vectors from the source namespace once copied")
+    parser.add_argument("--checkpoint", default="namespace_migration.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from ingestion.pipeline import get_pinecone_index
+    if args.user_id:
+        user_ids = args.user_id
+    else:
+        from db.models import get_all_user_ids
+        user_ids = get_all_user_ids()
+
+    total = migrate(get_pinecone_index(), user_ids, args.source, args.target, args.delete_source, args.checkpoint)
+    print(f"Moved {total} vectors for {len(user_ids)} users from '{args.source}' to '{args.target}' layout")
+
+
+if __name__ == "__main__":
+    main()
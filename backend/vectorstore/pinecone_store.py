@@ -0,0 +1,148 @@
+"""
+Pinecone-backed vector store.
+
+PINECONE_LAYOUT selects how users are placed in the index:
+- "shared" (default): every user in the default namespace, filtered by
+  user_id; this is where all existing data lives
+- "namespace": one namespace per user, so a query only touches that user's
+  vectors and deleting a user is a single namespace wipe
+- "sharded": users hashed into PINECONE_SHARDS namespaces, filtered by user_id
+
+Switching layout does not move data: first copy the vectors with
+vectorstore.migrate_namespaces (e.g. --from shared --to namespace), then
+restart with the new PINECONE_LAYOUT. Until then the new namespaces are
+empty and queries return nothing.
+
+Listing ids by prefix (Index.list) only exists on serverless indexes. On a
+pod-based index list_ids falls back to a filtered query, which sees at most
+QUERY_LIST_LIMIT ids, and delete_user deletes by metadata filter instead.
+"""
+import logging
+import os
+
+from vectorstore.base import VectorStore
+
+PINECONE_LAYOUT = os.getenv("PINECONE_LAYOUT", "shared").lower()
+PINECONE_SHARDS = int(os.getenv("PINECONE_SHARDS", "16"))
+
+# Pinecone accepts at most ~2MB per upsert request; 100 vectors stays well under
+UPSERT_BATCH_SIZE = 100
+DELETE_BATCH_SIZE = 1000
+# Largest top_k Pinecone serves without values/metadata: the cap of the query listing fallback
+QUERY_LIST_LIMIT = 10000
+
+
+def namespace_for(user_id, layout=PINECONE_LAYOUT):
+    if layout == "namespace":
+        return f"user-{user_id}"
+    if layout == "sharded":
+        return f"shard-{int(user_id) % PINECONE_SHARDS}"
+    if layout == "shared":
+        return ""
+    raise ValueError(f"Unknown PINECONE_LAYOUT: {layout}")
+
+
+class PineconeStore(VectorStore):
+    def __init__(self, index=None, layout=PINECONE_LAYOUT):
+        self._index = index
+        self.layout = layout
+        # Cleared once the index turns out to be pod-based (no Index.list)
+        self._listable = True
+
+    @property
+    def index(self):
+        if self._index is None:
+            from ingestion.pipeline import get_pinecone_index
+            self._index = get_pinecone_index()
+        return self._index
+
+    def _user_filter(self, user_id, filters=None):
+        if self.layout == "namespace":
+            # The namespace already isolates the user
+            return filters or None
+        # Pinecone stores numbers as floats, so match user_id as a float
+        condition = {"user_id": {"$eq": float(user_id)}}
+        if filters:
+            return {"$and": [condition, filters]}
+        return condition
+
+    def upsert(self, user_id, vectors):
+        namespace = namespace_for(user_id, self.layout)
+        for start in range(0, len(vectors), UPSERT_BATCH_SIZE):
+            self.index.upsert(vectors=vectors[start:start + UPSERT_BATCH_SIZE], namespace=namespace)
+
+    def query(self, user_id, embedding, top_k=5, filters=None):
+        response = self.index.query(
+            vector=list(embedding),
+            top_k=top_k,
+            filter=self._user_filter(user_id, filters),
+            namespace=namespace_for(user_id, self.layout),
+            include_metadata=True,
+        )
+        return [
+            {"id": match.id, "score": match.score, "metadata": dict(match.metadata or {})}
+            for match in response.matches
+        ]
+
+    def fetch(self, user_id, ids):
+        ids = list(ids)
+        namespace = namespace_for(user_id, self.layout)
+        found = {}
+        for start in range(0, len(ids), UPSERT_BATCH_SIZE):
+            response = self.index.fetch(ids=ids[start:start + UPSERT_BATCH_SIZE], namespace=namespace)
+            for vector_id, vector in response.vectors.items():
+                found[vector_id] = dict(vector.metadata or {})
+        return found
+
+    def _list(self, prefix, namespace):
+        """Ids starting with prefix via Index.list, or None when the index cannot list."""
+        if self._listable:
+            try:
+                return [vector_id for page in self.index.list(prefix=prefix, namespace=namespace) for vector_id in page]
+            except Exception as e:
+                # Old clients have no Index.list; pod-based indexes reject it with a 400
+                if not isinstance(e, AttributeError) and getattr(e, "status", None) != 400:
+                    raise
+                logging.warning(f"[PINECONE] Index.list unavailable ({e}); falling back to filtered queries")
+                self._listable = False
+        return None
+
+    def _query_ids(self, user_id, prefix, namespace):
+        # Any non-zero vector will do: with a filter and a large top_k only the ids matter
+        probe = [0.0] * self.index.describe_index_stats()["dimension"]
+        probe[0] = 1.0
+        response = self.index.query(
+            vector=probe,
+            top_k=QUERY_LIST_LIMIT,
+            filter=self._user_filter(user_id),
+            namespace=namespace,
+        )
+        if len(response.matches) >= QUERY_LIST_LIMIT:
+            logging.warning(f"[PINECONE] listing '{prefix}' hit the {QUERY_LIST_LIMIT} id query limit; the result may be incomplete")
+        return [match.id for match in response.matches if match.id.startswith(prefix)]
+
+    def list_ids(self, user_id, prefix):
+        namespace = namespace_for(user_id, self.layout)
+        ids = self._list(prefix, namespace)
+        if ids is None:
+            ids = self._query_ids(user_id, prefix, namespace)
+        return ids
+
+    def delete(self, user_id, ids):
+        ids = list(ids)
+        namespace = namespace_for(user_id, self.layout)
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            self.index.delete(ids=ids[start:start + DELETE_BATCH_SIZE], namespace=namespace)
+
+    def delete_user(self, user_id):
+        namespace = namespace_for(user_id, self.layout)
+        if self.layout == "namespace":
+            self.index.delete(delete_all=True, namespace=namespace)
+            return
+        # The namespace is shared with other users: drop this user's ids ("<user_id>_<filename>_<n>")
+        ids = self._list(f"{user_id}_", namespace)
+        if ids is None:
+            # Pod-based indexes cannot list but do delete by metadata filter
+            self.index.delete(filter=self._user_filter(user_id), namespace=namespace)
+        else:
+            self.delete(user_id, ids)
@@ -0,0 +1,100 @@
+"""
+Compact storage formats for embeddings.
+
+- "float32": 4 bytes per dimension, lossless
+- "float16": 2 bytes per dimension; rounding error is far below the score
+  gaps that decide a top-k for unit-length embeddings
+- "int8":    1 byte per dimension plus one float32 scale per vector
+             (symmetric scalar quantization, scale = max|x| / 127)
+
+QuantizedMatrix wraps the codes (and scales) so callers index it like a
+float32 matrix, and scores candidates without materialising float32 rows
+where the format allows it.
+"""
+import numpy as np
+
+DTYPES = {
+    "float32": np.float32,
+    "float16": np.float16,
+    "int8": np.int8,
+}
+# Rows widened to float32 at a time when scoring quantized formats
+SCORE_BLOCK_ROWS = 4096
+# File suffix used by on-disk stores for each format
+FILE_SUFFIXES = {"float32": "f32", "float16": "f16", "int8": "i8"}
+
+
+def check_dtype(dtype):
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown embedding dtype {dtype!r}; expected one of {', '.join(DTYPES)}")
+    return dtype
+
+
+def bytes_per_vector(dim, dtype):
+    """Storage cost of one vector, including its scale for int8."""
+    return dim * np.dtype(DTYPES[check_dtype(dtype)]).itemsize + (4 if dtype == "int8" else 0)
+
+
+def encode(matrix, dtype):
+    """Quantize a (n, dim) float matrix. Returns (codes, scales); scales is None except for int8."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if check_dtype(dtype) == "float32":
+        return matrix, None
+    if dtype == "float16":
+        return matrix.astype(np.float16), None
+    scales = np.abs(matrix).max(axis=-1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[..., None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def decode(codes, scales=None):
+    """Inverse of encode: back to float32."""
+    values = np.asarray(codes).astype(np.float32)
+    if scales is not None:
+        values *= np.asarray(scales, dtype=np.float32)[..., None]
+    return values
+
+
+class QuantizedMatrix:
+    """Read-only view over encoded rows that indexes like a float32 matrix."""
+
+    def __init__(self, codes, scales=None):
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def from_float(cls, matrix, dtype):
+        return cls(*encode(matrix, dtype))
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    def __getitem__(self, rows):
+        return decode(self.codes[rows], None if self.scales is None else self.scales[rows])
+
+    def dot(self, rows, query):
+        """Scores of the given rows against a float32 query vector."""
+        query = np.asarray(query, dtype=np.float32)
+        rows = np.asarray(rows)
+        if self.codes.dtype == np.float32:
+            return np.asarray(self.codes[rows]) @ query
+        # Widen block by block into one reused buffer so a full scan never holds a float32 copy
+        scores = np.empty(len(rows), dtype=np.float32)
+        buffer = np.empty((min(len(rows), SCORE_BLOCK_ROWS), self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+            block_rows = rows[start:start + SCORE_BLOCK_ROWS]
+            block = buffer[:len(block_rows)]
+            block[...] = self.codes[block_rows]
+            np.matmul(block, query, out=scores[start:start + len(block_rows)])
+        if self.scales is not None:
+            scores *= self.scales[rows]
+        return scores